@@ -0,0 +1,141 @@
+"""
+Benchmark the checker pipeline against synthetic trees, replaying upstreams
+
+    python -m bench.bench_pipeline --scales 10,100,1000 --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from .synthetic import generate
+
+
+def measure(func, *args, **kwargs):
+    """
+    Run func twice, timed without tracing, then again for its memory as
+    tracemalloc slows down every allocation
+    return: the result of the timed run, seconds taken, peak of traced
+    memory in bytes
+    """
+    start = time.perf_counter()
+    res = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return res, elapsed, peak
+
+
+def bench_scale(scale: int, latency: float, jitter: float) -> list[dict]:
+    """
+    Time every phase of the pipeline at one scale
+    """
+    from main import gen_report
+    from src.utils import gen_old
+    from src.run_nvchecker import load_all_configs, run_nvchecker
+    from src.version_cmp import filter_newer
+
+    with tempfile.TemporaryDirectory() as root:
+        conf_dir, matrix_dir, fixtures, matrix = generate(root, scale)
+        n = len(matrix.vinfos)
+        rows = []
+
+        def row(phase, elapsed, peak):
+            rows.append({
+                'scale': scale, 'phase': phase, 'entries': n,
+                'seconds': elapsed, 'entries_per_second': n / elapsed if elapsed else None,
+                'peak_bytes': peak,
+            })
+
+        _, t, m = measure(load_all_configs, conf_dir, matrix_dir, matrix)
+        row('load_all_configs', t, m)
+        old, t, m = measure(gen_old, matrix)
+        row('gen_old', t, m)
+        checked, t, m = measure(
+            run_nvchecker, conf_dir, matrix_dir, old, matrix=matrix,
+            replay=fixtures, replay_latency=latency, replay_jitter=jitter)
+        row('run_nvchecker', t, m)
+        new, _, skipped, manually_skipped, timed_out = checked
+        upd, t, m = measure(filter_newer, old, new)
+        row('filter_newer', t, m)
+        _, t, m = measure(gen_report, upd, skipped, manually_skipped, timed_out)
+        row('gen_report', t, m)
+
+        def pipeline():
+            old = gen_old(matrix)
+            new, _, skipped, manually_skipped, timed_out = run_nvchecker(
+                conf_dir, matrix_dir, old, matrix=matrix,
+                replay=fixtures, replay_latency=latency, replay_jitter=jitter)
+            upd = filter_newer(old, new)
+            return gen_report(upd, skipped, manually_skipped, timed_out)
+        _, t, m = measure(pipeline)
+        row('main', t, m)
+    return rows
+
+
+def compare(rows: list[dict], baseline: list[dict], max_regression: float) -> list[str]:
+    """
+    Phases which got slower than the baseline by more than max_regression
+    """
+    base = {(r['scale'], r['phase']): r for r in baseline}
+    res = []
+    for r in rows:
+        b = base.get((r['scale'], r['phase']))
+        if b and b['seconds'] and r['seconds'] > b['seconds'] * (1 + max_regression):
+            res.append(f"{r['phase']}@{r['scale']}x: {b['seconds']:.3f}s -> {r['seconds']:.3f}s")
+    return res
+
+
+def main():
+    """
+    Main function
+    """
+    arg = argparse.ArgumentParser()
+    arg.add_argument('--scales', default='10,100',
+                     help='comma separated multiples of the current tree size')
+    arg.add_argument('--latency', type=float, default=0.0,
+                     help='seconds of latency of the replayed upstreams')
+    arg.add_argument('--jitter', type=float, default=0.0,
+                     help='up to this many seconds of jitter of the replayed upstreams')
+    arg.add_argument('--json', help='write the results to this file')
+    arg.add_argument('--baseline', help='results of an earlier run to compare with')
+    arg.add_argument('--max-regression', type=float, default=0.2,
+                     help='allowed slowdown against the baseline, 0.2 for 20%%')
+    arg.add_argument('--report-only', action='store_true',
+                     help='print the regressions without failing')
+    args = arg.parse_args()
+
+    rows = []
+    for scale in (int(s) for s in args.scales.split(',')):
+        rows += bench_scale(scale, args.latency, args.jitter)
+
+    print(f"| {'Scale':>5} | {'Phase':<16} | {'Entries':>7} | {'Seconds':>8} | {'Entries/s':>10} | {'Peak MiB':>8} |")
+    print(f"| {'-' * 5} | {'-' * 16} | {'-' * 7} | {'-' * 8} | {'-' * 10} | {'-' * 8} |")
+    for r in rows:
+        eps = f"{r['entries_per_second']:.0f}" if r['entries_per_second'] else "-"
+        print(f"| {r['scale']:>5} | {r['phase']:<16} | {r['entries']:>7} | {r['seconds']:>8.3f} "
+              f"| {eps:>10} | {r['peak_bytes'] / 2 ** 20:>8.1f} |")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+
+    if args.baseline and os.path.isfile(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(rows, json.load(f), args.max_regression)
+        for r in regressions:
+            print(f"Regression: {r}")
+        if regressions and not args.report_only:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
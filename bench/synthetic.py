@@ -0,0 +1,86 @@
+"""
+Synthetic support matrices, config trees and upstream fixtures for benchmarks
+"""
+
+import os
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import yaml
+
+from src.utils import MatrixIndex
+from src.replay import FixtureArchive, fixture_key
+
+# number of checked systems in the tree today
+BASE_SYSTEMS = 35
+SYSTEMS_PER_BOARD = 3
+LISTING_SIZE = 50
+UPSTREAM = "http://upstream.invalid"
+
+
+@dataclass
+class SyntheticSystemInfo:
+    """
+    The fields of SystemInfo the checker uses
+    """
+    vendor: str
+    system: str
+    variant: str | None
+    board_variants: list[str]
+    version: str | None
+    product: str
+    raw_data: SimpleNamespace
+
+
+def listing(n: int) -> bytes:
+    """
+    A mirror index page with n date named directories
+    """
+    rows = [f'<a href="2024{1 + i // 28:02d}{1 + i % 28:02d}/">2024{1 + i // 28:02d}{1 + i % 28:02d}/</a>'
+            for i in range(n)]
+    return ("<html><body>\n" + "\n".join(rows) + "\n</body></html>").encode()
+
+
+def generate(root: str, scale: int) -> tuple[str, str, str, MatrixIndex]:
+    """
+    Write a matrix tree, config tree and fixture archive scale times today's size
+    return: config dir, matrix dir, fixture archive, parsed matrix
+    """
+    conf_dir = os.path.join(root, 'configs')
+    matrix_dir = os.path.join(root, 'matrix')
+    archive = FixtureArchive(os.path.join(root, 'fixtures.json'))
+    body = listing(LISTING_SIZE)
+    vinfos = []
+
+    os.makedirs(conf_dir, exist_ok=True)
+    with open(os.path.join(conf_dir, 'config.toml'), 'w', encoding='utf-8') as f:
+        f.write('[__config__]\nmax_concurrency = 40\n')
+
+    for i in range(BASE_SYSTEMS * scale):
+        board = f"Board{i // SYSTEMS_PER_BOARD}"
+        system = f"System{i % SYSTEMS_PER_BOARD}"
+        os.makedirs(os.path.join(matrix_dir, board, system), exist_ok=True)
+        os.makedirs(os.path.join(conf_dir, board, system), exist_ok=True)
+        url = f"{UPSTREAM}/{board}/{system}/"
+        with open(os.path.join(conf_dir, board, system, 'config.yml'), 'w',
+                  encoding='utf-8') as f:
+            yaml.safe_dump({'null': {
+                'source': 'regex_stream',
+                'url': url,
+                'regex': r'<a href="(\d{8})/">\1/</a>',
+            }}, f)
+        archive.add(fixture_key('GET', url), url, 200,
+                    {'Content-Type': 'text/html'}, body)
+        vinfos.append(SyntheticSystemInfo(
+            vendor=board.lower(),
+            system=system.lower(),
+            variant=None,
+            board_variants=[],
+            version="20240101" if i % 2 else "20250101",
+            product=board,
+            raw_data=SimpleNamespace(link=[board, system, 'README.md']),
+        ))
+
+    archive.save()
+    matrix = MatrixIndex(SimpleNamespace(rtos=[]), vinfos)
+    return conf_dir, matrix_dir, archive.path, matrix
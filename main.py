@@ -2,28 +2,18 @@
 Check for updates in the matrix
 """
 
+import os
 import sys
 import logging
-from matrix.assets.src.matrix_parser import Systems
-from src.run_nvchecker import run_nvchecker
-from src.version_cmp import filter_newer
-from src.utils import gen_old, SelfRichResult
-from src.config import config
-import src.github_action as gh
-
-logging.basicConfig(
-    level=logging.WARNING,
-)
-logger = logging.getLogger(__name__)
+from src.config import config, parse_args
 
+# the other modules are imported where they are used, a run only loads
+# what its options need
 
-def gen_report(newer, skipped, manually_skipped):
-    """
-    Generate a report of the new versions found
-    """
+logger = logging.getLogger(__name__)
 
-    res = ""
-    res += """
+
+REPORT_HEADER = """
 # Update Report
 
 ## New Versions Found
@@ -32,97 +22,354 @@ def gen_report(newer, skipped, manually_skipped):
 | -------------- | ---------------------- | ----------- | ----------- |
 """
 
-    for prod, ver in newer.items():
-        if ver['new'] is None:
-            continue
-        trip = prod
-        old_s = ver['old'].version if ver['old'] else "N/A"
-        new_s = ver['new'].version if ver['new'] else "N/A"
-        p_s_v = f"{ver['old'].vinfo.product}:{ver['old'].vinfo.system}:{ver['old'].vinfo.variant}" if ver['old'] else "N/A"
-        res += f"| {trip} | {p_s_v} | {old_s} | {new_s} |\n"
 
-    res += """
+def report_row(prod, ver):
+    """
+    The report line of a new version, ver is an item of filter_newer
+    """
+    old_s = ver['old'].version if ver['old'] else "N/A"
+    new_s = ver['new'].version if ver['new'] else "N/A"
+    p_s_v = f"{ver['old'].vinfo.product}:{ver['old'].vinfo.system}:{ver['old'].vinfo.variant}" if ver['old'] else "N/A"
+    return f"| {prod} | {p_s_v} | {old_s} | {new_s} |\n"
+
+
+def report_tail(skipped, manually_skipped, timed_out=(), recorder=None):
+    """
+    The sections of the report following the new versions
+    """
+
+    res = ["""
 ## Skipped Products
 
 These products doesn't have any configs! You need to add them later.
 
 | Path | Matrix |
 | ---- | ------ |
-"""
+"""]
 
     for p in skipped:
         mat_p=p.replace("configs/", "matrix/")
-        res += f"| [{p}]({p}) | [{mat_p}]({mat_p})  |\n"
+        res.append(f"| [{p}]({p}) | [{mat_p}]({mat_p})  |\n")
 
-    res += """
+    res.append("""
 ## Manually Skipped Products
 These products were manually skipped and will not be checked for updates.
 Please check them manually.
 | Path | Reason |
 | ---- | ------ |
-"""
+""")
     for p in manually_skipped:
-        res += f"| [{p[0]}]({p[0]}) | {p[1]} |\n"
+        res.append(f"| [{p[0]}]({p[0]}) | {p[1]} |\n")
+
+    if timed_out:
+        res.append("""
+## Timed Out Products
+These products were not checked within the time budget of the run.
+| Product Triple |
+| -------------- |
+""")
+        for prod in sorted(timed_out):
+            res.append(f"| {prod} |\n")
+
+    if recorder is not None and recorder.entries:
+        res.append("""
+## Slowest Entries
 
-    res += "\n\n"
+| Entry | Source | Queue Wait (s) | Check (s) | Requests | Bytes | Status |
+| ----- | ------ | -------------- | --------- | -------- | ----- | ------ |
+""")
+        for name, e in recorder.slowest_entries():
+            res.append(f"| {name} | {e.source} | {e.queue_wait:.2f} | {e.seconds:.2f} | {e.requests} | {e.bytes} | {e.status} |\n")
 
-    return res
+        res.append("""
+## Slowest Hosts
 
+| Host | Requests | Retries | Errors | Total (s) | Max (s) | Bytes |
+| ---- | -------- | ------- | ------ | --------- | ------- | ----- |
+""")
+        for host, h in recorder.slowest_hosts():
+            res.append(f"| {host} | {h.requests} | {h.retries} | {h.errors} | {h.seconds:.2f} | {max(h.latencies, default=0):.2f} | {h.bytes} |\n")
 
-def main():
+    res.append("\n\n")
+
+    return "".join(res)
+
+
+def gen_report(newer, skipped, manually_skipped, timed_out=(), recorder=None):
     """
-    Main function
+    Generate a report of the new versions found
     """
+    res = [REPORT_HEADER]
+    res += [report_row(prod, ver) for prod, ver in newer.items()
+            if ver['new'] is not None]
+    res.append(report_tail(skipped, manually_skipped, timed_out, recorder))
+    return "".join(res)
 
-    matrix = Systems(config["matrix"])
 
-    old = gen_old(matrix)
+def new_issue(ver):
+    """
+    The key and issue of a new version, ver is an item of filter_newer
+    """
+    import src.github_action as gh
+    from src.issue_sync import issue_key, ISSUE_LABEL
 
-    new, fail, skipped, manually_skipped = run_nvchecker(
-        conf_dir=config["path"], matrix_dir=config["matrix"], oldvers=old)
-    if fail:
-        logger.exception("Failed to run nvchecker: %s", fail)
-        sys.exit(-1)
+    old_res = ver['old']
+    title = f"[Image Check] {old_res.vinfo.product}:{old_res.vinfo.system} has new version {ver["new"].version}"
+    old_s = ver['old'].version if ver['old'] else "N/A"
+    body = f"New version for {old_res.vinfo.product}:{old_res.vinfo.system}:{old_res.vinfo.variant} found: {old_s} -> {ver["new"].version}\n\n"
+    key = issue_key(old_res.vinfo.product, old_res.vinfo.system, ver["new"].version)
+    return key, gh.Issue(title=title, body=body, labels=[ISSUE_LABEL])
+
+
+class Publisher:
+    """
+    Write the report and create the issues while the results arrive
+    """
+
+    def __init__(self, old, previous=None):
+        """
+        :param previous: the last recorded states, HistoryStore.last_states,
+        only the results differing from them are reported and get an issue
+        """
+        self.old = old
+        self.previous = previous
+        self.report = None
+        # with previous, a run without changes keeps the last report
+        if previous is None:
+            self.open_report()
+        self.issues = None
+        if config["issue"] and config["GITHUB_TOKEN"] is not None:
+            import src.github_action as gh
+            from src.issue_sync import IssueSync, IssueIndex
+
+            logger.info("Creating issue in %s", config["ISSUE_REPO"])
+            github = gh.GithubManager(config["GITHUB_TOKEN"], config["GITHUB_API_URL"])
+            repo = gh.GithubRepoManager(github, config["ISSUE_REPO"])
+            self.issues = IssueSync(repo, IssueIndex(os.path.join(config["cache_dir"], "issues.json")))
+            self.issues.start()
+
+    def open_report(self):
+        self.report = open(config["report"], 'w', encoding='utf-8')
+        self.report.write(REPORT_HEADER)
+        self.report.flush()
+
+    def on_result(self, name, new):
+        """
+        Compare a result, reporting it and submitting its issue if newer
+        """
+        from src import metrics
+        from src.version_cmp import newer_entry
+        from src.history import state_changed
 
-    upd = filter_newer(old, new)
-
-    report = gen_report(upd, skipped, manually_skipped)
-
-    with open(config["report"], 'w', encoding='utf-8') as f:
-        f.write(report)
-        logger.info("Report written to %s", config["report"])
-
-    if config["GITHUB_TOKEN"] is not None:
-        github = gh.GithubManager(config["GITHUB_TOKEN"])
-    else:
-        github = None
-
-    if config["issue"] and github is not None:
-        logger.info("Creating issue in %s", config["ISSUE_REPO"])
-        repo = gh.GithubRepoManager(github, config["ISSUE_REPO"])
-
-        issues = repo.get_all_issues()
-        for prod, ver in upd.items():
-            if ver['new'] is None:
-                continue
-            old_res: SelfRichResult = ver['old']
-            title = f"[Image Check] {old_res.vinfo.product}:{old_res.vinfo.system} has new version {ver["new"].version}"
-            old_s = ver['old'].version if ver['old'] else "N/A"
-            body = f"New version for {old_res.vinfo.product}:{old_res.vinfo.system}:{old_res.vinfo.variant} found: {old_s} -> {ver["new"].version}\n\n"
-
-            for issue in issues:
-                if title in issue.title:
-                    logger.info("Issue already exists: %s", issue.title)
-                    break
-            else:
-                issue = gh.Issue(title=title, body=body,
-                                 labels=["image-check"])
-                url = repo.create_issue(issue)
+        # named after the phase it replaced, so the timings stay comparable
+        with metrics.recorder.span('filter_newer'):
+            if self.previous is not None and not state_changed(self.previous, name, new):
+                return
+            ver = newer_entry(self.old.get(name), new)
+        if ver is None:
+            return
+        if self.report is None:
+            self.open_report()
+        self.report.write(report_row(name, ver))
+        self.report.flush()
+        # only versions of known systems get an issue
+        if self.issues is not None and ver['old'] is not None:
+            self.issues.submit(*new_issue(ver))
+
+    def finish(self, fail, skipped, manually_skipped, timed_out):
+        """
+        Complete the report, wait for the issues and write the metrics
+        """
+        from src import metrics
+
+        rec = metrics.recorder
+        if fail:
+            logger.error("Some checks of nvchecker failed, reporting the others")
+        if timed_out:
+            logger.error("%d checks timed out", len(timed_out))
+
+        if self.report is None and not os.path.exists(config["report"]):
+            self.open_report()
+        if self.report is not None:
+            self.report.write(report_tail(skipped, manually_skipped, timed_out, rec))
+            self.report.close()
+            logger.info("Report written to %s", config["report"])
+        else:
+            logger.info("No version changed since the last run, %s is kept",
+                        config["report"])
+
+        if self.issues is not None:
+            with rec.span('issues'):
+                synced = self.issues.finish()
+            for key, url in synced.items():
                 if url:
-                    logger.info("Issue created: %s", url)
-                    issues.append(issue)
+                    logger.info("Issue created or updated: %s", url)
                 else:
-                    logger.error("Failed to create issue for %s", prod)
+                    logger.error("Failed to create or update issue for %s", key)
+
+        if config["metrics"]:
+            rec.write_prometheus(config["metrics"])
+        if config["trace"]:
+            rec.write_trace(config["trace"])
+
+
+def publish(old, new, fail, skipped, manually_skipped, timed_out):
+    """
+    Report the results of a check and create issues for the new versions
+    """
+    from src import metrics
+
+    p = Publisher(old)
+    with metrics.recorder.span('publish'):
+        for name, r in new.items():
+            p.on_result(name, r)
+    p.finish(fail, skipped, manually_skipped, timed_out)
+
+
+def main(argv: list[str] | None = None):
+    """
+    Main function
+    """
+    parse_args(argv)
+    logging.basicConfig(
+        level=logging.WARNING,
+    )
+
+    profiler = None
+    if config["profile_import"]:
+        from src.import_profile import ImportProfiler
+        profiler = ImportProfiler().start()
+    try:
+        run()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            sys.stderr.write(profiler.report())
+
+
+def run():
+    """
+    Check the matrix with the parsed config
+    """
+    from src import metrics
+    from src.utils import gen_old, MatrixIndex
+    from src.shard import Shard, parse_shard, write_partial, load_partials, merge_partials
+    from src.selector import Selector
+
+    selector = Selector.from_config(config)
+    deadline = float(config["deadline"]) if config["deadline"] else None
+    if config["daemon"]:
+        from src.daemon import run_daemon
+        run_daemon(
+            conf_dir=config["path"], matrix_dir=config["matrix"],
+            cache_dir=config["cache_dir"], publish=publish,
+            tick=float(config["daemon_tick"]), deadline=deadline,
+            record=config["record"], replay=config["replay"],
+            replay_latency=float(config["replay_latency"]),
+            replay_jitter=float(config["replay_jitter"]),
+            selector=selector)
+        return
+
+    history_path = os.path.join(config["cache_dir"], "history.sqlite")
+    if config["last_new"] or config["failing_runs"]:
+        from src.history import HistoryStore, format_last_new, format_failing
+        history = HistoryStore(history_path)
+        if config["last_new"]:
+            sys.stdout.write(format_last_new(history.last_new(config["last_new"])))
+        if config["failing_runs"]:
+            sys.stdout.write(format_failing(history.failing(int(config["failing_runs"]))))
+        history.close()
+        return
+
+    rec = metrics.recorder
+    with rec.span('matrix'):
+        matrix = MatrixIndex.load(config["matrix"])
+
+    if config["changed_since"]:
+        from src.changes import changed_selector, selects_nothing
+        selector = changed_selector(config["changed_since"], config["path"],
+                                    config["matrix"], matrix, selector)
+        if selects_nothing(selector):
+            # walking the configs would report every directory as skipped
+            logger.info("No system changed since %s, nothing to check",
+                        config["changed_since"])
+            with open(config["report"], 'w', encoding='utf-8') as f:
+                f.write(gen_report({}, (), ()))
+            return
+
+    with rec.span('gen_old'):
+        old = gen_old(matrix, selector)
+
+    if config["plan"]:
+        from src.plan import make_plan, format_plan
+        plan = make_plan(config["path"], config["matrix"], old, matrix,
+                         config["cache_dir"], config["incremental"], selector)
+        sys.stdout.write(format_plan(plan))
+        return
+
+    if config["merge"]:
+        from src.history import HistoryStore
+        with rec.span('merge'):
+            partials = load_partials(config["merge"])
+            try:
+                new, fail, skipped, manually_skipped, timed_out = merge_partials(partials, rec)
+            except ValueError as e:
+                # the last report is kept rather than replaced by an empty one
+                logger.error("%s", e)
+                sys.exit(-1)
+        rec.save_history(os.path.join(config["cache_dir"], "latency.json"))
+        history = HistoryStore(history_path)
+        p = Publisher(old, history.last_states() if config["changed_only"] else None)
+        history.record_run('merge', {n for d in partials for n in d['entries']} | timed_out,
+                           new, timed_out, old,
+                           {k: e.seconds for k, e in rec.entries.items()})
+        history.close()
+        for name, r in new.items():
+            p.on_result(name, r)
+        p.finish(fail, skipped, manually_skipped, timed_out)
+        if fail or timed_out:
+            sys.exit(-1)
+        return
+
+    from src.run_nvchecker import run_nvchecker
+
+    shard = Shard(*parse_shard(config["shard"])) if config["shard"] else None
+    # results are reported and their issues created while the others are
+    # checked, shards leave both, and the history, to the merge
+    history = None
+    p = None
+    if shard is None:
+        from src.history import HistoryStore
+        history = HistoryStore(history_path)
+        p = Publisher(old, history.last_states() if config["changed_only"] else None)
+    with rec.span('run_nvchecker'):
+        new, fail, skipped, manually_skipped, timed_out = run_nvchecker(
+            conf_dir=config["path"], matrix_dir=config["matrix"], oldvers=old,
+            cache_dir=config["cache_dir"], incremental=config["incremental"],
+            matrix=matrix, deadline=deadline,
+            record=config["record"], replay=config["replay"],
+            replay_latency=float(config["replay_latency"]),
+            replay_jitter=float(config["replay_jitter"]),
+            on_result=p.on_result if p is not None else None,
+            shard=shard, selector=selector, history=history)
+    if history is not None:
+        history.close()
+
+    if shard is not None:
+        write_partial(config["partial"], shard, new, fail, skipped,
+                      manually_skipped, timed_out, rec)
+        logger.info("Results of shard %d/%d written to %s",
+                    shard.index, shard.count, config["partial"])
+        if config["metrics"]:
+            rec.write_prometheus(config["metrics"])
+        if config["trace"]:
+            rec.write_trace(config["trace"])
+        return
+
+    p.finish(fail, skipped, manually_skipped, timed_out)
+
+    if fail or timed_out:
+        sys.exit(-1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,185 @@
+"""
+Select the systems touched by the changes since a git ref
+
+A changed config file selects the systems under its directory, whose
+entries it is merged into, and the systems of the full entry names it
+defines wherever they are. A changed file of the matrix submodule selects
+the systems under its directory, a deleted config file is read as it was
+at the merge base. A change of the root config, of the matrix parser or of
+a submodule range which cannot be diffed selects everything, as does a ref
+git cannot diff against.
+"""
+
+import os
+import re
+import logging
+import tempfile
+import subprocess
+from typing import Callable
+
+from .utils import MatrixIndex, gen_item_name
+from .selector import Selector, system_path
+from .run_nvchecker import CONFIG_FILES, parse_config_file
+
+logger = logging.getLogger(__name__)
+
+# matrix directories holding no systems, a change there affects all of them
+MATRIX_GLOBAL_DIRS = frozenset({'assets', '.github'})
+# a path pattern matching no system
+NOTHING = 're:(?!)'
+
+
+def git(cwd: str, *args: str) -> str:
+    return subprocess.run(['git', *args], cwd=cwd, check=True,
+                          capture_output=True, text=True).stdout
+
+
+def changed_files(ref: str, cwd: str, path: str) -> list[str]:
+    """
+    Files under path changed between the merge base of ref and HEAD and the
+    working tree, relative to path
+    """
+    out = git(cwd, 'diff', '--name-only', '--merge-base', ref, '--', path)
+    return [os.path.relpath(f, path) for f in out.splitlines() if f]
+
+
+def submodule_range(ref: str, cwd: str, path: str) -> tuple[str, str] | None:
+    """
+    The old and new commit of a submodule between the merge base of ref and
+    the working tree, None if it did not move
+    """
+    out = git(cwd, 'diff', '--merge-base', ref, '--', path)
+    old = re.search(r'^-Subproject commit (\w+)', out, re.M)
+    new = re.search(r'^\+Subproject commit (\w+)', out, re.M)
+    if old is None or new is None:
+        return None
+    return old.group(1), new.group(1)
+
+
+def old_config(cwd: str, rev: str, path: str) -> dict | None:
+    """
+    Parse a config file as it was at a revision, None if it is unknown there
+    """
+    try:
+        text = git(cwd, 'show', f'{rev}:{path}')
+    except subprocess.CalledProcessError:
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        # parsed by its name
+        tmp_path = os.path.join(tmp, os.path.basename(path))
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return parse_config_file(tmp_path)
+
+
+def config_paths(files: list[str], conf_dir: str, names: dict[str, str],
+                 read_deleted: Callable[[str], dict | None] | None = None,
+                 ) -> set[str] | None:
+    """
+    System paths whose subtree a change of these config files affects
+    :param names: entry name -> path of its system
+    :param read_deleted: parses a deleted config file, by its path relative
+    to conf_dir, so the systems of its entries are still selected
+    return: None if every system is affected
+    """
+    paths = set()
+    for f in files:
+        if os.path.basename(f) not in CONFIG_FILES:
+            continue
+        d = os.path.dirname(f)
+        if not d:
+            logger.info("Root config %s changed, checking everything", f)
+            return None
+        paths.add(d)
+        # full names defined here may belong to systems elsewhere
+        full = os.path.join(conf_dir, f)
+        if os.path.isfile(full):
+            conf = parse_config_file(full)
+        else:
+            conf = read_deleted(f) if read_deleted is not None else None
+        for k in conf or {}:
+            if k.count('-') >= 3 and k in names:
+                paths.add(names[k])
+    return paths
+
+
+def matrix_paths(files: list[str]) -> set[str] | None:
+    """
+    System paths whose subtree a change of these matrix files affects
+    return: None if every system is affected
+    """
+    paths = set()
+    for f in files:
+        d = os.path.dirname(f)
+        if not d or d.split('/')[0] in MATRIX_GLOBAL_DIRS:
+            logger.info("Matrix file %s changed, checking everything", f)
+            return None
+        paths.add(d)
+    return paths
+
+
+def affected_paths(ref: str, conf_dir: str, matrix_dir: str,
+                   matrix: MatrixIndex) -> set[str] | None:
+    """
+    System paths, relative to the config and matrix trees, affected by the
+    changes since ref
+    return: None if every system is affected
+    """
+    top = git(conf_dir, 'rev-parse', '--show-toplevel').strip()
+    names = {n: system_path(v) for v in matrix.vinfos for n in gen_item_name(v)}
+    conf_rel = os.path.relpath(conf_dir, top)
+    base = git(top, 'merge-base', ref, 'HEAD').strip()
+
+    paths = config_paths(
+        changed_files(ref, top, conf_rel), conf_dir, names,
+        lambda f: old_config(top, base, os.path.join(conf_rel, f)))
+    if paths is None:
+        return None
+
+    moved = submodule_range(ref, top, os.path.relpath(matrix_dir, top))
+    if moved is not None:
+        old, new = moved
+        try:
+            files = git(matrix_dir, 'diff', '--name-only', old, new).splitlines()
+        except subprocess.CalledProcessError as e:
+            logger.warning("Cannot diff the matrix from %s to %s, checking everything: %s",
+                           old, new, e.stderr.strip())
+            return None
+        more = matrix_paths(files)
+        if more is None:
+            return None
+        paths |= more
+    return paths
+
+
+def changed_selector(ref: str, conf_dir: str, matrix_dir: str, matrix: MatrixIndex,
+                     selector: Selector | None = None) -> Selector | None:
+    """
+    Narrow a selector to the systems affected by the changes since ref
+    return: the selector unchanged if every system is affected, or if the
+    changes are unknown, e.g. ref is missing from a shallow clone
+    """
+    try:
+        paths = affected_paths(ref, conf_dir, matrix_dir, matrix)
+    except subprocess.CalledProcessError as e:
+        logger.warning("Cannot diff against %s, checking everything: %s",
+                       ref, e.stderr.strip())
+        return selector
+    if paths is None:
+        return selector
+    systems = {system_path(v) for p in paths for v in matrix.under(p)}
+    if selector is not None:
+        systems = {s for s in systems if selector.matches_path(s)}
+    logger.info("%d systems changed since %s", len(systems), ref)
+    specs = dict(selector.specs) if selector is not None else {}
+    # one alternation, every system is matched against it on the walk
+    specs['path'] = ['re:' + '|'.join(re.escape(s) for s in sorted(systems))
+                     if systems else NOTHING]
+    return Selector(**specs)
+
+
+def selects_nothing(selector: Selector | None) -> bool:
+    """
+    Whether a selector of changed_selector matches no system, nothing changed
+    """
+    return selector is not None and selector.specs['path'] == [NOTHING]
@@ -41,11 +41,24 @@ class CFG():
             )
 
     def __init__(self, config_list: list[CFGOne]):
-        arg = argparse.ArgumentParser()
+        self.parser = argparse.ArgumentParser()
         for c in config_list:
-            self.__set_arg(arg, c)
-        args = arg.parse_args()
-        self.configs = args
+            self.__set_arg(self.parser, c)
+        self._configs = None
+
+    def parse(self, argv: list[str] | None = None) -> argparse.Namespace:
+        """
+        Parse the command line, sys.argv if argv is None
+        """
+        self._configs = self.parser.parse_args(argv)
+        return self._configs
+
+    @property
+    def configs(self) -> argparse.Namespace:
+        # the defaults until the command line is parsed
+        if self._configs is None:
+            self._configs = self.parser.parse_args([])
+        return self._configs
 
     def __getitem__(self, key: str):
         return self.configs.__getattribute__(key)
@@ -60,13 +73,55 @@ _cli_configs = CFG([
         'explain': 'path to the report file', 'default': './report.md'},
     {'name': 'issue', 'explain': 'create issues if newer', 'default': False,
         'action': 'store_true'},
+    {'name': 'cache-dir', 'explain': 'directory for the persistent caches',
+        'default': './.cache'},
+    {'name': 'incremental', 'explain': 'only check entries whose config or matrix version changed or whose ttl expired',
+        'default': False, 'action': 'store_true'},
+    {'name': 'deadline', 'explain': 'seconds after which the remaining checks are cancelled'},
+    {'name': 'metrics', 'explain': 'write run metrics to this Prometheus textfile'},
+    {'name': 'trace', 'explain': 'write a Chrome trace-event timeline of the run to this file'},
+    {'name': 'record', 'explain': 'record every upstream response into this fixture archive'},
+    {'name': 'replay', 'explain': 'replay upstream responses from this fixture archive'},
+    {'name': 'replay-latency', 'explain': 'seconds of latency added to replayed responses',
+        'default': '0'},
+    {'name': 'replay-jitter', 'explain': 'up to this many seconds of jitter added to replayed responses',
+        'default': '0'},
+    {'name': 'shard', 'explain': 'only check the i-th of N shards of the entries, given as i/N with i from 0'},
+    {'name': 'partial', 'explain': 'where a shard writes its results', 'default': './partial.json'},
+    {'name': 'merge', 'explain': 'merge the shard results in this file or directory, then report and create issues'},
+    {'name': 'daemon', 'explain': 'keep running, rechecking every entry when its recheck interval expires',
+        'default': False, 'action': 'store_true'},
+    {'name': 'daemon-tick', 'explain': 'longest sleep of the daemon between two cycles, in seconds',
+        'default': '60'},
+    {'name': 'vendor', 'explain': 'only check these vendors, comma separated globs or re: prefixed regexes'},
+    {'name': 'system', 'explain': 'only check these systems, comma separated globs or re: prefixed regexes'},
+    {'name': 'variant', 'explain': 'only check these variants, comma separated globs or re: prefixed regexes'},
+    {'name': 'board-variant', 'explain': 'only check these board variants, comma separated globs or re: prefixed regexes'},
+    {'name': 'select-path', 'explain': 'only check the configs under these paths relative to the config directory, comma separated globs or re: prefixed regexes'},
+    {'name': 'changed-since', 'explain': 'only check the systems whose configs or matrix entries changed since this git ref'},
+    {'name': 'plan', 'explain': 'print the upstream requests the run would make and their estimated cost, then exit',
+        'default': False, 'action': 'store_true'},
+    {'name': 'changed-only', 'explain': 'only report and create issues for the entries whose version or status changed since the last run',
+        'default': False, 'action': 'store_true'},
+    {'name': 'last-new', 'explain': 'print when the entries matching this glob, by name or product, last got a new version, then exit'},
+    {'name': 'failing-runs', 'explain': 'print the entries which failed at least this many runs in a row, then exit'},
+    {'name': 'profile-import', 'explain': 'report the time spent importing each module of the run',
+        'default': False, 'action': 'store_true'},
 ])
 
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    Parse the command line into the config, sys.argv if argv is None
+    """
+    return _cli_configs.parse(argv)
+
 _internal_configs = {
     "CI_RUN_ID": os.getenv("CI_RUN_ID", None),
     "CI_RUN_URL": os.getenv("CI_RUN_URL", None),
     "ISSUE_REPO": os.getenv("ISSUE_REPO", None),
     "GITHUB_TOKEN": os.getenv("GITHUB_TOKEN", None),
+    "GITHUB_API_URL": os.getenv("GITHUB_API_URL", None),
 }
 
 
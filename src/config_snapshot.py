@@ -0,0 +1,167 @@
+"""
+Compiled snapshot of the config and matrix trees walked by load_all_configs
+
+Directory listings are cached by the directory mtime and parsed config
+files by their mtime and size, so only changed directories are listed and
+only changed files are parsed again. When nothing the last walk looked at
+changed, the merged result itself is served from the snapshot.
+"""
+
+import os
+import pickle
+import hashlib
+import logging
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class FileTree:
+    """
+    Plain file system access used by load_all_configs
+    """
+
+    def scandir(self, path: str) -> dict[str, str]:
+        """
+        List a directory
+        return: name -> 'f' for files, 'd' for directories, '' for others
+        """
+        res = {}
+        with os.scandir(path) as it:
+            for e in it:
+                if e.is_file():
+                    res[e.name] = 'f'
+                elif e.is_dir():
+                    res[e.name] = 'd'
+                else:
+                    res[e.name] = ''
+        return res
+
+    def load(self, path: str, parser: Callable[[str], Any]) -> Any:
+        """
+        Parse a file
+        """
+        return parser(path)
+
+
+def _sig(st: os.stat_result) -> tuple[int, int]:
+    return st.st_mtime_ns, st.st_size
+
+
+class ConfigSnapshot(FileTree):
+    """
+    FileTree caching listings, parsed files and the merged result on disk
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dirs: dict[str, tuple[tuple[int, int], dict[str, str]]] = {}
+        self.files: dict[str, tuple[tuple[int, int], bytes]] = {}
+        self.result: tuple[str, dict[str, tuple[int, int]], bytes] | None = None
+        # everything the current walk looked at, with its signature
+        self.inputs: dict[str, tuple[int, int]] = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    data = pickle.load(f)
+                if data.get('version') == SNAPSHOT_VERSION:
+                    self.dirs = data['dirs']
+                    self.files = data['files']
+                    self.result = data['result']
+            except (OSError, pickle.UnpicklingError, EOFError,
+                    AttributeError, KeyError) as e:
+                logger.warning("Dropping broken config snapshot %s: %s",
+                               path, e)
+
+    def start_walk(self):
+        """
+        Forget the inputs of the previous walk, a daemon walks the trees again
+        with the same snapshot
+        """
+        self.inputs = {}
+
+    def scandir(self, path: str) -> dict[str, str]:
+        sig = _sig(os.stat(path))
+        self.inputs[path] = sig
+        cached = self.dirs.get(path)
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        listing = super().scandir(path)
+        self.dirs[path] = (sig, listing)
+        return listing
+
+    def load(self, path: str, parser: Callable[[str], Any]) -> Any:
+        sig = _sig(os.stat(path))
+        self.inputs[path] = sig
+        cached = self.files.get(path)
+        if cached is not None and cached[0] == sig:
+            # a fresh copy, the merge mutates the configs it is given
+            return pickle.loads(cached[1])
+        conf = parser(path)
+        if conf is not None:
+            self.files[path] = (sig, pickle.dumps(conf))
+        return conf
+
+    def cached_result(self, key: str) -> Any:
+        """
+        The merged result of the last walk, if none of its inputs changed
+        """
+        if self.result is None or self.result[0] != key:
+            return None
+        for path, sig in self.result[1].items():
+            try:
+                if _sig(os.stat(path)) != sig:
+                    return None
+            except OSError:
+                return None
+        return pickle.loads(self.result[2])
+
+    def save(self, key: str, value: Any):
+        """
+        Store the merged result of the current walk and write the snapshot
+        """
+        self.result = (key, self.inputs, pickle.dumps(value))
+        # forget directories and files which are not part of the trees anymore
+        self.dirs = {k: v for k, v in self.dirs.items() if k in self.inputs}
+        self.files = {k: v for k, v in self.files.items() if k in self.inputs}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({
+                'version': SNAPSHOT_VERSION,
+                'dirs': self.dirs,
+                'files': self.files,
+                'result': self.result,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+def matrix_key(conf_dir: str, matrix_dir: str, vinfos: list,
+               rtos) -> str:
+    """
+    Hash of everything from the parsed matrix the merged configs depend on
+    """
+    raw = pickle.dumps([
+        os.path.abspath(conf_dir), os.path.abspath(matrix_dir), sorted(rtos),
+        [('/'.join(v.raw_data.link[:-1]), v.vendor, v.system, v.variant,
+          v.board_variants) for v in vinfos],
+    ])
+    return hashlib.sha256(raw).hexdigest()
+
+
+def tree_fingerprint(root: str) -> str:
+    """
+    Hash of the names, mtimes and sizes of everything under root
+    """
+    h = hashlib.sha256(repr(_sig(os.stat(root))).encode('utf-8'))
+    for cur, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d != '.git')
+        for name in sorted(files) + dirs:
+            path = os.path.join(cur, name)
+            try:
+                h.update(repr((path, _sig(os.stat(path)))).encode('utf-8'))
+            except OSError:
+                continue
+    return h.hexdigest()
@@ -0,0 +1,200 @@
+"""
+Long running checker, rechecking every entry on its own schedule
+
+The parsed matrix, the config snapshot, the dispatcher and the http session
+with its keep-alive connections are kept between cycles. A cycle reloads the
+matrix only when something under it changed on disk, reloads the configs
+through the snapshot, which only lists changed directories and parses changed
+files, and checks the entries whose recheck time came.
+"""
+
+import os
+import time
+import signal
+import asyncio
+import logging
+from typing import Callable
+
+from .utils import MatrixIndex, gen_old
+from .state import CheckState
+from .config_snapshot import ConfigSnapshot, tree_fingerprint
+from .selector import Selector
+from .history import HistoryStore
+from .run_nvchecker import (
+    CheckSession, setup_logging, load_entries, check_entries, matrix_version,
+)
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TICK = 60.0
+DEFAULT_JITTER = 0.1
+DEFAULT_RETRY = 600
+
+# publish(old, new, has_failures, skipped, manually_skipped, timed_out)
+Publisher = Callable[[dict, dict, bool, set, set, set], None]
+
+
+class Daemon:
+    """
+    Checker kept in memory between its cycles
+    """
+
+    def __init__(self, conf_dir: str, matrix_dir: str, cache_dir: str,
+                 publish: Publisher, tick: float = DEFAULT_TICK,
+                 deadline: float | None = None,
+                 record: str | None = None, replay: str | None = None,
+                 replay_latency: float = 0.0, replay_jitter: float = 0.0,
+                 selector: Selector | None = None):
+        """
+        :param publish: called with the results of every cycle which checked something
+        :param tick: longest sleep between two cycles, in seconds
+        :param selector: only check the selected systems
+        """
+        self.conf_dir = conf_dir
+        self.matrix_dir = matrix_dir
+        self.cache_dir = cache_dir
+        self.publish = publish
+        self.tick = tick
+        self.deadline = deadline
+        self.fixtures = (record, replay, replay_latency, replay_jitter)
+        self.selector = selector
+        self.snapshot = ConfigSnapshot(os.path.join(cache_dir, 'configs.pickle'))
+        self.history = HistoryStore(os.path.join(cache_dir, 'history.sqlite'))
+        self.state: CheckState | None = None
+        self.session: CheckSession | None = None
+        self.matrix: MatrixIndex | None = None
+        self.matrix_fingerprint: str | None = None
+        self.old: dict = {}
+        # failed entries -> when to check them again
+        self.retry_at: dict[str, float] = {}
+
+    def reload_matrix(self) -> bool:
+        """
+        Parse the matrix again if anything under it changed
+        return: whether it was reloaded
+        """
+        fingerprint = tree_fingerprint(self.matrix_dir)
+        if fingerprint == self.matrix_fingerprint:
+            return False
+        with metrics.recorder.span('matrix'):
+            self.matrix = MatrixIndex.load(self.matrix_dir)
+        with metrics.recorder.span('gen_old'):
+            self.old = gen_old(self.matrix, self.selector)
+        self.matrix_fingerprint = fingerprint
+        logger.info("Matrix loaded, %d systems", len(self.matrix.vinfos))
+        return True
+
+    def ensure_session(self, options, extra_options: dict):
+        """
+        Set up the http session, again only when `__config__` changed
+        """
+        if self.session is not None and self.session.extra_options == extra_options:
+            # keys are read again from the key file of every cycle
+            self.session.options = options
+            return
+        if self.session is not None:
+            logger.info("Options changed, setting up a new http session")
+            self.session.close()
+        self.session = CheckSession(options, extra_options, self.cache_dir,
+                                    *self.fixtures)
+
+    async def cycle(self) -> float:
+        """
+        Check the entries which are due
+        return: when the next entry is due
+        """
+        metrics.reset()
+        self.reload_matrix()
+        entries, options, extra_options, skipped, manually_skipped = load_entries(
+            self.conf_dir, self.matrix_dir, self.matrix, self.snapshot,
+            self.selector)
+        self.ensure_session(options, extra_options)
+        if self.state is None:
+            self.state = CheckState(os.path.join(self.cache_dir, 'state.json'),
+                                    extra_options.get('incremental'))
+        else:
+            # the ttls may have been edited since the last cycle
+            self.state.configure(extra_options.get('incremental'))
+        state = self.state
+        daemon_options = extra_options.get('daemon', {})
+        jitter = daemon_options.get('jitter', DEFAULT_JITTER)
+        retry = daemon_options.get('retry', DEFAULT_RETRY)
+
+        now = time.time()
+        due = {}
+        next_due = float('inf')
+        for name, entry in entries.items():
+            at = max(state.due_at(name, entry, matrix_version(self.old, name), jitter),
+                     self.retry_at.get(name, 0.0))
+            if at <= now:
+                due[name] = entry
+            else:
+                next_due = min(next_due, at)
+        if not due:
+            return next_due
+
+        logger.info("Checking %d of %d entries", len(due), len(entries))
+        deadline = self.deadline
+        if deadline is None:
+            deadline = extra_options.get('deadline')
+        with metrics.recorder.span('check'):
+            results, has_failures, failed, timed_out = await check_entries(
+                self.session, due, self.old, deadline)
+        self.session.flush()
+        metrics.recorder.save_history(os.path.join(self.cache_dir, 'latency.json'))
+        for name, r in results.items():
+            state.update(name, due[name], matrix_version(self.old, name), r)
+        state.save()
+        self.history.record_run(
+            'daemon', due, results, timed_out, self.old,
+            {k: e.seconds for k, e in metrics.recorder.entries.items()})
+        for name in due:
+            self.retry_at.pop(name, None)
+        for name in failed | timed_out:
+            self.retry_at[name] = now + retry
+        for name, entry in due.items():
+            next_due = min(next_due, self.retry_at.get(name) or state.due_at(
+                name, entry, matrix_version(self.old, name), jitter))
+
+        new = {name: state.result(name) for name in entries
+               if name in state.entries and name not in failed | timed_out}
+        self.publish(self.old, dict(sorted(new.items())), has_failures,
+                     skipped, manually_skipped, timed_out)
+        return next_due
+
+    async def run_forever(self):
+        """
+        Run cycles until cancelled or terminated
+        """
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            while True:
+                try:
+                    next_due = await self.cycle()
+                except Exception:
+                    logger.exception("Check cycle failed")
+                    next_due = float('inf')
+                delay = min(max(next_due - time.time(), 0.0), self.tick)
+                logger.info("Next cycle in %.0fs", delay)
+                await asyncio.sleep(delay)
+        finally:
+            if self.session is not None:
+                self.session.close()
+            self.history.close()
+
+
+def run_daemon(conf_dir: str, matrix_dir: str, cache_dir: str,
+               publish: Publisher, tick: float = DEFAULT_TICK,
+               logging='warning', logger='pretty', **kwargs):
+    """
+    Run the checker as a daemon until interrupted
+    """
+    if setup_logging(logging, logger):
+        return
+    daemon = Daemon(conf_dir, matrix_dir, cache_dir, publish, tick, **kwargs)
+    try:
+        asyncio.run(daemon.run_forever())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
@@ -0,0 +1,165 @@
+"""
+Dispatch the checks of the entries to the nvchecker source plugins
+
+It is copied and modified from nvchecker's core, which uses MIT License
+"""
+
+import time
+import asyncio
+import logging
+import contextvars
+import types
+from importlib import import_module
+from typing import Any, Dict, List, Tuple, Sequence, Awaitable
+
+from nvchecker import core
+from nvchecker.ctxvars import tries as ctx_tries
+from nvchecker.ctxvars import entry_waiter as ctx_entry_waiter
+from nvchecker.util import (
+    Entries, Entry, KeyManager, RawResult, EntryWaiter, FunctionWorker,
+)
+
+from .metrics import timed
+from .mirrors import with_mirrors
+
+logger = logging.getLogger(__name__)
+
+
+class EntryTimeout(Exception):
+    """
+    A check ran out of its time budget
+    """
+
+    def __init__(self, budget: float):
+        super().__init__(f"check took longer than {budget}s")
+        self.budget = budget
+
+
+def budgeted(func, source_timeouts: dict[str, float]):
+    """
+    Wrap a source get_version with the time budget of the checked entry,
+    `check_timeout` of the entry or `__config__.timeouts` of its source
+    """
+    async def get_version(name: str, conf: Entry, **kwargs):
+        budget = conf.get('check_timeout',
+                          source_timeouts.get(conf.get('source', 'none')))
+        if budget is None:
+            return await func(name, conf, **kwargs)
+        try:
+            return await asyncio.wait_for(func(name, conf, **kwargs), budget)
+        except asyncio.TimeoutError:
+            raise EntryTimeout(budget) from None
+    return get_version
+
+
+def load_source(source: str) -> types.ModuleType:
+    """
+    Import a source plugin, the ones in src/sources first
+    """
+    try:
+        return import_module(f'{__package__}.sources.{source}')
+    except ModuleNotFoundError as e:
+        if e.name != f'{__package__}.sources.{source}':
+            raise
+    return import_module('nvchecker_source.' + source)
+
+
+class ResultTracker(EntryWaiter):
+    """
+    EntryWaiter which also records which entries succeeded, failed or timed out
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.done: set[str] = set()
+        self.failed: set[str] = set()
+        self.timed_out: set[str] = set()
+
+    def set_result(self, name: str, value: str) -> None:
+        self.done.add(name)
+        super().set_result(name, value)
+
+    def set_exception(self, name: str, e: Exception) -> None:
+        if isinstance(e, EntryTimeout):
+            self.timed_out.add(name)
+        else:
+            self.failed.add(name)
+        super().set_exception(name, e)
+
+
+class Dispatcher(core.Dispatcher):
+    """
+    nvchecker's dispatcher, applying time budgets to the checks of function
+    based sources and of the workers having a `wrap` hook, and recording them
+    """
+
+    def __init__(self, source_timeouts: dict[str, float] | None = None):
+        self.source_timeouts = source_timeouts or {}
+
+    def dispatch(
+        self,
+        entries: Entries,
+        task_sem: asyncio.Semaphore,
+        result_q: asyncio.Queue[RawResult],
+        keymanager: KeyManager,
+        entry_waiter: EntryWaiter,
+        tries: int,
+        source_configs: Dict[str, Dict[str, Any]],
+    ) -> List[asyncio.Future]:
+        mods: Dict[str, Tuple[types.ModuleType, List]] = {}
+        ctx_tries.set(tries)
+        ctx_entry_waiter.set(entry_waiter)
+        root_ctx = contextvars.copy_context()
+        dispatched = time.perf_counter()
+
+        for name, entry in entries.items():
+            source = entry.get('source', 'none')
+            if source not in mods:
+                mod = load_source(source)
+                tasks: List[Tuple[str, Entry]] = []
+                mods[source] = mod, tasks
+                config = source_configs.get(source)
+                if config and getattr(mod, 'configure', None):
+                    mod.configure(config)
+            else:
+                tasks = mods[source][1]
+            tasks.append((name, entry))
+
+        def wrap(func):
+            return timed(budgeted(with_mirrors(func), self.source_timeouts),
+                         dispatched)
+
+        ret = []
+        for mod, tasks in mods.values():
+            if hasattr(mod, 'Worker'):
+                worker_cls = mod.Worker
+            else:
+                worker_cls = FunctionWorker
+
+            ctx = root_ctx.copy()
+            worker = ctx.run(
+                worker_cls,
+                task_sem, result_q, tasks, keymanager,
+            )
+            if worker_cls is FunctionWorker:
+                ctx.run(worker.initialize, wrap(mod.get_version))
+            elif hasattr(worker, 'wrap'):
+                # a worker checking entries together wraps the check of each
+                worker.wrap = wrap
+
+            ret.append(ctx.run(worker._run_maynot_raise))
+
+        return ret
+
+
+async def run_tasks(futures: Sequence[Awaitable[None]]) -> None:
+    """
+    Run the workers, cancelling all of them when cancelled
+    """
+    tasks = [asyncio.ensure_future(fu) for fu in futures]
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        for t in tasks:
+            t.cancel()
+        raise
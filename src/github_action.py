@@ -1,7 +1,11 @@
+import logging
 from dataclasses import dataclass
-from typing import Optional, List
+from datetime import datetime
+from typing import Optional, List, Iterator
 
-from github import Github
+from . import metrics
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -9,6 +13,8 @@ class Issue:
     title: str
     body: str
     labels: list[str] = None
+    url: Optional[str] = None
+    number: Optional[int] = None
 
 
 class GithubRepoManager:
@@ -29,14 +35,28 @@ class GithubRepoManager:
         Create an issue in the repository
         """
         try:
-            created = self.repo.create_issue(
-                title=issue.title,
-                body=issue.body,
-                labels=issue.labels if issue.labels else []
-            )
+            with metrics.recorder.span('create_issue', 'github', title=issue.title):
+                created = self.repo.create_issue(
+                    title=issue.title,
+                    body=issue.body,
+                    labels=issue.labels if issue.labels else []
+                )
             return created.html_url
         except Exception as e:
-            print(f"Error creating issue: {e}")
+            logger.info("Error creating issue %s: %s", issue.title, e)
+            return None
+
+    def update_issue(self, issue: Issue) -> Optional[str]:
+        """
+        Replace the body of an existing issue, found by its number
+        """
+        try:
+            with metrics.recorder.span('update_issue', 'github', title=issue.title):
+                existing = self.repo.get_issue(issue.number)
+                existing.edit(body=issue.body)
+            return existing.html_url
+        except Exception as e:
+            logger.info("Error updating issue %s: %s", issue.title, e)
             return None
 
     def get_all_issues(self) -> List[Issue]:
@@ -49,15 +69,33 @@ class GithubRepoManager:
                           label.name for label in issue.labels]))
         return issues
 
+    def get_issues_since(self, since: Optional[datetime], label: str) -> Iterator[Issue]:
+        """
+        Get the issues with a label updated since a time, all of them without it
+        """
+        kwargs = {'since': since} if since is not None else {}
+        with metrics.recorder.span('get_issues', 'github', since=str(since)):
+            for issue in self.repo.get_issues(state='all', labels=[label], **kwargs):
+                yield Issue(title=issue.title, body=issue.body, labels=[
+                    label.name for label in issue.labels], url=issue.html_url,
+                    number=issue.number)
+
 
 class GithubManager:
     """
     A class to manage GitHub
     """
 
-    def __init__(self, token: str):
+    def __init__(self, token: str, base_url: Optional[str] = None):
         """
-        Initialize the GitHub manager with a token
+        Initialize the GitHub manager with a token, and optionally the API
+        url of another GitHub instance
         """
+        # PyGithub pulls in requests and cryptography, only load it when used
+        from github import Github
+
         self.token = token
-        self.g = Github(token)
+        if base_url:
+            self.g = Github(token, base_url=base_url)
+        else:
+            self.g = Github(token)
@@ -0,0 +1,189 @@
+"""
+Version history of every entry over the runs, in a SQLite database
+
+Every run records the old and new version, status and check duration of
+its entries. The latest state of each entry is kept in its own table, so a
+run can only report the entries whose version or status changed since the
+last one, and questions like when a board last got a new image or which
+entries failed several runs in a row are answered from indexes.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+from typing import Iterable
+
+from nvchecker.core import RichResult
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    kind TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    name TEXT NOT NULL,
+    product TEXT,
+    old_version TEXT,
+    new_version TEXT,
+    status TEXT NOT NULL,
+    seconds REAL,
+    changed INTEGER NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS results_by_name ON results (name, run_id);
+CREATE TABLE IF NOT EXISTS latest (
+    name TEXT PRIMARY KEY,
+    product TEXT,
+    version TEXT,
+    status TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    changed_run INTEGER,
+    fail_streak INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS latest_by_product ON latest (product);
+CREATE INDEX IF NOT EXISTS latest_by_streak ON latest (fail_streak);
+"""
+
+
+class HistoryStore:
+    """
+    Runs and the results of their entries
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def last_states(self) -> dict[str, tuple[str | None, str]]:
+        """
+        The last version found and the last status of every entry
+        """
+        return {name: (version, status) for name, version, status in
+                self.db.execute("SELECT name, version, status FROM latest")}
+
+    def record_run(self, kind: str, names: Iterable[str],
+                   results: dict[str, RichResult], timed_out: set[str],
+                   oldvers: dict, seconds: dict[str, float] | None = None) -> int:
+        """
+        Record the results of a run
+        :param names: every entry the run was to check, the ones without a
+        result and not timed out failed
+        :param seconds: duration of the checks, by entry
+        return: id of the run
+        """
+        seconds = seconds or {}
+        latest = {row[0]: row[1:] for row in self.db.execute(
+            "SELECT name, version, changed_run, fail_streak FROM latest")}
+        with self.db:
+            run_id = self.db.execute(
+                "INSERT INTO runs (started, kind) VALUES (?, ?)",
+                (time.time(), kind)).lastrowid
+            rows = []
+            states = []
+            for name in names:
+                old = oldvers.get(name)
+                product = old.vinfo.product if old is not None else None
+                r = results.get(name)
+                prev_version, changed_run, streak = latest.get(name, (None, None, 0))
+                if r is not None:
+                    status, version = 'ok', r.version
+                    changed = version != prev_version
+                    streak = 0
+                else:
+                    status = 'timed_out' if name in timed_out else 'failed'
+                    version, changed = prev_version, False
+                    streak += 1
+                if changed:
+                    changed_run = run_id
+                rows.append((run_id, name, product,
+                             old.version if old is not None else None,
+                             r.version if r is not None else None,
+                             status, seconds.get(name), int(changed)))
+                states.append((name, product, version, status, run_id,
+                               changed_run, streak))
+            self.db.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.executemany(
+                "INSERT OR REPLACE INTO latest VALUES (?, ?, ?, ?, ?, ?, ?)", states)
+        logger.info("Run %d recorded in %s, %d entries", run_id, self.path, len(rows))
+        return run_id
+
+    def last_new(self, pattern: str = '*') -> list[tuple[str, str | None, str, float]]:
+        """
+        When the entries matching a glob, by name or product, last got a new version
+        return: name, product, version, time, the most recent first
+        """
+        return self.db.execute("""
+            SELECT l.name, l.product, l.version, r.started
+            FROM latest l JOIN runs r ON r.id = l.changed_run
+            WHERE l.name GLOB ?1 OR l.product GLOB ?1
+            ORDER BY r.started DESC
+        """, (pattern,)).fetchall()
+
+    def failing(self, runs: int) -> list[tuple[str, int, str]]:
+        """
+        The entries which failed at least that many runs in a row
+        return: name, failed runs, last status, the longest streak first
+        """
+        return self.db.execute("""
+            SELECT name, fail_streak, status FROM latest
+            WHERE fail_streak >= ? ORDER BY fail_streak DESC, name
+        """, (runs,)).fetchall()
+
+    def entry(self, name: str) -> list[tuple]:
+        """
+        The results of an entry over the runs, the most recent first
+        return: time, old version, new version, status, seconds
+        """
+        return self.db.execute("""
+            SELECT r.started, x.old_version, x.new_version, x.status, x.seconds
+            FROM results x JOIN runs r ON r.id = x.run_id
+            WHERE x.name = ? ORDER BY x.run_id DESC
+        """, (name,)).fetchall()
+
+
+def state_changed(last: dict[str, tuple[str | None, str]] | None,
+                  name: str, new: RichResult) -> bool:
+    """
+    Whether a result differs from the last recorded version or status
+    """
+    if last is None:
+        return True
+    return last.get(name) != (new.version, 'ok')
+
+
+def format_last_new(rows: list[tuple[str, str | None, str, float]]) -> str:
+    """
+    The result of HistoryStore.last_new as a markdown table
+    """
+    res = ["""
+| Product Triple | Product | Version | Found |
+| -------------- | ------- | ------- | ----- |
+"""]
+    for name, product, version, started in rows:
+        found = time.strftime('%Y-%m-%d %H:%M', time.gmtime(started))
+        res.append(f"| {name} | {product or 'N/A'} | {version} | {found} |\n")
+    return "".join(res)
+
+
+def format_failing(rows: list[tuple[str, int, str]]) -> str:
+    """
+    The result of HistoryStore.failing as a markdown table
+    """
+    res = ["""
+| Product Triple | Failed Runs | Last Status |
+| -------------- | ----------- | ----------- |
+"""]
+    for name, streak, status in rows:
+        res.append(f"| {name} | {streak} | {status} |\n")
+    return "".join(res)
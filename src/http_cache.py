@@ -0,0 +1,233 @@
+"""
+On-disk http response cache with conditional requests (ETag / Last-Modified)
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Optional, Dict
+
+from tornado.httputil import HTTPHeaders
+from nvchecker.httpclient.base import BaseSession, Response
+
+from .http_session import SessionWrapper
+from .streaming import BodyConsumer, body_consumer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 0
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+class HttpCache:
+    """
+    Size bounded LRU store of response bodies and their validators
+    """
+
+    def __init__(self, cache_dir: str, ttl: int = DEFAULT_TTL,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self.index: dict[str, dict] = {}
+        # url -> metadata of its latest response, built on first use
+        self._by_url: dict[str, dict] | None = None
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.isfile(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Dropping broken http cache index %s: %s",
+                               self.index_file, e)
+
+    @staticmethod
+    def make_key(method: str, url: str, headers: Dict[str, str], params=()) -> str:
+        """
+        Cache key of a request
+        """
+        raw = json.dumps([method, url, sorted(headers.items()), list(params)],
+                         default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _body_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.body')
+
+    def get(self, key: str) -> Optional[tuple[dict, bytes]]:
+        """
+        Get the metadata and body of a cached response
+        """
+        meta = self.index.get(key)
+        if meta is None:
+            return None
+        try:
+            with open(self._body_path(key), 'rb') as f:
+                body = f.read()
+        except OSError:
+            del self.index[key]
+            return None
+        meta['accessed'] = time.time()
+        return meta, body
+
+    def latest(self, url: str) -> Optional[dict]:
+        """
+        Metadata of the latest response stored for a GET of url, whatever the
+        headers of the request, which only the session adding them knows
+        """
+        if self._by_url is None:
+            self._by_url = {}
+            for meta in sorted(self.index.values(), key=lambda m: m['stored']):
+                self._by_url[meta['url']] = meta
+        return self._by_url.get(url)
+
+    def is_fresh(self, meta: dict) -> bool:
+        """
+        Whether a cached response may be served without revalidation
+        """
+        return self.ttl > 0 and time.time() - meta['stored'] < self.ttl
+
+    def touch(self, key: str):
+        """
+        Mark a cached response as revalidated
+        """
+        if key in self.index:
+            self.index[key]['stored'] = time.time()
+
+    def put(self, key: str, url: str, headers: HTTPHeaders, body: bytes):
+        """
+        Store a response
+        """
+        with open(self._body_path(key), 'wb') as f:
+            f.write(body)
+        self._by_url = None
+        now = time.time()
+        self.index[key] = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'headers': list(headers.get_all()),
+            'size': len(body),
+            'stored': now,
+            'accessed': now,
+        }
+
+    def evict(self):
+        """
+        Drop the least recently used responses until the cache fits max_size
+        """
+        total = sum(m['size'] for m in self.index.values())
+        if total <= self.max_size:
+            return
+        self._by_url = None
+        for key, meta in sorted(self.index.items(),
+                                key=lambda kv: kv[1]['accessed']):
+            if total <= self.max_size:
+                break
+            total -= meta['size']
+            del self.index[key]
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+
+    def save(self):
+        """
+        Evict and write the index back to disk
+        """
+        self.evict()
+        tmp = self.index_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_file)
+
+
+class _Buffer(BodyConsumer):
+    """
+    Keeps the whole body, streaming it tells the status of the response
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.chunks: list[bytes] = []
+
+    def feed(self, chunk: bytes) -> bool:
+        self.chunks.append(chunk)
+        return True
+
+    @property
+    def body(self) -> bytes:
+        return b''.join(self.chunks)
+
+
+def not_modified(res: Response) -> bool:
+    """
+    Whether the response to a conditional request is a 304
+    """
+    code = getattr(res, 'code', None)
+    if code is not None:
+        return code == 304
+    # the backend hides the status: a 304 has no body and, unlike an
+    # empty listing, no content type
+    return not res.body and 'Content-Type' not in res.headers
+
+
+class CachedSession(SessionWrapper):
+    """
+    Session serving GET requests from an HttpCache, revalidating stale ones
+    """
+
+    def __init__(self, inner: BaseSession, cache: HttpCache):
+        super().__init__(inner)
+        self.cache = cache
+
+    async def request_impl(self, url: str, *, method: str, headers={},
+                           params=(), json=None, body=None, **kwargs) -> Response:
+        # streamed bodies are never buffered, so never cached
+        if method != 'GET' or json is not None or body is not None \
+                or body_consumer.get() is not None:
+            return await super().request_impl(
+                url, method=method, headers=headers, params=params,
+                json=json, body=body, **kwargs)
+
+        key = HttpCache.make_key(method, url, headers, params)
+        cached = self.cache.get(key)
+        req_headers = dict(headers)
+        if cached is not None:
+            meta, cached_body = cached
+            if self.cache.is_fresh(meta):
+                logger.debug("http cache hit: %s", url)
+                return Response(HTTPHeaders(meta['headers']), cached_body)
+            if meta['etag']:
+                req_headers['If-None-Match'] = meta['etag']
+            if meta['last_modified']:
+                req_headers['If-Modified-Since'] = meta['last_modified']
+
+        if len(req_headers) == len(headers):
+            res = await super().request_impl(
+                url, method=method, headers=req_headers, params=params, **kwargs)
+        else:
+            # the backends hide the status code, streamed responses keep it
+            buf = _Buffer()
+            token = body_consumer.set(buf)
+            try:
+                res = await super().request_impl(
+                    url, method=method, headers=req_headers, params=params, **kwargs)
+            finally:
+                body_consumer.reset(token)
+            if not_modified(res):
+                logger.debug("http cache revalidated: %s", url)
+                self.cache.touch(key)
+                return Response(HTTPHeaders(meta['headers']), cached_body)
+            res = Response(res.headers, buf.body)
+
+        res_headers = res.headers if isinstance(res.headers, HTTPHeaders) \
+            else HTTPHeaders(res.headers)
+        if self.cache.ttl > 0 or res_headers.get('ETag') \
+                or res_headers.get('Last-Modified'):
+            self.cache.put(key, url, res_headers, res.body)
+        return res
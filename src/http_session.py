@@ -0,0 +1,68 @@
+"""
+Layers wrapped around the nvchecker http session
+
+nvchecker sources all use the `session` proxy from nvchecker.httpclient,
+so wrapping the object behind it changes every request made by the checker.
+"""
+
+from typing import Callable, Optional, Dict
+
+from nvchecker.httpclient import session
+from nvchecker.httpclient.base import BaseSession, Response
+
+
+class SessionWrapper(BaseSession):
+    """
+    A session delegating every request to the session it wraps
+    """
+
+    def __init__(self, inner: BaseSession):
+        self.inner = inner
+
+    def setup(self, concurreny: int = 20, timeout: int = 20) -> None:
+        self.inner.setup(concurreny, timeout)
+
+    async def request_impl(
+        self, url: str, *,
+        method: str,
+        proxy: Optional[str] = None,
+        headers: Dict[str, str] = {},
+        follow_redirects: bool = True,
+        params=(),
+        json=None,
+        body=None,
+        verify_cert: bool = True,
+    ) -> Response:
+        return await self.inner.request_impl(
+            url,
+            method=method,
+            proxy=proxy,
+            headers=headers,
+            follow_redirects=follow_redirects,
+            params=params,
+            json=json,
+            body=body,
+            verify_cert=verify_cert,
+        )
+
+
+def install(factory: Callable[[BaseSession], BaseSession]) -> BaseSession:
+    """
+    Wrap the current nvchecker session with the session built by factory
+    return: the installed session
+    """
+    wrapped = factory(session._obj)
+    session.set_obj(wrapped)
+    return wrapped
+
+
+def find_layer(cls: type) -> Optional[BaseSession]:
+    """
+    Find the installed layer of the given type
+    """
+    cur = session._obj
+    while cur is not None:
+        if isinstance(cur, cls):
+            return cur
+        cur = getattr(cur, 'inner', None)
+    return None
@@ -0,0 +1,116 @@
+"""
+Time the imports of a run, like `python -X importtime` but for the modules
+imported once the command line is parsed
+"""
+
+import sys
+import time
+import threading
+from importlib.abc import MetaPathFinder
+
+
+class _TimedLoader:
+    """
+    Loader executing a module through another loader, timing it
+    """
+
+    def __init__(self, loader, profiler: 'ImportProfiler'):
+        self.loader = loader
+        self.profiler = profiler
+
+    def __getattr__(self, name: str):
+        # get_resource_reader, is_package, ... of the wrapped loader
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self.profiler.stack()
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            self.profiler.record(module.__name__, total - children, total,
+                                 top_level=not stack)
+
+
+class ImportProfiler(MetaPathFinder):
+    """
+    Record the time spent executing every module imported while installed
+    """
+
+    def __init__(self):
+        # module -> (seconds in the module itself, seconds with its imports)
+        self.times: dict[str, tuple[float, float]] = {}
+        self.total = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def stack(self) -> list[float]:
+        """
+        Time spent in the imports of each module being executed, per thread
+        """
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def record(self, name: str, self_time: float, total: float, top_level: bool):
+        """
+        Record the import of a module
+        """
+        with self._lock:
+            self.times[name] = (self_time, total)
+            if top_level:
+                self.total += total
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, 'finding', False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+        # namespace packages have nothing to execute
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def start(self) -> 'ImportProfiler':
+        """
+        Start timing the imports
+        """
+        sys.meta_path.insert(0, self)
+        return self
+
+    def stop(self):
+        """
+        Stop timing the imports
+        """
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def report(self, n: int = 25) -> str:
+        """
+        The n modules whose imports took longest, as a markdown table
+        """
+        lines = [f"Imports took {self.total:.3f}s in total",
+                 f"| {'Cumulative (ms)':>15} | {'Self (ms)':>9} | Module |",
+                 f"| {'-' * 15} | {'-' * 9} | ------ |"]
+        slowest = sorted(self.times.items(), key=lambda kv: -kv[1][1])[:n]
+        lines += [f"| {total * 1e3:>15.1f} | {self_time * 1e3:>9.1f} | {name} |"
+                  for name, (self_time, total) in slowest]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,213 @@
+"""
+Sync the image check issues with a local index of the known ones
+
+An issue whose key is unknown is created, a known one is updated when its
+body changed, e.g. the old version of the product, and else left alone.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from .github_action import GithubRepoManager, Issue
+
+logger = logging.getLogger(__name__)
+
+ISSUE_LABEL = "image-check"
+TITLE_RE = re.compile(
+    r'^\[Image Check\] (?P<product>[^:]+):(?P<system>\S+) has new version (?P<version>.+)$')
+KEY_MARKER_RE = re.compile(r'<!-- image-check-key: (?P<key>.+?) -->')
+
+# GitHub asks for at least a second between content creating requests
+DEFAULT_MIN_INTERVAL = 1.0
+DEFAULT_WORKERS = 4
+
+
+def issue_key(product: str, system: str, version: str) -> str:
+    """
+    Stable key of the issue of a new version of a product and system
+    """
+    return f"{product}:{system}@{version}"
+
+
+def key_of(issue: Issue) -> str | None:
+    """
+    The key of an existing issue, from its marker or else its title
+    """
+    if issue.body and (m := KEY_MARKER_RE.search(issue.body)):
+        return m.group('key')
+    if m := TITLE_RE.match(issue.title):
+        return issue_key(m.group('product'), m.group('system'), m.group('version'))
+    return None
+
+
+def key_marker(key: str) -> str:
+    """
+    Hidden marker identifying an issue by its key
+    """
+    return f"<!-- image-check-key: {key} -->"
+
+
+class IssueIndex:
+    """
+    Keys of the known image check issues, with their number and body, and
+    the time of the last sync
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.synced_at: datetime | None = None
+        self.issues: dict[str, dict] = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.issues = data['issues']
+                if data.get('synced_at'):
+                    self.synced_at = datetime.fromisoformat(data['synced_at'])
+            except (OSError, json.JSONDecodeError, KeyError, ValueError) as e:
+                logger.warning("Dropping broken issue index %s: %s", path, e)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.issues
+
+    def add(self, key: str, issue: Issue):
+        """
+        Record an issue
+        """
+        self.issues[key] = {'title': issue.title, 'url': issue.url,
+                            'number': issue.number, 'body': issue.body}
+
+    def save(self):
+        """
+        Write the index back to disk
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'synced_at': self.synced_at.isoformat() if self.synced_at else None,
+                'issues': self.issues,
+            }, f)
+        os.replace(tmp, self.path)
+
+
+class IssueSync:
+    """
+    Create the issues which are not known yet and update the known ones
+    whose body changed, concurrently but paced
+    """
+
+    def __init__(self, repo: GithubRepoManager, index: IssueIndex,
+                 workers: int = DEFAULT_WORKERS,
+                 min_interval: float = DEFAULT_MIN_INTERVAL):
+        self.repo = repo
+        self.index = index
+        self.workers = workers
+        self.min_interval = min_interval
+        self._pace_lock = threading.Lock()
+        self._last_request = 0.0
+        self._pool: ThreadPoolExecutor | None = None
+        self._refreshed: Future | None = None
+        self._futures: dict[str, Future] = {}
+        self._existing: set[str] = set()
+
+    def refresh(self):
+        """
+        Fetch the image check issues updated since the last sync
+        """
+        started = datetime.now(timezone.utc)
+        n = 0
+        for issue in self.repo.get_issues_since(self.index.synced_at, ISSUE_LABEL):
+            key = key_of(issue)
+            if key is not None:
+                self.index.add(key, issue)
+                n += 1
+        self.index.synced_at = started
+        logger.info("Fetched %d updated issues, %d known",
+                    n, len(self.index.issues))
+
+    def _pace(self):
+        with self._pace_lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request = time.monotonic()
+
+    def _sync_one(self, key: str, issue: Issue) -> str | None:
+        self._refreshed.result()
+        issue.body = (issue.body or "") + key_marker(key) + "\n"
+        known = self.index.issues.get(key)
+        if known is not None:
+            # issues created by this run are only numbered by the next sync
+            if known.get('number') is None or known.get('body') == issue.body:
+                logger.info("Issue already exists: %s", issue.title)
+                self._existing.add(key)
+                return None
+            issue.number = known['number']
+            self._pace()
+            url = self.repo.update_issue(issue)
+        else:
+            self._pace()
+            url = self.repo.create_issue(issue)
+        if url:
+            issue.url = url
+            self.index.add(key, issue)
+        return url
+
+    def start(self):
+        """
+        Start fetching the known issues in the background, issues can be
+        submitted right away
+        """
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._refreshed = self._pool.submit(self.refresh)
+        self._futures = {}
+        self._existing = set()
+
+    def submit(self, key: str, issue: Issue):
+        """
+        Create or update an issue in the background
+        """
+        if key not in self._futures:
+            self._futures[key] = self._pool.submit(self._sync_one, key, issue)
+
+    def finish(self) -> dict[str, str | None]:
+        """
+        Wait for the submitted issues and save the index
+        return: key -> url of the created or updated issue, None on failure
+        """
+        self._pool.shutdown(wait=True)
+        try:
+            self._refreshed.result()
+        except Exception as e:
+            # without the known issues none was created, the index is still
+            # saved for the ones of the last runs
+            logger.error("Failed to fetch the known issues: %s", e)
+        res = {}
+        for k, fu in self._futures.items():
+            if k in self._existing:
+                continue
+            try:
+                res[k] = fu.result()
+            except Exception as e:
+                logger.error("Failed to sync issue %s: %s", k, e)
+                res[k] = None
+        self.index.save()
+        return res
+
+    def sync(self, issues: dict[str, Issue]) -> dict[str, str | None]:
+        """
+        Create the issues whose keys are not in the index, update the others
+        :param issues: key -> issue to create
+        return: key -> url of the created or updated issue, None on failure
+        """
+        self.start()
+        for k, v in issues.items():
+            self.submit(k, v)
+        return self.finish()
@@ -0,0 +1,305 @@
+"""
+Timings of a run per phase, per entry and per host
+
+Exported as a Prometheus textfile, a Chrome trace-event timeline and
+summarized in the report. The per-entry and per-host latencies are also
+kept in a history file, as estimates for later runs.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+from nvchecker.httpclient.base import Response, TemporaryError
+
+from .http_session import SessionWrapper
+from .streaming import StreamedResponse
+
+logger = logging.getLogger(__name__)
+
+# name of the entry whose check is running in the current task
+current_entry: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    'current_entry', default=None)
+# whether the current request is a retry of an earlier one, set by RetrySession
+retrying: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    'retrying', default=False)
+
+# weight of the latest run in the latency history
+HISTORY_WEIGHT = 0.3
+
+
+@dataclass
+class EntryStats:
+    """
+    Timings of the check of one entry
+    """
+    source: str = 'none'
+    queue_wait: float = 0.0
+    seconds: float = 0.0
+    requests: int = 0
+    bytes: int = 0
+    status: str = 'ok'
+
+
+@dataclass
+class HostStats:
+    """
+    Requests made to one host
+    """
+    requests: int = 0
+    attempts: int = 0
+    errors: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+    @property
+    def retries(self) -> int:
+        return self.attempts - self.requests
+
+
+class Recorder:
+    """
+    Collects spans and entry and host statistics of one run
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events: list[dict] = []
+        self.phases: dict[str, float] = {}
+        self.entries: dict[str, EntryStats] = {}
+        self.hosts: dict[str, HostStats] = {}
+        self._lock = threading.Lock()
+
+    def _ts(self, t: float) -> float:
+        return (t - self.origin) * 1e6
+
+    def add_span(self, name: str, cat: str, start: float, end: float, **args):
+        """
+        Add a complete trace event, start and end from time.perf_counter
+        """
+        with self._lock:
+            self.events.append({
+                'name': name, 'cat': cat, 'ph': 'X',
+                'ts': self._ts(start), 'dur': (end - start) * 1e6,
+                'pid': os.getpid(), 'tid': threading.get_ident(),
+                'args': args,
+            })
+
+    @contextmanager
+    def span(self, name: str, cat: str = 'phase', **args):
+        """
+        Time a block, phases are also summed per name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.add_span(name, cat, start, end, **args)
+            if cat == 'phase':
+                with self._lock:
+                    self.phases[name] = self.phases.get(name, 0.0) + end - start
+
+    def entry(self, name: str) -> EntryStats:
+        """
+        The statistics of an entry
+        """
+        with self._lock:
+            return self.entries.setdefault(name, EntryStats())
+
+    def host(self, host: str) -> HostStats:
+        """
+        The statistics of a host
+        """
+        with self._lock:
+            return self.hosts.setdefault(host, HostStats())
+
+    def slowest_entries(self, n: int = 10) -> list[tuple[str, EntryStats]]:
+        """
+        The n entries whose checks took longest
+        """
+        return sorted(self.entries.items(), key=lambda kv: -kv[1].seconds)[:n]
+
+    def slowest_hosts(self, n: int = 10) -> list[tuple[str, HostStats]]:
+        """
+        The n hosts with the most total request time
+        """
+        return sorted(self.hosts.items(), key=lambda kv: -kv[1].seconds)[:n]
+
+    def write_trace(self, path: str):
+        """
+        Write a Chrome trace-event json, for chrome://tracing or Perfetto
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, f)
+
+    def write_prometheus(self, path: str):
+        """
+        Write a Prometheus textfile collector file
+        """
+        def esc(v: str) -> str:
+            return v.replace('\\', '\\\\').replace('"', '\\"')
+
+        lines = [
+            '# HELP image_checker_phase_seconds Time spent in a phase of the run',
+            '# TYPE image_checker_phase_seconds gauge',
+        ]
+        lines += [f'image_checker_phase_seconds{{phase="{esc(k)}"}} {v:.6f}'
+                  for k, v in self.phases.items()]
+        lines += [
+            '# HELP image_checker_entry_seconds Time spent checking an entry',
+            '# TYPE image_checker_entry_seconds gauge',
+        ]
+        lines += [f'image_checker_entry_seconds{{entry="{esc(k)}",source="{esc(v.source)}",status="{v.status}"}} {v.seconds:.6f}'
+                  for k, v in self.entries.items()]
+        lines += [
+            '# HELP image_checker_entry_queue_wait_seconds Time an entry waited for a free slot',
+            '# TYPE image_checker_entry_queue_wait_seconds gauge',
+        ]
+        lines += [f'image_checker_entry_queue_wait_seconds{{entry="{esc(k)}"}} {v.queue_wait:.6f}'
+                  for k, v in self.entries.items()]
+        for metric, kind, help_, attr in (
+            ('host_requests_total', 'counter', 'Requests made to a host', 'requests'),
+            ('host_retries_total', 'counter', 'Retried requests to a host', 'retries'),
+            ('host_errors_total', 'counter', 'Failed request attempts to a host', 'errors'),
+            ('host_bytes_total', 'counter', 'Response bytes received from a host', 'bytes'),
+            ('host_request_seconds_total', 'counter', 'Total request time to a host', 'seconds'),
+        ):
+            lines += [f'# HELP image_checker_{metric} {help_}',
+                      f'# TYPE image_checker_{metric} {kind}']
+            lines += [f'image_checker_{metric}{{host="{esc(k)}"}} {getattr(v, attr)}'
+                      for k, v in self.hosts.items()]
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, path)
+
+    def save_history(self, path: str):
+        """
+        Fold the latencies of this run into the latency history
+        """
+        history = load_history(path)
+        for kind, stats in (('entries', {k: v.seconds for k, v in self.entries.items()
+                                         if v.status == 'ok'}),
+                            ('hosts', {k: v.seconds / v.requests for k, v in self.hosts.items()
+                                       if v.requests})):
+            known = history.setdefault(kind, {})
+            for k, v in stats.items():
+                old = known.get(k)
+                known[k] = v if old is None else old + HISTORY_WEIGHT * (v - old)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(history, f)
+        os.replace(tmp, path)
+
+
+def load_history(path: str) -> dict[str, dict[str, float]]:
+    """
+    Smoothed latencies of earlier runs, {'entries': {...}, 'hosts': {...}}
+    """
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning("Dropping broken latency history %s: %s", path, e)
+        return {}
+
+
+recorder = Recorder()
+
+
+def reset() -> Recorder:
+    """
+    Start recording a new run
+    """
+    global recorder
+    recorder = Recorder()
+    return recorder
+
+
+async def traced(aw, name: str, cat: str = 'task', **args):
+    """
+    Await aw inside a span
+    """
+    with recorder.span(name, cat, **args):
+        return await aw
+
+
+def timed(func, dispatched: float):
+    """
+    Wrap a source get_version, recording the check of every entry
+    :param dispatched: time.perf_counter() when the entries were dispatched
+    """
+    async def get_version(name: str, conf: dict, **kwargs):
+        rec = recorder
+        stats = rec.entry(name)
+        stats.source = conf.get('source', 'none')
+        start = time.perf_counter()
+        stats.queue_wait = start - dispatched
+        token = current_entry.set(name)
+        try:
+            return await func(name, conf, **kwargs)
+        except BaseException as e:
+            stats.status = type(e).__name__
+            raise
+        finally:
+            current_entry.reset(token)
+            end = time.perf_counter()
+            stats.seconds = end - start
+            rec.add_span(name, 'entry', start, end, source=stats.source,
+                         queue_wait=stats.queue_wait, status=stats.status)
+    return get_version
+
+
+class MetricsSession(SessionWrapper):
+    """
+    Session recording latency, size, retries and errors per host and entry
+    """
+
+    async def request(self, url: str, **kwargs) -> Response:
+        if retrying.get():
+            return await super().request(url, **kwargs)
+        rec = recorder
+        rec.host(urlparse(url).hostname or '').requests += 1
+        name = current_entry.get()
+        if name is not None:
+            rec.entry(name).requests += 1
+        return await super().request(url, **kwargs)
+
+    async def request_impl(self, url: str, **kwargs) -> Response:
+        rec = recorder
+        host = urlparse(url).hostname or ''
+        stats = rec.host(host)
+        stats.attempts += 1
+        start = time.perf_counter()
+        try:
+            res = await super().request_impl(url, **kwargs)
+        except BaseException as e:
+            stats.errors += 1
+            end = time.perf_counter()
+            stats.seconds += end - start
+            rec.add_span(host, 'http', start, end, url=url,
+                         error=type(e).__name__,
+                         temporary=isinstance(e, TemporaryError))
+            raise
+        end = time.perf_counter()
+        size = res.size if isinstance(res, StreamedResponse) else len(res.body or b'')
+        stats.seconds += end - start
+        stats.latencies.append(end - start)
+        stats.bytes += size
+        name = current_entry.get()
+        if name is not None:
+            rec.entry(name).bytes += size
+        rec.add_span(host, 'http', start, end, url=url, bytes=size, entry=name)
+        return res
@@ -0,0 +1,231 @@
+"""
+Mirrors of upstream urls, with hedged requests and failover
+
+An entry lists alternative urls of its `url` in `mirrors`, and
+`__config__.mirrors.hosts` maps a host to hosts serving the same paths. A
+request to an url with mirrors goes to the healthiest of them first. If it
+has not answered within the p95 latency of its host, the next mirror is
+asked as well and the first valid response wins, a failed request moves on
+to the next mirror at once. Latencies and failures per host are kept in a
+file, so the next run starts with the fastest mirror.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from urllib.parse import urlparse
+
+from nvchecker.httpclient.base import BaseSession, Response, TemporaryError
+
+from .http_session import SessionWrapper
+from .streaming import body_consumer
+
+logger = logging.getLogger(__name__)
+
+# seconds before a hedged request while a host has too few latencies
+DEFAULT_HEDGE_AFTER = 2.0
+# latencies of a host needed before its p95 is used
+MIN_SAMPLES = 5
+# latencies kept per host
+WINDOW = 50
+# weight of the latest request in the failure rate of a host
+FAILURE_WEIGHT = 0.2
+
+# primary url -> mirror urls, of the entry whose check is running
+entry_mirrors: contextvars.ContextVar[dict[str, list[str]] | None] = \
+    contextvars.ContextVar('entry_mirrors', default=None)
+
+
+def with_mirrors(func):
+    """
+    Wrap a source get_version, making the `mirrors` of the checked entry
+    known to the MirrorSession
+    """
+    async def get_version(name: str, conf: dict, **kwargs):
+        mirrors = conf.get('mirrors')
+        if not mirrors or 'url' not in conf:
+            return await func(name, conf, **kwargs)
+        token = entry_mirrors.set({conf['url']: list(mirrors)})
+        try:
+            return await func(name, conf, **kwargs)
+        finally:
+            entry_mirrors.reset(token)
+    return get_version
+
+
+def _host(url: str) -> str:
+    # with the port, mirrors may share a host name
+    return urlparse(url).netloc
+
+
+class MirrorHealth:
+    """
+    Recent latencies and failure rate of every mirror host
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.hosts: dict[str, dict] = {}
+        if path is not None and os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.hosts = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Dropping broken mirror health %s: %s", path, e)
+
+    def record(self, host: str, seconds: float | None):
+        """
+        Record a request to a host, seconds is None if it failed
+        """
+        h = self.hosts.setdefault(host, {'latencies': [], 'failures': 0.0})
+        h['failures'] += FAILURE_WEIGHT * ((seconds is None) - h['failures'])
+        if seconds is not None:
+            h['latencies'] = (h['latencies'] + [seconds])[-WINDOW:]
+
+    def p95(self, host: str) -> float | None:
+        """
+        The 95th percentile of the latencies of a host, None without enough of them
+        """
+        lat = self.hosts.get(host, {}).get('latencies', [])
+        if len(lat) < MIN_SAMPLES:
+            return None
+        return sorted(lat)[min(int(len(lat) * 0.95), len(lat) - 1)]
+
+    def score(self, host: str, default: float) -> float:
+        """
+        Expected seconds until a host answers, failures count as retries
+        """
+        h = self.hosts.get(host)
+        if h is None or not h['latencies']:
+            return default
+        lat = sorted(h['latencies'])[len(h['latencies']) // 2]
+        return lat / max(1.0 - h['failures'], 0.05)
+
+    def save(self):
+        """
+        Write the health to disk
+        """
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.hosts, f)
+        os.replace(tmp, self.path)
+
+
+class MirrorSession(SessionWrapper):
+    """
+    Session spreading the requests to urls with mirrors over the mirrors
+
+    `options` is the `__config__.mirrors` table:
+        hosts: host -> hosts serving the same paths
+        hedge: whether slow requests are hedged, true by default
+        hedge_after: seconds before hedging while a host has no p95 yet
+    """
+
+    def __init__(self, inner: BaseSession, options: dict, health: MirrorHealth):
+        super().__init__(inner)
+        self.host_mirrors: dict[str, list[str]] = options.get('hosts', {})
+        self.hedge = options.get('hedge', True)
+        self.hedge_after = options.get('hedge_after', DEFAULT_HEDGE_AFTER)
+        self.health = health
+
+    def candidates(self, url: str) -> list[str]:
+        """
+        The url and its mirrors, the healthiest first
+        """
+        alts = list((entry_mirrors.get() or {}).get(url, []))
+        parsed = urlparse(url)
+        alts += [parsed._replace(netloc=host).geturl()
+                 for host in self.host_mirrors.get(parsed.hostname or '', [])]
+        if not alts:
+            return [url]
+        urls = list(dict.fromkeys([url] + alts))
+        # sorted is stable, the configured order breaks ties
+        return sorted(urls, key=lambda u: self.health.score(_host(u), self.hedge_after))
+
+    def hedge_delay(self, url: str) -> float:
+        """
+        Seconds to wait for a request before asking the next mirror
+        """
+        p95 = self.health.p95(_host(url))
+        return self.hedge_after if p95 is None else p95
+
+    async def _attempt(self, url: str, kwargs: dict) -> Response:
+        start = time.perf_counter()
+        try:
+            res = await super().request_impl(url, **kwargs)
+        except asyncio.CancelledError:
+            # beaten by another mirror, it took at least this long
+            self.health.record(_host(url), time.perf_counter() - start)
+            raise
+        except Exception:
+            self.health.record(_host(url), None)
+            raise
+        self.health.record(_host(url), time.perf_counter() - start)
+        return res
+
+    async def request_impl(self, url: str, **kwargs) -> Response:
+        urls = self.candidates(url)
+        if len(urls) == 1:
+            return await super().request_impl(url, **kwargs)
+        # a streamed body goes to one consumer, so one request at a time
+        if not self.hedge or body_consumer.get() is not None \
+                or kwargs.get('method') not in ('GET', 'HEAD'):
+            return await self._failover(urls, kwargs)
+        return await self._hedged(urls, kwargs)
+
+    async def _failover(self, urls: list[str], kwargs: dict) -> Response:
+        errors = []
+        for u in urls:
+            try:
+                return await self._attempt(u, kwargs)
+            except Exception as e:
+                logger.info("Mirror %s failed (%s), trying the next one", u, e)
+                errors.append(e)
+        raise self._error(errors)
+
+    async def _hedged(self, urls: list[str], kwargs: dict) -> Response:
+        running: dict[asyncio.Future, str] = {}
+        errors = []
+        pending = list(urls)
+
+        def launch():
+            u = pending.pop(0)
+            running[asyncio.ensure_future(self._attempt(u, kwargs))] = u
+
+        launch()
+        try:
+            while running:
+                last = list(running.values())[-1]
+                timeout = self.hedge_delay(last) if pending else None
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.debug("%s is slow, also asking %s", last, pending[0])
+                    launch()
+                    continue
+                for t in done:
+                    u = running.pop(t)
+                    if t.exception() is None:
+                        return t.result()
+                    logger.info("Mirror %s failed (%s)", u, t.exception())
+                    errors.append(t.exception())
+                    if pending:
+                        launch()
+            raise self._error(errors)
+        finally:
+            for t in running:
+                t.cancel()
+
+    @staticmethod
+    def _error(errors: list[Exception]) -> Exception:
+        # a temporary failure lets the caller retry all mirrors
+        for e in errors:
+            if isinstance(e, TemporaryError):
+                return e
+        return errors[0]
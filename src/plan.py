@@ -0,0 +1,286 @@
+"""
+Plan the upstream requests of a run without touching the network
+
+Lists the unique requests the checks would make, by host and source, with
+the entries each of them answers, what the incremental state and the http
+cache would serve, and an estimate of the wall time from the latency
+history. Requests fetched separately by several checks and slow checks are
+flagged, so config changes can be reviewed before they are merged.
+"""
+
+import os
+import heapq
+import logging
+from dataclasses import dataclass, field
+from urllib.parse import urlparse, quote, quote_plus
+
+from .utils import MatrixIndex
+from .state import CheckState
+from .http_cache import HttpCache
+from .config_snapshot import ConfigSnapshot
+from .shard import DEFAULT_LATENCY
+from .selector import Selector
+from .run_nvchecker import load_entries, coalesce_entries, matrix_version
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# estimated seconds of a check above which it is flagged
+DEFAULT_SLOW = 10.0
+# sources whose checks share one fetch of the same request within a run
+SHARED_FETCH_SOURCES = frozenset({'regex', 'github_batch'})
+
+
+@dataclass
+class PlannedRequest:
+    """
+    One upstream request of a run, and the checks making it
+    """
+    method: str
+    url: str
+    source: str
+    checks: list[str] = field(default_factory=list)
+    entries: int = 0
+    # fresh: served by the http cache, revalidate: conditional request,
+    # stream: never cached, fetch: full request
+    cache: str = 'fetch'
+    estimate: float = 0.0
+
+    @property
+    def host(self) -> str:
+        return urlparse(self.url).hostname or '-'
+
+
+@dataclass
+class Plan:
+    """
+    The requests of a run and its estimated wall time
+    """
+    requests: list[PlannedRequest]
+    entries: int
+    checks: int
+    reused: int
+    max_concurrency: int
+    wall: float
+    deadline: float | None
+    warnings: list[str]
+
+
+def request_of(entry: dict) -> tuple[str, str] | None:
+    """
+    The main request of an entry, as nvchecker's source would make it
+    return: method and url, None for the sources without a known request
+    """
+    source = entry.get('source', 'none')
+    if 'url' in entry and source in ('regex', 'regex_stream', 'htmlparser', 'jq'):
+        return ('POST' if entry.get('post_data') is not None else 'GET'), entry['url']
+    if source == 'httpheader' and 'url' in entry:
+        return entry.get('method', 'HEAD'), entry['url']
+    if source == 'github' and 'github' in entry:
+        host = entry.get('host', 'github.com')
+        if entry.get('use_max_tag') or entry.get('use_max_release'):
+            return 'POST', f"https://api.{host}/graphql"
+        if entry.get('use_latest_release'):
+            return 'GET', f"https://api.{host}/repos/{entry['github']}/releases/latest"
+        return 'GET', f"https://api.{host}/repos/{entry['github']}/commits"
+    if source == 'github_batch' and 'github' in entry:
+        from .sources.github_batch import batchable, graphql_url
+        host = entry.get('host', 'github.com')
+        if batchable(entry):
+            return 'POST', graphql_url(host)
+        return request_of({**entry, 'source': 'github'})
+    if source == 'gitlab' and 'gitlab' in entry:
+        host = entry.get('host', 'gitlab.com')
+        kind = 'tags' if entry.get('use_max_tag') else 'commits'
+        return 'GET', f"https://{host}/api/v4/projects/{quote_plus(entry['gitlab'])}/repository/{kind}"
+    if source == 'gitea' and 'gitea' in entry:
+        host = entry.get('host', 'gitea.com')
+        kind = 'tags' if entry.get('use_max_tag') else 'commits'
+        return 'GET', f"https://{host}/api/v1/repos/{quote(entry['gitea'])}/{kind}"
+    if source == 'pypi' and 'pypi' in entry:
+        return 'GET', f"https://pypi.org/pypi/{entry['pypi']}/json"
+    return None
+
+
+def cache_status(cache: HttpCache | None, source: str, method: str, url: str) -> str:
+    """
+    How the http cache would answer a request
+    """
+    if source == 'regex_stream':
+        return 'stream'
+    if cache is None or method != 'GET':
+        return 'fetch'
+    # the cached requests carry the User-Agent and tokens nvchecker adds
+    meta = cache.latest(url)
+    if meta is None:
+        return 'fetch'
+    if cache.is_fresh(meta):
+        return 'fresh'
+    if meta.get('etag') or meta.get('last_modified'):
+        return 'revalidate'
+    return 'fetch'
+
+
+def estimate_wall(estimates: list[float], concurrency: int) -> float:
+    """
+    Wall time of checks run longest first on concurrency slots
+    """
+    slots = [0.0] * max(concurrency, 1)
+    for e in sorted(estimates, reverse=True):
+        heapq.heapreplace(slots, slots[0] + e)
+    return max(slots)
+
+
+def make_plan(conf_dir: str, matrix_dir: str, oldvers: dict,
+              matrix: MatrixIndex | None = None,
+              cache_dir: str | None = None,
+              incremental: bool = False,
+              selector: Selector | None = None) -> Plan:
+    """
+    Plan the requests of a run with the same configs, caches and options
+    """
+    entries, options, extra_options, _, _ = load_entries(
+        conf_dir, matrix_dir, matrix,
+        ConfigSnapshot(os.path.join(cache_dir, 'configs.pickle'))
+        if cache_dir is not None else None,
+        selector,
+    )
+    total = len(entries)
+
+    reused = 0
+    if incremental and cache_dir is not None:
+        state = CheckState(os.path.join(cache_dir, 'state.json'),
+                           extra_options.get('incremental'))
+        fresh = {name for name, entry in entries.items()
+                 if state.is_fresh(name, entry, matrix_version(oldvers, name))}
+        reused = len(fresh)
+        entries = {k: v for k, v in entries.items() if k not in fresh}
+
+    cache = None
+    c = extra_options.get('http_cache', {})
+    if cache_dir is not None and c.get('enabled', True) \
+            and os.path.isfile(os.path.join(cache_dir, 'http', 'index.json')):
+        cache = HttpCache(os.path.join(cache_dir, 'http'), ttl=c.get('ttl', 0))
+    history = metrics.load_history(os.path.join(cache_dir, 'latency.json')) \
+        if cache_dir is not None else {}
+    entry_history = history.get('entries', {})
+    host_history = history.get('hosts', {})
+
+    unique, groups = coalesce_entries(entries)
+    requests: dict[tuple, PlannedRequest] = {}
+    estimates = []
+    host_estimates: dict[str, list[float]] = {}
+    for rep, entry in unique.items():
+        source = entry.get('source', 'none')
+        target = request_of(entry)
+        if target is None:
+            method, url = '-', f"{source}:"
+        else:
+            method, url = target
+        req = requests.get((source, method, url))
+        if req is None:
+            req = requests[(source, method, url)] = PlannedRequest(
+                method, url, source,
+                cache=cache_status(cache, source, method, url))
+        req.checks.append(rep)
+        req.entries += len(groups[rep])
+
+        known = [entry_history[n] for n in groups[rep] if n in entry_history]
+        if req.cache == 'fresh':
+            estimate = 0.0
+        elif known:
+            estimate = sum(known) / len(known)
+        else:
+            estimate = host_history.get(req.host, DEFAULT_LATENCY)
+        # checks sharing one fetch only wait for it once
+        if source in SHARED_FETCH_SOURCES and len(req.checks) > 1:
+            estimate = 0.0
+        req.estimate += estimate
+        estimates.append(estimate)
+        host_estimates.setdefault(req.host, []).append(estimate)
+
+    # the run is at least as long as the checks of its busiest capped host
+    limits = extra_options.get('limits', {})
+    wall = estimate_wall(estimates, options.max_concurrency)
+    for host, host_est in host_estimates.items():
+        if host == '-':
+            continue
+        cap = limits.get('hosts', {}).get(host, limits.get('default_host', {})) \
+            .get('concurrency')
+        if cap:
+            wall = max(wall, estimate_wall(host_est, cap))
+
+    slow = extra_options.get('plan', {}).get('slow', DEFAULT_SLOW)
+    warnings = []
+    for req in requests.values():
+        if len(req.checks) > 1 and req.source not in SHARED_FETCH_SOURCES \
+                and req.method != '-':
+            warnings.append(f"{req.method} {req.url} is fetched by {len(req.checks)} "
+                            f"checks: {', '.join(sorted(req.checks))}")
+        if req.estimate / len(req.checks) > slow:
+            warnings.append(f"{req.method} {req.url} takes about "
+                            f"{req.estimate / len(req.checks):.1f}s per check "
+                            f"({', '.join(sorted(req.checks))})")
+
+    deadline = extra_options.get('deadline')
+    return Plan(
+        requests=sorted(requests.values(), key=lambda r: (r.host, r.source, r.url)),
+        entries=total,
+        checks=len(unique),
+        reused=reused,
+        max_concurrency=options.max_concurrency,
+        wall=wall,
+        deadline=deadline,
+        warnings=warnings,
+    )
+
+
+def format_plan(plan: Plan) -> str:
+    """
+    The plan as a markdown report
+    """
+    fetched = sum(1 for r in plan.requests if r.cache != 'fresh' and r.method != '-')
+    res = [f"""
+# Fetch Plan
+
+{plan.entries} entries, {plan.reused} reused from the state, {plan.checks} checks
+making {fetched} requests, estimated {plan.wall:.1f}s with {plan.max_concurrency} at once
+"""]
+    if plan.deadline is not None and plan.wall > plan.deadline:
+        res.append(f"\nThe estimate is over the deadline of {plan.deadline}s\n")
+
+    by_host: dict[tuple[str, str], list[PlannedRequest]] = {}
+    for r in plan.requests:
+        by_host.setdefault((r.host, r.source), []).append(r)
+    res.append("""
+## Requests by Host
+
+| Host | Source | Requests | Checks | Entries | Cached | Estimate (s) |
+| ---- | ------ | -------- | ------ | ------- | ------ | ------------ |
+""")
+    for (host, source), reqs in by_host.items():
+        cached = sum(1 for r in reqs if r.cache in ('fresh', 'revalidate'))
+        res.append(f"| {host} | {source} | {len(reqs)} | {sum(len(r.checks) for r in reqs)} "
+                   f"| {sum(r.entries for r in reqs)} | {cached} "
+                   f"| {sum(r.estimate for r in reqs):.1f} |\n")
+
+    res.append("""
+## Requests
+
+| Method | URL | Source | Checks | Entries | Cache | Estimate (s) |
+| ------ | --- | ------ | ------ | ------- | ----- | ------------ |
+""")
+    for r in plan.requests:
+        res.append(f"| {r.method} | {r.url} | {r.source} | {len(r.checks)} "
+                   f"| {r.entries} | {r.cache} | {r.estimate:.1f} |\n")
+
+    if plan.warnings:
+        res.append("""
+## Warnings
+
+""")
+        for w in plan.warnings:
+            res.append(f"- {w}\n")
+
+    res.append("\n")
+    return "".join(res)
@@ -0,0 +1,124 @@
+"""
+Per-host and per-source concurrency caps and request rate limits
+"""
+
+import time
+import asyncio
+import logging
+from urllib.parse import urlparse
+
+from nvchecker.httpclient.base import BaseSession, Response
+
+from .http_session import SessionWrapper
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Allow `rate` requests per second on average, with bursts up to `burst`
+    """
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock: asyncio.Lock | None = None
+
+    async def acquire(self):
+        """
+        Wait for and take one token
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostLimit:
+    """
+    Concurrency cap and token bucket of one host
+    """
+
+    def __init__(self, concurrency: int | None = None, rate: float | None = None,
+                 burst: int | None = None):
+        self.sem = asyncio.Semaphore(concurrency) if concurrency else None
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+    async def __aenter__(self):
+        if self.sem is not None:
+            await self.sem.acquire()
+        if self.bucket is not None:
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                if self.sem is not None:
+                    self.sem.release()
+                raise
+
+    async def __aexit__(self, *exc):
+        if self.sem is not None:
+            self.sem.release()
+
+
+class RateLimitedSession(SessionWrapper):
+    """
+    Session applying the limit of the requested host around every request
+
+    `limits` is the `__config__.limits` table:
+        hosts: host -> {concurrency, rate, burst}
+        default_host: {concurrency, rate, burst} for all other hosts
+    """
+
+    def __init__(self, inner: BaseSession, limits: dict):
+        super().__init__(inner)
+        self.host_configs: dict[str, dict] = limits.get('hosts', {})
+        self.default_host: dict = limits.get('default_host', {})
+        self.host_limits: dict[str, HostLimit] = {}
+
+    def limit_for(self, url: str) -> HostLimit:
+        """
+        The limit of the host of an url
+        """
+        host = urlparse(url).hostname or ''
+        limit = self.host_limits.get(host)
+        if limit is None:
+            c = self.host_configs.get(host, self.default_host)
+            limit = HostLimit(c.get('concurrency'), c.get('rate'), c.get('burst'))
+            self.host_limits[host] = limit
+        return limit
+
+    async def request_impl(self, url: str, **kwargs) -> Response:
+        async with self.limit_for(url):
+            return await super().request_impl(url, **kwargs)
+
+
+class SourceSemaphore:
+    """
+    Hold the global task semaphore and the cap of one source plugin together
+    """
+
+    def __init__(self, task_sem: asyncio.Semaphore, concurrency: int):
+        self.task_sem = task_sem
+        self.source_sem = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        await self.source_sem.acquire()
+        try:
+            await self.task_sem.acquire()
+        except BaseException:
+            self.source_sem.release()
+            raise
+
+    async def __aexit__(self, *exc):
+        self.task_sem.release()
+        self.source_sem.release()
@@ -0,0 +1,190 @@
+"""
+Record upstream responses into a fixture archive and replay them offline
+
+Recording wraps the real http backend, with the http cache off so every
+response is recorded in full rather than as a revalidation. Replaying sends every request to a
+local http stand-in serving the archive, with configurable latency and
+jitter, so the whole http stack of the checker is still exercised.
+"""
+
+import os
+import json
+import time
+import base64
+import random
+import hashlib
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from tornado.httputil import HTTPHeaders
+from nvchecker.httpclient.base import BaseSession, Response, BaseHTTPError
+
+from .http_session import SessionWrapper
+
+logger = logging.getLogger(__name__)
+
+
+def fixture_key(method: str, url: str, params=(), json_=None, body=None) -> str:
+    """
+    Key of a request in the archive, independent of its headers
+    """
+    raw = json.dumps([method, url, list(params), json_, body], default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class FixtureArchive:
+    """
+    Recorded responses in one json file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fixtures: dict[str, dict] = {}
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.fixtures = json.load(f)
+
+    def add(self, key: str, url: str, code: int, headers, body: bytes):
+        """
+        Record a response
+        """
+        self.fixtures[key] = {
+            'url': url,
+            'code': code,
+            'headers': list(HTTPHeaders(headers).get_all()) if headers else [],
+            'body': base64.b64encode(body or b'').decode('ascii'),
+        }
+
+    def get(self, key: str) -> dict | None:
+        """
+        Get a recorded response
+        """
+        return self.fixtures.get(key)
+
+    def save(self):
+        """
+        Write the archive to disk
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.fixtures, f)
+
+
+class RecordingSession(SessionWrapper):
+    """
+    Session recording every response, including http errors
+    """
+
+    def __init__(self, inner: BaseSession, archive: FixtureArchive):
+        super().__init__(inner)
+        self.archive = archive
+
+    async def request_impl(self, url: str, *, method: str, params=(),
+                           json=None, body=None, **kwargs) -> Response:
+        key = fixture_key(method, url, params, json, body)
+        try:
+            res = await super().request_impl(
+                url, method=method, params=params, json=json, body=body, **kwargs)
+        except BaseHTTPError as e:
+            headers = getattr(e.response, 'headers', None)
+            self.archive.add(key, url, e.code, headers,
+                             getattr(e.response, 'body', b''))
+            raise
+        # only streamed responses carry their status
+        self.archive.add(key, url, getattr(res, 'code', None) or 200,
+                         res.headers, res.body)
+        return res
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the checker opens many connections at once
+    request_queue_size = 1024
+
+
+class ReplayServer:
+    """
+    Local http stand-in serving the responses of a FixtureArchive
+    """
+
+    def __init__(self, archive: FixtureArchive, latency: float = 0.0,
+                 jitter: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        """
+        :param latency: seconds added to every response
+        :param jitter: up to this many seconds added on top, at random
+        """
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                fixture = server.archive.get(self.path.lstrip('/'))
+                delay = server.latency + random.uniform(0, server.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+                if fixture is None:
+                    body = b'no fixture recorded'
+                    self.send_response(404)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                body = base64.b64decode(fixture['body'])
+                self.send_response(fixture['code'])
+                for k, v in fixture['headers']:
+                    if k.lower() not in ('content-length', 'transfer-encoding',
+                                         'content-encoding', 'connection'):
+                        self.send_header(k, v)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        self.httpd = _Server((host, port), Handler)
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05},
+            daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'ReplayServer':
+        """
+        Serve in a background thread
+        """
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class ReplaySession(SessionWrapper):
+    """
+    Session sending every request to a ReplayServer instead of upstream
+    """
+
+    def __init__(self, inner: BaseSession, server: ReplayServer):
+        super().__init__(inner)
+        self.server = server
+
+    async def request_impl(self, url: str, *, method: str, params=(),
+                           json=None, body=None, proxy=None, **kwargs) -> Response:
+        key = fixture_key(method, url, params, json, body)
+        if self.server.archive.get(key) is None:
+            logger.warning("No fixture recorded for %s %s", method, url)
+        return await super().request_impl(
+            f"{self.server.url}/{key}", method='GET', **kwargs)
@@ -0,0 +1,279 @@
+"""
+Retries with backoff by error class, and a circuit breaker per host
+
+A failed request is classified (dns, tls, connect, timeout, 5xx, 429, 4xx)
+and only retried for the classes of `__config__.retry.on`, after an
+exponential backoff with full jitter, or the Retry-After of a 429. Hosts
+failing with dns, tls, connect, timeout or 5xx errors several times in a
+row are considered down: their requests fail at once with HostUnavailable
+until the cooldown passed, then one request probes the host while the others
+wait for it. Open breakers are kept in a file, so the next runs skip a dead
+host until its cooldown is over, the failures of closed ones are not: a few
+sporadic failures per run never add up to open a breaker.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from nvchecker.ctxvars import tries as ctx_tries
+from nvchecker.httpclient.base import BaseSession, BaseHTTPError, Response
+
+from .http_session import SessionWrapper
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRIES = 3
+# seconds before the first retry, doubled by every other one
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+# a longer Retry-After fails the request instead of waiting
+DEFAULT_MAX_RETRY_AFTER = 60.0
+DEFAULT_RETRY_ON = ('connect', 'timeout', '5xx', '429')
+# consecutive failures opening the breaker of a host
+DEFAULT_THRESHOLD = 5
+DEFAULT_COOLDOWN = 600.0
+
+# error classes meaning the host itself is unreachable or broken
+HOST_ERRORS = frozenset({'dns', 'tls', 'connect', 'timeout', '5xx'})
+
+# libcurl error codes, as reported by the tornado backend
+_CURL_ERRORS = {6: 'dns', 7: 'connect', 28: 'timeout', 35: 'tls', 51: 'tls',
+                58: 'tls', 60: 'tls'}
+
+
+class HostUnavailable(BaseHTTPError):
+    """
+    The breaker of the host is open, the request was not made
+    """
+
+    def __init__(self, host: str, until: float):
+        super().__init__(503, f"{host} is down, not retried before "
+                         f"{time.strftime('%H:%M:%S', time.localtime(until))}", None)
+        self.host = host
+
+    def __str__(self) -> str:
+        return self.message
+
+
+def _host(url: str) -> str:
+    return urlparse(url).netloc
+
+
+def classify(e: BaseException) -> str:
+    """
+    The class of a request error: dns, tls, connect, timeout, 5xx, 429, 4xx,
+    open for a host known to be down, or other
+    """
+    if isinstance(e, HostUnavailable):
+        return 'open'
+    if isinstance(e, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(e, BaseHTTPError):
+        if e.code == 429:
+            return '429'
+        if 400 <= e.code < 500:
+            return '4xx'
+        if 500 <= e.code < 599:
+            return '5xx'
+        # 599: no response, the backend error tells why
+        cause = getattr(e.response, 'error', None) or e.response
+    elif isinstance(e, OSError) or getattr(e, 'code', None) == 599:
+        # tornado raises the CurlError of a failed connection as is
+        cause = e
+    else:
+        return 'other'
+    if not isinstance(cause, OSError) and getattr(cause, 'errno', None) in _CURL_ERRORS:
+        return _CURL_ERRORS[cause.errno]
+    text = f"{getattr(e, 'message', '')} {cause!r}".lower()
+    if 'resolve' in text or 'name or service' in text or 'getaddrinfo' in text \
+            or 'nodename' in text:
+        return 'dns'
+    if 'ssl' in text or 'certificate' in text or 'tls' in text:
+        return 'tls'
+    if 'timeout' in text or 'timed out' in text:
+        return 'timeout'
+    return 'connect'
+
+
+def retry_after(e: BaseException) -> float | None:
+    """
+    Seconds of the Retry-After header of an error response, if any
+    """
+    headers = getattr(getattr(e, 'response', None), 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Consecutive failures of every host and until when it is considered down
+    """
+
+    def __init__(self, path: str | None = None, threshold: int = DEFAULT_THRESHOLD,
+                 cooldown: float = DEFAULT_COOLDOWN):
+        self.path = path
+        self.threshold = threshold
+        self.cooldown = cooldown
+        # host -> {'failures': n, 'open_until': time or None}
+        self.hosts: dict[str, dict] = {}
+        if path is not None and os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.hosts = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Dropping broken breaker state %s: %s", path, e)
+            # states written before only the open breakers were kept
+            self.hosts = {host: h for host, h in self.hosts.items()
+                          if h['open_until'] is not None}
+
+    def state(self, host: str) -> str:
+        """
+        closed, open, or half_open once the cooldown of an open breaker passed
+        """
+        h = self.hosts.get(host)
+        if h is None or h['open_until'] is None:
+            return 'closed'
+        return 'open' if time.time() < h['open_until'] else 'half_open'
+
+    def open_until(self, host: str) -> float:
+        return self.hosts[host]['open_until']
+
+    def success(self, host: str):
+        if self.hosts.pop(host, None) is not None:
+            logger.info("%s answers again", host)
+
+    def failure(self, host: str):
+        h = self.hosts.setdefault(host, {'failures': 0, 'open_until': None})
+        h['failures'] += 1
+        if h['failures'] >= self.threshold and self.state(host) != 'open':
+            h['open_until'] = time.time() + self.cooldown
+            logger.warning("%s failed %d times in a row, failing its requests "
+                           "for %.0fs", host, h['failures'], self.cooldown)
+
+    def save(self):
+        """
+        Write the open and half open breakers to disk, the failures of the
+        closed ones only count within a run
+        """
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({host: h for host, h in self.hosts.items()
+                       if h['open_until'] is not None}, f)
+        os.replace(tmp, self.path)
+
+
+class BreakerSession(SessionWrapper):
+    """
+    Session failing the requests to hosts whose breaker is open
+    """
+
+    def __init__(self, inner: BaseSession, breaker: CircuitBreaker):
+        super().__init__(inner)
+        self.breaker = breaker
+        # host -> done when the probe of a half open host finished
+        self.probes: dict[str, asyncio.Future] = {}
+
+    async def _attempt(self, host: str, url: str, kwargs: dict) -> Response:
+        try:
+            res = await super().request_impl(url, **kwargs)
+        except Exception as e:
+            if classify(e) in HOST_ERRORS:
+                self.breaker.failure(host)
+            else:
+                # the host answered
+                self.breaker.success(host)
+            raise
+        self.breaker.success(host)
+        return res
+
+    async def request_impl(self, url: str, **kwargs) -> Response:
+        host = _host(url)
+        while True:
+            state = self.breaker.state(host)
+            if state == 'closed':
+                return await self._attempt(host, url, kwargs)
+            if state == 'open':
+                raise HostUnavailable(host, self.breaker.open_until(host))
+            # half open: one request probes the host, the others wait for it
+            probe = self.probes.get(host)
+            if probe is None:
+                probe = self.probes[host] = asyncio.get_running_loop().create_future()
+                try:
+                    return await self._attempt(host, url, kwargs)
+                finally:
+                    del self.probes[host]
+                    probe.set_result(None)
+            await asyncio.shield(probe)
+
+
+class RetrySession(SessionWrapper):
+    """
+    Session retrying failed requests, replacing the retry loop of nvchecker
+
+    The number of tries is nvchecker's `tries`, `options` is the
+    `__config__.retry` table:
+        backoff: seconds before the first retry, doubled by every other one
+        max_backoff: longest backoff, in seconds
+        max_retry_after: longest Retry-After waited for, in seconds
+        on: error classes retried
+    """
+
+    def __init__(self, inner: BaseSession, options: dict):
+        super().__init__(inner)
+        self.backoff = options.get('backoff', DEFAULT_BACKOFF)
+        self.max_backoff = options.get('max_backoff', DEFAULT_MAX_BACKOFF)
+        self.max_retry_after = options.get('max_retry_after', DEFAULT_MAX_RETRY_AFTER)
+        self.retry_on = frozenset(options.get('on', DEFAULT_RETRY_ON))
+
+    def delay(self, attempt: int, e: Exception) -> float | None:
+        """
+        Seconds to wait before retrying a failed attempt, None to give up
+        """
+        kind = classify(e)
+        if kind not in self.retry_on:
+            return None
+        if kind == '429':
+            after = retry_after(e)
+            if after is not None:
+                return after if after <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    async def request(self, url: str, **kwargs) -> Response:
+        tries = ctx_tries.get()
+        for attempt in range(1, tries + 1):
+            # the inner sessions make a single attempt, counted as a retry
+            # by the metrics after the first one
+            tries_token = ctx_tries.set(1)
+            retry_token = metrics.retrying.set(attempt > 1)
+            try:
+                return await self.inner.request(url, **kwargs)
+            except Exception as e:
+                delay = self.delay(attempt, e) if attempt < tries else None
+                if delay is None:
+                    raise
+                logger.info("%s failed (%s, %s), retrying in %.1fs",
+                            url, classify(e), e, delay)
+            finally:
+                ctx_tries.reset(tries_token)
+                metrics.retrying.reset(retry_token)
+            await asyncio.sleep(delay)
+        raise AssertionError('unreachable')
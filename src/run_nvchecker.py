@@ -8,43 +8,59 @@ import os
 import argparse
 import asyncio
 import logging
-from typing import Coroutine, Tuple, cast
+from typing import AsyncIterator, Callable, Tuple, cast
 import queue
-import yaml
 import json
-import toml
 
 from nvchecker import core
 from nvchecker.util import KeyManager, Entries
-from nvchecker.core import Options
+from nvchecker.core import Options, RichResult
 from nvchecker.util import ResultData, RawResult, EntryWaiter
 
-from matrix.assets.src.matrix_parser import Systems, gen_oldver, SystemInfo
-
-from .utils import gen_item_name
+from matrix.assets.src.matrix_parser import SystemInfo
+
+from .utils import gen_item_name, MatrixIndex
+from . import http_session
+from .http_cache import HttpCache, CachedSession, DEFAULT_TTL, DEFAULT_MAX_SIZE
+from .state import CheckState
+from .rate_limit import RateLimitedSession, SourceSemaphore
+from .config_snapshot import FileTree, ConfigSnapshot, matrix_key
+from .dispatch import Dispatcher, EntryTimeout, ResultTracker, run_tasks
+from .replay import FixtureArchive, RecordingSession, ReplayServer, ReplaySession
+from .shard import Shard
+from .streaming import StreamingSession
+from .selector import Selector
+from .mirrors import MirrorHealth, MirrorSession
+from .retry import (
+    CircuitBreaker, BreakerSession, RetrySession,
+    DEFAULT_TRIES, DEFAULT_THRESHOLD, DEFAULT_COOLDOWN,
+)
+from .history import HistoryStore
+from . import metrics, workers
 
 logger = logging.getLogger(__name__)
+# run_nvchecker shadows `logging` and `logger` with its arguments
+_logger = logger
 
+_logging_configured = False
 
-async def run(
-    result_coro: Coroutine[None, None, Tuple[ResultData, bool]],
-    runner_coro: Coroutine[None, None, None],
-) -> Tuple[ResultData, bool]:
-    """
-    From original nvchecker, create a runner
-    """
-    result_fu = asyncio.create_task(result_coro)
-    runner_fu = asyncio.create_task(runner_coro)
-    await runner_fu
-    result_fu.cancel()
-    return await result_fu
+# sources whose result only depends on the entry config, never on its name
+COALESCIBLE_SOURCES = frozenset({
+    'regex', 'regex_stream', 'htmlparser', 'httpheader', 'jq', 'github',
+    'github_batch', 'gitlab', 'gitea', 'bitbucket', 'git', 'cmd', 'manual',
+})
 
 
 def load_config_from_dict(config: dict, working_dir: str = None):
+    """
+    Split the merged configs into entries, nvchecker options and the raw
+    `__config__` table, which also holds the options of this checker
+    """
 
     ver_files = None
     keymanager = KeyManager(None)
     source_configs = {}
+    c = {}
 
     if '__config__' in config:
         c = config.pop('__config__')
@@ -75,7 +91,45 @@ def load_config_from_dict(config: dict, working_dir: str = None):
     return cast(Entries, config), Options(
         ver_files, max_concurrency, proxy, keymanager,
         source_configs, httplib, http_timeout,
-    )
+    ), c
+
+
+def coalesce_entries(entries: Entries) -> tuple[Entries, dict[str, list[str]]]:
+    """
+    Keep one entry for every group of entries sharing the same source config
+    return: unique entries, representative name -> all names of its group
+    """
+    unique = {}
+    groups = {}
+    representatives = {}
+    for name, entry in entries.items():
+        if entry.get('source', 'none') not in COALESCIBLE_SOURCES:
+            unique[name] = entry
+            groups[name] = [name]
+            continue
+        key = json.dumps(entry, sort_keys=True, default=str)
+        rep = representatives.get(key)
+        if rep is None:
+            representatives[key] = name
+            unique[name] = entry
+            groups[name] = [name]
+        else:
+            groups[rep].append(name)
+    return cast(Entries, unique), groups
+
+
+class FanoutQueue(asyncio.Queue):
+    """
+    Result queue which copies every representative result to its whole group
+    """
+
+    def __init__(self, groups: dict[str, list[str]]):
+        super().__init__()
+        self.groups = groups
+
+    def put_nowait(self, item: RawResult):
+        for name in self.groups.get(item.name, (item.name,)):
+            super().put_nowait(item._replace(name=name))
 
 
 def merge_configs(
@@ -110,18 +164,74 @@ def try_merge_simple_configs(
     return a
 
 
+CONFIG_FILES = ('config.yaml', 'config.yml', 'config.toml', 'config.json')
+
+
+def parse_config_file(path: str) -> dict | None:
+    """
+    Parse a config file by its name
+    return: the config, {} for an empty file, None if it is broken
+    """
+    name = os.path.basename(path)
+    conf = None
+    if name in ('config.yaml', 'config.yml'):
+        import yaml
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                conf = yaml.load(f, Loader=yaml.FullLoader)
+            except yaml.YAMLError as e:
+                logger.error(
+                    "Failed to parse YAML file %s: %s", path, e)
+                return None
+    if name == 'config.toml':
+        import toml
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                conf = toml.load(f)
+            except toml.TomlDecodeError as e:
+                logger.error(
+                    "Failed to parse TOML file %s: %s", path, e)
+                return None
+    if name == 'config.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                conf = json.load(f)
+            except json.JSONDecodeError as e:
+                logger.error(
+                    "Failed to parse JSON file %s: %s", path, e)
+                return None
+    return conf or {}
+
+
 def load_all_configs(
     conf_dir: str = '.',
     matrix_dir: str = '.',
+    matrix: MatrixIndex | None = None,
+    snapshot: ConfigSnapshot | None = None,
+    selector: Selector | None = None,
 ) -> tuple[dict, set, set]:
+    """
+    Walk the config tree along the matrix and merge the configs
+    With selector, the directories holding no selected system are skipped
+    and the snapshot is only read, so the result of full runs stays cached
+    """
     skip_dirs = ['.', '..', 'report-template',
                  'assets', '.git', '.github', '.venv']
 
-    systems = Systems(matrix_dir)
-    vinfos = gen_oldver(systems)
-    vinfo_path_mapper = {
-        '/'.join(vinfo.raw_data.link[:-1]): vinfo for vinfo in vinfos
-    }
+    if matrix is None:
+        matrix = MatrixIndex.load(matrix_dir)
+    if snapshot is not None:
+        snapshot.start_walk()
+
+    key = None
+    if snapshot is not None and selector is None:
+        key = matrix_key(conf_dir, matrix_dir,
+                         matrix.vinfos, matrix.systems.rtos)
+        cached = snapshot.cached_result(key)
+        if cached is not None:
+            logger.info("Configs loaded from snapshot %s", snapshot.path)
+            return cached
+    tree = snapshot or FileTree()
 
     res = {}
     q = queue.Queue()
@@ -137,47 +247,24 @@ def load_all_configs(
         cur_rel_path = os.path.relpath(cur_conf, conf_dir)
         skip_sub = False
 
-        sub_confs = os.listdir(cur_conf)
+        sub_confs = tree.scandir(cur_conf)
         has_sub_confs = False
-        for f in sub_confs:
+        for f, kind in sub_confs.items():
             cur_conf2 = os.path.join(cur_conf, f)
-            if not os.path.isfile(cur_conf2):
+            if kind != 'f':
                 continue
-            if f not in ('config.yaml', 'config.yml', 'config.toml', 'config.json'):
+            if f not in CONFIG_FILES:
                 skipped.add(cur_conf2)
                 continue
-            conf = None
             has_sub_confs = True
-            if f in ('config.yaml', 'config.yml'):
-                with open(cur_conf2, 'r', encoding='utf-8') as f:
-                    try:
-                        conf = yaml.load(f, Loader=yaml.FullLoader)
-                    except yaml.YAMLError as e:
-                        logger.error(
-                            "Failed to parse YAML file %s: %s", cur_conf2, e)
-                        continue
-            if f == 'config.toml':
-                with open(cur_conf2, 'r', encoding='utf-8') as f:
-                    try:
-                        conf = toml.load(f)
-                    except toml.TomlDecodeError as e:
-                        logger.error(
-                            "Failed to parse TOML file %s: %s", cur_conf2, e)
-                        continue
-            if f == 'config.json':
-                with open(cur_conf2, 'r', encoding='utf-8') as f:
-                    try:
-                        conf = json.load(f)
-                    except json.JSONDecodeError as e:
-                        logger.error(
-                            "Failed to parse JSON file %s: %s", cur_conf2, e)
-                        continue
+            conf = tree.load(cur_conf2, parse_config_file)
+            if conf is None:
+                continue
 
             # skip all embedded systems
-            if vinfo_path_mapper.get(cur_rel_path) is not None:
-                cur_vinfo = vinfo_path_mapper[cur_rel_path]
-                if cur_vinfo.system in systems.rtos:
-                    continue
+            cur_vinfo = matrix.get(cur_rel_path)
+            if cur_vinfo is not None and matrix.is_rtos(cur_vinfo):
+                continue
 
             if not conf or len(conf) == 0:
                 logger.warning("Config file %s is empty, skipping", cur_conf2)
@@ -193,30 +280,29 @@ def load_all_configs(
                     (cur_conf2, reason))
                 skip_sub = True
                 continue
-            res = try_merge_simple_configs(
-                res, conf, vinfo_path_mapper.get(cur_rel_path, None))
+            res = try_merge_simple_configs(res, conf, cur_vinfo)
 
         if skip_sub:
             continue
-        sub_dirs = os.listdir(cur_matrix)
+        sub_dirs = tree.scandir(cur_matrix)
         has_sub_dirs = False
-        for f in sub_dirs:
+        for f, kind in sub_dirs.items():
             if f in skip_dirs:
                 continue
             cur_conf2 = os.path.join(cur_conf, f)
             cur_matrix2 = os.path.join(cur_matrix, f)
             cur_rel_path2 = os.path.relpath(cur_conf2, conf_dir)
-            if not os.path.isdir(cur_matrix2):
+            if kind != 'd':
                 continue
 
             # Second, if all systems in the current dir are embedded systems, skip it
-            all_subsystems = [
-                v for k, v in vinfo_path_mapper.items() if cur_rel_path2 in k]
-            if all(v.system in systems.rtos for v in all_subsystems):
+            if matrix.only_rtos(cur_rel_path2):
+                continue
+            if selector is not None and not selector.may_contain(cur_rel_path2, matrix):
                 continue
 
             has_sub_dirs = True
-            if not os.path.exists(cur_conf2):
+            if f not in sub_confs:
                 # logger.warning(
                 # "Config directory %s does not exist, skipping", cur_conf2)
                 skipped.add(cur_conf2)
@@ -225,59 +311,465 @@ def load_all_configs(
 
         if not has_sub_confs and not has_sub_dirs:
             skipped.add(cur_conf)
+
+    if key is not None:
+        snapshot.save(key, (res, skipped, manually_skipped))
     return res, skipped, manually_skipped
 
 
-def run_nvchecker(conf_dir: str = '.', matrix_dir: str = '.', oldvers: dict = None,
-                  logging='warning', logger='pretty', version=False) -> Tuple[dict, bool, set, set]:
+def setup_fixtures(record: str | None, replay: str | None,
+                   replay_latency: float = 0.0, replay_jitter: float = 0.0
+                   ) -> tuple[FixtureArchive | None, ReplayServer | None]:
     """
-    Modified way to run nvchecker in program
-    return: new_ver, has_failure
+    Install recording of upstream responses into, or replaying from, an archive
     """
-    if oldvers is None:
-        oldvers = {}
+    if record is not None:
+        archive = FixtureArchive(record)
+        http_session.install(lambda inner: RecordingSession(inner, archive))
+        return archive, None
+    if replay is not None:
+        server = ReplayServer(FixtureArchive(replay),
+                              replay_latency, replay_jitter).start()
+        http_session.install(lambda inner: ReplaySession(inner, server))
+        return None, server
+    return None, None
+
+
+def setup_http_cache(extra_options: dict, cache_dir: str | None) -> HttpCache | None:
+    """
+    Install the on-disk http cache configured by `__config__.http_cache`
+    """
+    c = extra_options.get('http_cache', {})
+    if cache_dir is None or not c.get('enabled', True):
+        return None
+    cache = HttpCache(
+        os.path.join(cache_dir, 'http'),
+        ttl=c.get('ttl', DEFAULT_TTL),
+        max_size=c.get('max_size', DEFAULT_MAX_SIZE),
+    )
+    http_session.install(lambda inner: CachedSession(inner, cache))
+    return cache
+
+
+def setup_rate_limits(extra_options: dict):
+    """
+    Install the per-host limits configured by `__config__.limits`, under the
+    http cache and the breaker, so only the requests reaching a host count
+    """
+    limits = extra_options.get('limits', {})
+    if limits.get('hosts') or limits.get('default_host'):
+        http_session.install(lambda inner: RateLimitedSession(inner, limits))
+
+
+def setup_breaker(extra_options: dict, cache_dir: str | None) -> CircuitBreaker | None:
+    """
+    Install the per-host circuit breaker configured by `__config__.breaker`,
+    under the http cache so fresh responses of a down host are still served
+    """
+    b = extra_options.get('breaker', {})
+    if not b.get('enabled', True):
+        return None
+    breaker = CircuitBreaker(
+        os.path.join(cache_dir, 'breaker.json') if cache_dir is not None else None,
+        threshold=b.get('threshold', DEFAULT_THRESHOLD),
+        cooldown=b.get('cooldown', DEFAULT_COOLDOWN),
+    )
+    http_session.install(lambda inner: BreakerSession(inner, breaker))
+    return breaker
+
+
+def setup_mirrors(extra_options: dict, cache_dir: str | None) -> MirrorHealth:
+    """
+    Install the mirrors of the entries and of `__config__.mirrors.hosts`,
+    above the rate limits and the cache so each mirror goes through its own
+    """
+    health = MirrorHealth(os.path.join(cache_dir, 'mirrors.json')
+                          if cache_dir is not None else None)
+    options = extra_options.get('mirrors', {})
+    http_session.install(lambda inner: MirrorSession(inner, options, health))
+    return health
+
+
+def dispatch_entries(
+    dispatcher: Dispatcher,
+    entries: Entries,
+    task_sem: asyncio.Semaphore,
+    result_q: asyncio.Queue,
+    options: Options,
+    entry_waiter: EntryWaiter,
+    tries: int,
+    source_limits: dict,
+) -> list[asyncio.Future]:
+    """
+    Dispatch the entries, sources with a concurrency cap in
+    `__config__.limits.sources` get their own semaphore on top of task_sem
+    """
+    capped: dict[str, dict] = {}
+    rest = {}
+    for name, entry in entries.items():
+        source = entry.get('source', 'none')
+        if source_limits.get(source, {}).get('concurrency'):
+            capped.setdefault(source, {})[name] = entry
+        else:
+            rest[name] = entry
+
+    futures = dispatcher.dispatch(
+        cast(Entries, rest), task_sem, result_q,
+        options.keymanager, entry_waiter,
+        tries,
+        options.source_configs,
+    )
+    for source, group in capped.items():
+        sem = SourceSemaphore(task_sem, source_limits[source]['concurrency'])
+        futures += dispatcher.dispatch(
+            cast(Entries, group), cast(asyncio.Semaphore, sem), result_q,
+            options.keymanager, entry_waiter,
+            tries,
+            options.source_configs,
+        )
+    return futures
+
+
+def matrix_version(oldvers: dict, name: str) -> str | None:
+    """
+    The matrix version an entry is checked against
+    """
+    old = oldvers.get(name)
+    return old.vinfo.version if old is not None else None
+
+
+def setup_logging(logging='warning', logger='pretty', version=False) -> bool:
+    """
+    Configure nvchecker's logging, once per process, later calls are no-ops
+    return: True if nvchecker asked to exit (version printed)
+    """
+    global _logging_configured
+    if _logging_configured and not version:
+        return False
+    _logging_configured = True
     args = argparse.Namespace(
         logging=logging,
         logger=logger,
         version=version,
     )
-    if core.process_common_arguments(args):
-        return
+    return bool(core.process_common_arguments(args))
 
-    confs, skipped, manually_skipped = load_all_configs(
-        conf_dir=conf_dir,
-        matrix_dir=matrix_dir
-    )
 
-    entries, options = load_config_from_dict(
+def load_entries(conf_dir: str, matrix_dir: str,
+                 matrix: MatrixIndex | None = None,
+                 snapshot: ConfigSnapshot | None = None,
+                 selector: Selector | None = None,
+                 ) -> tuple[Entries, Options, dict, set, set]:
+    """
+    Load and merge all configs
+    With selector, only the entries of the selected systems
+    return: entries, options, extra_options, skipped, manually_skipped
+    """
+    if selector is not None and matrix is None:
+        matrix = MatrixIndex.load(matrix_dir)
+    with metrics.recorder.span('load_all_configs'):
+        confs, skipped, manually_skipped = load_all_configs(
+            conf_dir=conf_dir,
+            matrix_dir=matrix_dir,
+            matrix=matrix,
+            snapshot=snapshot,
+            selector=selector,
+        )
+
+    entries, options, extra_options = load_config_from_dict(
         confs,
         working_dir=conf_dir
     )
+    if selector is not None:
+        names = selector.names(matrix)
+        entries = cast(Entries, {k: v for k, v in entries.items() if k in names})
+    return entries, options, extra_options, skipped, manually_skipped
+
+
+class CheckSession:
+    """
+    The http stack and dispatcher shared by all checks of a run, or of a
+    daemon across its cycles
+    """
+
+    def __init__(self, options: Options, extra_options: dict,
+                 cache_dir: str | None = None,
+                 record: str | None = None,
+                 replay: str | None = None,
+                 replay_latency: float = 0.0,
+                 replay_jitter: float = 0.0):
+        """
+        nvchecker has one http client per process, the latest session wins
+        """
+        self.options = options
+        self.extra_options = extra_options
+        core.setup_httpclient(
+            options.max_concurrency,
+            options.httplib,
+            options.http_timeout,
+        )
+        self.dispatcher = Dispatcher(extra_options.get('timeouts'))
+        http_session.install(
+            lambda inner: StreamingSession(inner, keep_body=record is not None))
+        self.archive, self.replay_server = setup_fixtures(
+            record, replay, replay_latency, replay_jitter)
+        setup_rate_limits(extra_options)
+        self.breaker = setup_breaker(extra_options, cache_dir)
+        # a recording keeps the full answers, not the revalidations of the cache
+        self.http_cache = setup_http_cache(extra_options, cache_dir) \
+            if record is None else None
+        self.mirror_health = setup_mirrors(extra_options, cache_dir)
+        self.workers = workers.setup(extra_options.get('workers', {}))
+        http_session.install(metrics.MetricsSession)
+        # outermost, every retry goes through the metrics and the mirrors
+        retry = extra_options.get('retry', {})
+        self.tries = retry.get('tries', DEFAULT_TRIES)
+        http_session.install(lambda inner: RetrySession(inner, retry))
+
+    @classmethod
+    def from_config(cls, config: dict | None = None, **kwargs) -> 'CheckSession':
+        """
+        Session for a `__config__` table, for checks of entries built in code
+        """
+        _, options, extra_options = load_config_from_dict(
+            {'__config__': config or {}})
+        return cls(options, extra_options, **kwargs)
+
+    def flush(self):
+        """
+        Write the http cache, recorded fixtures, breakers and mirror health
+        """
+        if self.http_cache is not None:
+            self.http_cache.save()
+        if self.archive is not None:
+            self.archive.save()
+        if self.breaker is not None:
+            self.breaker.save()
+        self.mirror_health.save()
+
+    def close(self):
+        """
+        Flush, stop the replay server and the parse pool
+        """
+        self.flush()
+        if self.workers is not None:
+            self.workers.close()
+        if self.replay_server is not None:
+            self.replay_server.stop()
+
+
+def _process_one(
+    oldvers: dict,
+    r: RawResult,
+    entry_waiter: EntryWaiter,
+) -> RichResult | Exception:
+    """
+    nvchecker's process_result for a single result
+    """
+    try:
+        r1 = core._process_result(r)
+    except Exception as e:
+        _logger.exception("Error processing the result of %s", r.name)
+        r1 = e
+    if isinstance(r1, Exception):
+        entry_waiter.set_exception(r.name, r1)
+    else:
+        core.check_version_update(oldvers, r.name, r1, False)
+        entry_waiter.set_result(r.name, r1.version)
+    return r1
+
+
+_default_session: CheckSession | None = None
+
+
+async def check(
+    entries: Entries,
+    oldvers: dict | None = None,
+    *,
+    client: CheckSession | None = None,
+    deadline: float | None = None,
+) -> AsyncIterator[tuple[str, RichResult | Exception]]:
+    """
+    Check the entries in the running event loop, yielding every result as
+    soon as it is known
+    :param client: the session to check with, a default one is made once
+    :param deadline: seconds after which the remaining checks are cancelled
+    yield: name and result, or the exception the check failed with,
+    EntryTimeout for the checks over their budget or cut by the deadline
+    """
+    global _default_session
+    if oldvers is None:
+        oldvers = {}
+    if client is None:
+        if _default_session is None:
+            setup_logging()
+            _default_session = CheckSession.from_config()
+        client = _default_session
+    if not entries:
+        return
+
+    options = client.options
+    unique_entries, groups = coalesce_entries(entries)
+    _logger.info("Coalesced %d entries into %d checks",
+                 len(entries), len(unique_entries))
 
     task_sem = asyncio.Semaphore(options.max_concurrency)
-    result_q: asyncio.Queue[RawResult] = asyncio.Queue()
-    dispatcher = core.setup_httpclient(
-        options.max_concurrency,
-        options.httplib,
-        options.http_timeout,
-    )
-    entry_waiter = EntryWaiter()
-    futures = dispatcher.dispatch(
-        entries, task_sem, result_q,
-        options.keymanager, entry_waiter,
-        3,
-        options.source_configs,
+    result_q: asyncio.Queue[RawResult] = FanoutQueue(groups)
+    entry_waiter = ResultTracker()
+    futures = dispatch_entries(
+        client.dispatcher, unique_entries, task_sem, result_q,
+        options, entry_waiter, client.tries,
+        client.extra_options.get('limits', {}).get('sources', {}),
     )
+    runner = asyncio.ensure_future(asyncio.wait_for(
+        run_tasks([metrics.traced(fu, 'worker') for fu in futures]), deadline))
+    pending = set(entries)
+    try:
+        while pending:
+            get = asyncio.ensure_future(result_q.get())
+            await asyncio.wait((get, runner), return_when=asyncio.FIRST_COMPLETED)
+            if not get.done():
+                get.cancel()
+                break
+            r = get.result()
+            pending.discard(r.name)
+            yield r.name, _process_one(oldvers, r, entry_waiter)
+        # the results queued before the runner finished
+        while pending and not result_q.empty():
+            r = result_q.get_nowait()
+            pending.discard(r.name)
+            yield r.name, _process_one(oldvers, r, entry_waiter)
+        if pending and not runner.cancelled() \
+                and isinstance(runner.exception(), asyncio.TimeoutError):
+            _logger.warning("Run deadline of %ss reached, %d checks cancelled",
+                            deadline, len(pending))
+        for name in sorted(pending):
+            yield name, EntryTimeout(deadline)
+    finally:
+        runner.cancel()
+
+
+async def check_entries(
+    session: CheckSession,
+    entries: Entries,
+    oldvers: dict,
+    deadline: float | None = None,
+    on_result: Callable[[str, RichResult], None] | None = None,
+) -> tuple[ResultData, bool, set[str], set[str]]:
+    """
+    Check the entries in the running event loop
+    :param on_result: called with every new result as soon as it arrives
+    return: results, has_failures, failed, timed_out
+    """
+    results: ResultData = {}
+    failed = set()
+    timed_out = set()
+    async for name, r in check(entries, oldvers, client=session, deadline=deadline):
+        if isinstance(r, EntryTimeout):
+            timed_out.add(name)
+        elif isinstance(r, Exception):
+            failed.add(name)
+        else:
+            results[name] = r
+            if on_result is not None:
+                on_result(name, r)
+    return results, bool(failed or timed_out), failed, timed_out
+
+
+def run_nvchecker(conf_dir: str = '.', matrix_dir: str = '.', oldvers: dict = None,
+                  logging='warning', logger='pretty', version=False,
+                  cache_dir: str | None = None,
+                  incremental: bool = False,
+                  matrix: MatrixIndex | None = None,
+                  deadline: float | None = None,
+                  record: str | None = None,
+                  replay: str | None = None,
+                  replay_latency: float = 0.0,
+                  replay_jitter: float = 0.0,
+                  on_result: Callable[[str, RichResult], None] | None = None,
+                  shard: Shard | None = None,
+                  selector: Selector | None = None,
+                  history: HistoryStore | None = None,
+                  ) -> Tuple[dict, bool, set, set, set]:
+    """
+    Modified way to run nvchecker in program
+    With incremental, entries whose config, matrix version and ttl allow it
+    reuse the result stored in the state file instead of being checked
+    Checks still running at the deadline (seconds, else `__config__.deadline`)
+    are cancelled and reported as timed out with the ones over their budget
+    With record, every upstream response is saved into that fixture archive,
+    with replay, they are served from it by a local stand-in server
+    on_result is called with every result as soon as it is known, reused
+    ones first
+    With shard, only the entries of that shard are checked
+    With selector, only the configs of the selected systems are walked and
+    their entries checked
+    With history, the versions and statuses of the run are recorded in it
+    return: new_ver, has_failure, skipped, manually_skipped, timed_out
+    """
+    if oldvers is None:
+        oldvers = {}
+    if setup_logging(logging, logger, version):
+        return
 
-    result_coro = core.process_result(
-        oldvers, result_q, entry_waiter, verbose=False)
-    runner_coro = core.run_tasks(futures)
+    entries, options, extra_options, skipped, manually_skipped = load_entries(
+        conf_dir, matrix_dir, matrix,
+        ConfigSnapshot(os.path.join(cache_dir, 'configs.pickle'))
+        if cache_dir is not None else None,
+        selector,
+    )
 
-    results, has_failures = asyncio.run(run(result_coro, runner_coro))
+    if shard is not None:
+        latency = metrics.load_history(os.path.join(cache_dir, 'latency.json')) \
+            if cache_dir is not None else {}
+        _, groups = coalesce_entries(entries)
+        entries = shard.select(entries, groups, latency.get('entries', {}))
+
+    state = None
+    cached = {}
+    if cache_dir is not None:
+        state = CheckState(os.path.join(cache_dir, 'state.json'),
+                           extra_options.get('incremental'))
+    if incremental and state is not None:
+        for name, entry in entries.items():
+            if state.is_fresh(name, entry, matrix_version(oldvers, name)):
+                cached[name] = state.result(name)
+        entries = cast(Entries, {
+            k: v for k, v in entries.items() if k not in cached})
+        _logger.info("Incremental run: %d entries reused, %d to check",
+                     len(cached), len(entries))
+        if on_result is not None:
+            for name, r in cached.items():
+                on_result(name, r)
+
+    session = CheckSession(options, extra_options, cache_dir,
+                           record, replay, replay_latency, replay_jitter)
+    if deadline is None:
+        deadline = extra_options.get('deadline')
+    try:
+        with metrics.recorder.span('check'):
+            results, has_failures, _, timed_out = asyncio.run(
+                check_entries(session, entries, oldvers, deadline, on_result))
+    finally:
+        # what was fetched before an interruption is still worth keeping
+        session.close()
+    # shards are split on the history, so only the merge of a sharded run
+    # updates it
+    if cache_dir is not None and shard is None:
+        metrics.recorder.save_history(os.path.join(cache_dir, 'latency.json'))
+    if state is not None:
+        for name, r in results.items():
+            state.update(name, entries[name], matrix_version(oldvers, name), r)
+        state.save()
+    results.update(cached)
+    if history is not None:
+        history.record_run('run', list(entries) + list(cached), results,
+                           timed_out, oldvers,
+                           {k: e.seconds for k, e in metrics.recorder.entries.items()})
 
     new_vers = dict(sorted(results.items()))
 
-    return (new_vers, has_failures, skipped, manually_skipped)
+    return (new_vers, has_failures, skipped, manually_skipped, timed_out)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,129 @@
+"""
+Select the systems of a run by vendor, system, variant, board variant or path
+
+Patterns are globs, or regexes when prefixed with `re:`, and several of
+them can be given comma separated. A system is selected when every given
+field matches one of its patterns. The config walk skips the directories
+holding no selected system, and the entries and old versions are restricted
+to the names of the selected systems.
+"""
+
+import re
+import fnmatch
+from typing import Iterable
+
+from matrix.assets.src.matrix_parser import SystemInfo
+
+from .utils import MatrixIndex, gen_item_name
+
+def compile_patterns(spec: str | Iterable[str] | None) -> list[re.Pattern] | None:
+    """
+    Compile comma separated patterns, globs or `re:` prefixed regexes
+    return: None if there are none, matching everything
+    """
+    if spec is None:
+        return None
+    if isinstance(spec, str):
+        spec = spec.split(',')
+    res = []
+    for p in (p.strip() for p in spec):
+        if not p:
+            continue
+        if p.startswith('re:'):
+            res.append(re.compile(p[3:]))
+        else:
+            res.append(re.compile(fnmatch.translate(p)))
+    return res or None
+
+
+def _any_match(patterns: list[re.Pattern] | None, values: Iterable[str]) -> bool:
+    if patterns is None:
+        return True
+    return any(p.fullmatch(v) for p in patterns for v in values)
+
+
+def system_path(vinfo: SystemInfo) -> str:
+    """
+    Directory of a system, relative to the matrix and config trees
+    """
+    return '/'.join(vinfo.raw_data.link[:-1])
+
+
+class Selector:
+    """
+    Patterns selecting a subset of the systems of the matrix
+    """
+
+    def __init__(self, vendor=None, system=None, variant=None,
+                 board_variant=None, path=None):
+        self.specs = {'vendor': vendor, 'system': system, 'variant': variant,
+                      'board_variant': board_variant, 'path': path}
+        self.patterns = {k: compile_patterns(v) for k, v in self.specs.items()}
+
+    @classmethod
+    def from_config(cls, config) -> 'Selector | None':
+        """
+        The selector given on the command line, None without any
+        """
+        selector = cls(vendor=config["vendor"], system=config["system"],
+                       variant=config["variant"],
+                       board_variant=config["board_variant"],
+                       path=config["select_path"])
+        return selector if selector.active else None
+
+    @property
+    def active(self) -> bool:
+        return any(p is not None for p in self.patterns.values())
+
+    def _b_variants(self, vinfo: SystemInfo) -> list[str]:
+        # the board variants gen_item_name makes names for
+        return (vinfo.board_variants or []) + ['generic']
+
+    def matches(self, vinfo: SystemInfo) -> bool:
+        """
+        Whether a system is selected
+        """
+        p = self.patterns
+        return (_any_match(p['vendor'], [vinfo.vendor])
+                and _any_match(p['system'], [vinfo.system])
+                and _any_match(p['variant'], [vinfo.variant or 'null'])
+                and _any_match(p['board_variant'], self._b_variants(vinfo))
+                and self.matches_path(system_path(vinfo)))
+
+    def matches_path(self, rel_path: str) -> bool:
+        """
+        Whether a config path, or one of its parent directories, is selected
+        """
+        p = self.patterns['path']
+        if p is None:
+            return True
+        parts = rel_path.split('/')
+        return _any_match(p, ['/'.join(parts[:i]) for i in range(1, len(parts) + 1)])
+
+    def may_contain(self, rel_path: str, matrix: MatrixIndex) -> bool:
+        """
+        Whether the subtree of a directory holds a selected system
+        """
+        return any(self.matches(v) for v in matrix.under(rel_path))
+
+    def item_names(self, vinfo: SystemInfo) -> list[str]:
+        """
+        The entry names of a selected system, only of the selected board variants
+        """
+        names = gen_item_name(vinfo)
+        p = self.patterns['board_variant']
+        if p is None:
+            return names
+        return [n for n, b in zip(names, self._b_variants(vinfo))
+                if _any_match(p, [b])]
+
+    def names(self, matrix: MatrixIndex) -> set[str]:
+        """
+        The entry names of all selected systems
+        """
+        return {n for v in matrix.vinfos if self.matches(v)
+                for n in self.item_names(v)}
+
+    def __repr__(self) -> str:
+        return 'Selector(' + ', '.join(
+            f'{k}={v!r}' for k, v in self.specs.items() if v is not None) + ')'
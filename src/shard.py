@@ -0,0 +1,198 @@
+"""
+Split the checks of a run over several runners and merge their results
+
+Every runner checks one shard of the merged entries and writes its results
+to a partial file. Entries sharing a source config stay in the same shard so
+they are still fetched once. Shards are balanced on the latency history of
+the entries, with ties broken by a hash of the product triple, so every
+runner computes the same split from the same history.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from dataclasses import asdict
+
+from nvchecker.core import RichResult
+from nvchecker.util import Entries
+
+from .metrics import Recorder, EntryStats
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_VERSION = 1
+# estimated seconds of an entry without history
+DEFAULT_LATENCY = 1.0
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """
+    Parse a shard as i/N, i counted from 0
+    """
+    try:
+        index, count = (int(x) for x in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must be given as i/N, not {spec!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard {spec} is out of range, i must be in [0, N)")
+    return index, count
+
+
+def _stable_hash(name: str) -> int:
+    return int(hashlib.sha256(name.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class Shard:
+    """
+    One of count shards of the entries of a run
+    """
+
+    def __init__(self, index: int, count: int):
+        self.index = index
+        self.count = count
+        # names of all entries of the run, and of the ones in this shard
+        self.total: list[str] = []
+        self.entries: list[str] = []
+
+    def assign(self, groups: dict[str, list[str]],
+               history: dict[str, float]) -> list[int]:
+        """
+        The shard of every group of coalesced entries, in the order of groups
+        :param history: smoothed seconds of the earlier checks of the entries
+        """
+        default = (sum(history.values()) / len(history)) if history else DEFAULT_LATENCY
+        cost = {rep: max((history[n] for n in names if n in history), default=default)
+                for rep, names in groups.items()}
+        # longest first onto the least loaded shard
+        loads = [0.0] * self.count
+        shard_of = {}
+        for rep in sorted(groups, key=lambda r: (-cost[r], _stable_hash(r))):
+            i = min(range(self.count), key=lambda i: (loads[i], i))
+            loads[i] += cost[rep]
+            shard_of[rep] = i
+        logger.info("Estimated seconds per shard: %s",
+                    ", ".join(f"{x:.1f}" for x in loads))
+        return [shard_of[rep] for rep in groups]
+
+    def select(self, entries: Entries, groups: dict[str, list[str]],
+               history: dict[str, float]) -> Entries:
+        """
+        The entries of this shard
+        :param groups: representative name -> names, from coalesce_entries
+        """
+        self.total = list(entries)
+        self.entries = [n for (rep, names), i in zip(groups.items(), self.assign(groups, history))
+                        if i == self.index for n in names]
+        logger.info("Shard %d/%d: %d of %d entries", self.index, self.count,
+                    len(self.entries), len(self.total))
+        return {n: entries[n] for n in self.entries}
+
+
+def write_partial(path: str, shard: Shard, results: dict[str, RichResult],
+                  has_failures: bool, skipped: set, manually_skipped: set,
+                  timed_out: set, recorder: Recorder | None = None):
+    """
+    Write the results of a shard
+    """
+    data = {
+        'version': PARTIAL_VERSION,
+        'shard': [shard.index, shard.count],
+        'total': shard.total,
+        'entries': shard.entries,
+        'results': {k: {'version': r.version, 'url': r.url,
+                        'gitref': r.gitref, 'revision': r.revision}
+                    for k, r in results.items()},
+        'has_failures': has_failures,
+        'skipped': sorted(skipped),
+        'manually_skipped': sorted(manually_skipped),
+        'timed_out': sorted(timed_out),
+        'metrics': {
+            'entries': {k: asdict(v) for k, v in recorder.entries.items()},
+            'hosts': {k: asdict(v) for k, v in recorder.hosts.items()},
+        } if recorder is not None else {},
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def load_partials(path: str) -> list[dict]:
+    """
+    Load the partial results of the shards, from a file or all json files
+    under a directory
+    """
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = sorted(os.path.join(cur, f) for cur, _, files in os.walk(path)
+                       for f in files if f.endswith('.json'))
+    res = []
+    for p in paths:
+        with open(p, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != PARTIAL_VERSION:
+            logger.warning("Ignoring %s, not a partial result", p)
+            continue
+        res.append(data)
+    return res
+
+
+def merge_partials(partials: list[dict], recorder: Recorder | None = None
+                   ) -> tuple[dict[str, RichResult], bool, set, set, set]:
+    """
+    Combine the results of the shards
+    Entries no shard checked are reported as timed out and missing shards
+    as failures
+    The entry and host statistics of the shards are added to recorder
+    return: new_ver, has_failure, skipped, manually_skipped, timed_out
+    raise ValueError: without any partial result
+    """
+    if not partials:
+        raise ValueError("No partial results to merge, did every shard fail?")
+    results = {}
+    has_failures = False
+    skipped = set()
+    manually_skipped = set()
+    timed_out = set()
+    total = set()
+    checked = set()
+    shards = set()
+    count = None
+    for data in partials:
+        index, n = data['shard']
+        if count is not None and n != count:
+            logger.warning("Partials of %d and %d shards are merged", count, n)
+        count = n
+        if index in shards:
+            logger.warning("Shard %d/%d is merged twice", index, n)
+        shards.add(index)
+        total.update(data['total'])
+        checked.update(data['entries'])
+        results.update({k: RichResult(**v) for k, v in data['results'].items()})
+        has_failures |= data['has_failures']
+        skipped.update(data['skipped'])
+        manually_skipped.update(tuple(x) for x in data['manually_skipped'])
+        timed_out.update(data['timed_out'])
+        if recorder is not None:
+            for k, v in data['metrics'].get('entries', {}).items():
+                recorder.entries[k] = EntryStats(**v)
+            for k, v in data['metrics'].get('hosts', {}).items():
+                h = recorder.host(k)
+                h.requests += v['requests']
+                h.attempts += v['attempts']
+                h.errors += v['errors']
+                h.bytes += v['bytes']
+                h.seconds += v['seconds']
+                h.latencies += v['latencies']
+    if shards != set(range(count)):
+        logger.error("Missing shards: %s",
+                     ", ".join(f"{i}/{count}" for i in sorted(set(range(count)) - shards)))
+        has_failures = True
+    missing = total - checked
+    if missing:
+        logger.error("%d entries were not in any shard", len(missing))
+        timed_out |= missing
+    return dict(sorted(results.items())), has_failures, skipped, manually_skipped, timed_out
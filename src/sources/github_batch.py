@@ -0,0 +1,214 @@
+"""
+GitHub source resolving the entries of many repositories per GraphQL query
+
+Takes the options of nvchecker's github source. The latest release
+(use_latest_release, with include_prereleases and use_release_name), the
+latest tag (use_latest_tag with query) and the tags (use_max_tag, the 100
+latest ones) of up to `batch_size` repositories are asked in one query to
+the GraphQL API, each repository under its own alias. The token is the
+entry's `token`, the `github` key of the keyfile, else GITHUB_TOKEN.
+Entries checking commits, and all of them without a token, which the
+GraphQL API requires, go to nvchecker's github source one by one.
+
+`__config__.source.github_batch` may set:
+- batch_size: repositories per query, 50 by default
+- api_url: the GraphQL endpoint, else GITHUB_API_URL/graphql, else the
+  one of the entry's `host`
+"""
+
+import json
+import asyncio
+import logging
+from typing import Any
+
+from nvchecker.api import session, RichResult, GetVersionError
+from nvchecker.util import BaseWorker, FunctionWorker, RawResult, Entry
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+# tags fetched for use_max_tag, the REST api lists all of them
+MAX_TAGS = 100
+
+BATCH_SIZE = DEFAULT_BATCH_SIZE
+API_URL: str | None = None
+
+RELEASE_FIELDS = 'name url tagName tagCommit { oid }'
+
+
+def configure(conf: dict):
+    global BATCH_SIZE, API_URL
+    BATCH_SIZE = conf.get('batch_size', DEFAULT_BATCH_SIZE)
+    API_URL = conf.get('api_url')
+
+
+def graphql_url(host: str) -> str:
+    if API_URL:
+        return API_URL
+    if config["GITHUB_API_URL"]:
+        return config["GITHUB_API_URL"].rstrip('/') + '/graphql'
+    return f'https://api.{host}/graphql'
+
+
+def batchable(conf: Entry) -> bool:
+    """
+    Whether the GraphQL API can answer the entry
+    """
+    if conf.get('branch') or conf.get('path'):
+        return False
+    return bool(conf.get('use_latest_release') or conf.get('use_latest_tag')
+                or conf.get('use_max_tag'))
+
+
+def repo_query(alias: str, conf: Entry) -> str:
+    """
+    The part of a query answering one entry, under alias
+    """
+    owner, name = conf['github'].split('/')
+    if conf.get('use_latest_tag'):
+        body = ('refs(refPrefix: "refs/tags/", first: 1, query: %s, '
+                'orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) '
+                '{ nodes { name target { oid } } }' % json.dumps(conf.get('query', '')))
+    elif conf.get('use_max_tag'):
+        body = ('refs(refPrefix: "refs/tags/", first: %d, '
+                'orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) '
+                '{ nodes { name target { oid } } }' % MAX_TAGS)
+    elif conf.get('include_prereleases'):
+        body = ('releases(first: 1, orderBy: {field: CREATED_AT, direction: DESC}) '
+                '{ nodes { %s } }' % RELEASE_FIELDS)
+    else:
+        body = 'latestRelease { %s }' % RELEASE_FIELDS
+    return '%s: repository(owner: %s, name: %s) { %s }' % (
+        alias, json.dumps(owner), json.dumps(name), body)
+
+
+def _tag(repo: str, node: dict) -> RichResult:
+    return RichResult(
+        version=node['name'],
+        gitref=f"refs/tags/{node['name']}",
+        revision=(node.get('target') or {}).get('oid'),
+        url=f"https://github.com/{repo}/releases/tag/{node['name']}",
+    )
+
+
+def _release(conf: Entry, node: dict) -> RichResult:
+    tag = node['tagName']
+    return RichResult(
+        version=node['name'] if conf.get('use_release_name') else tag,
+        gitref=f"refs/tags/{tag}",
+        revision=(node.get('tagCommit') or {}).get('oid'),
+        url=node['url'],
+    )
+
+
+def repo_result(conf: Entry, data: dict) -> RichResult | list[RichResult]:
+    """
+    The version of an entry from the answer to its part of a query
+    """
+    repo = conf['github']
+    if conf.get('use_latest_tag') or conf.get('use_max_tag'):
+        nodes = data['refs']['nodes']
+        if not nodes:
+            raise GetVersionError('No tag found in upstream repository.')
+        if conf.get('use_latest_tag'):
+            return _tag(repo, nodes[0])
+        return [_tag(repo, n) for n in nodes]
+    if conf.get('include_prereleases'):
+        nodes = data['releases']['nodes']
+        node = nodes[0] if nodes else None
+    else:
+        node = data['latestRelease']
+    if node is None:
+        raise GetVersionError('No release found in upstream repository.')
+    return _release(conf, node)
+
+
+class Worker(BaseWorker):
+    """
+    Check the entries in batches of one GraphQL query per host and token
+
+    Each entry still waits for the query of its batch in a check of its own,
+    so the dispatcher applies its time budget and records it like the
+    entries of function sources.
+    """
+
+    # set by the dispatcher, wraps the get_version checking each entry
+    wrap = staticmethod(lambda func: func)
+
+    async def run(self) -> None:
+        batches: dict[tuple[str, str], list[tuple[str, Entry]]] = {}
+        rest = []
+        for name, conf in self.tasks:
+            host = conf.get('host', 'github.com')
+            token = conf.get('token') or self.keymanager.get_key(host.lower(), 'github') \
+                or config["GITHUB_TOKEN"]
+            if token and batchable(conf):
+                batches.setdefault((host, token), []).append((name, conf))
+            else:
+                rest.append((name, conf))
+
+        check = self.wrap(self.get_version)
+        queries = []
+        jobs = []
+        for (host, token), tasks in batches.items():
+            for i in range(0, len(tasks), BATCH_SIZE):
+                batch = tasks[i:i + BATCH_SIZE]
+                query = asyncio.ensure_future(self.run_batch(host, token, batch))
+                queries.append(query)
+                jobs += [self.run_one(check, name, conf, query, f'r{j}')
+                         for j, (name, conf) in enumerate(batch)]
+        if rest:
+            from nvchecker_source import github
+            fallback = FunctionWorker(self.task_sem, self.result_q, rest, self.keymanager)
+            fallback.initialize(self.wrap(github.get_version))
+            jobs.append(fallback.run())
+        try:
+            await asyncio.gather(*jobs)
+        finally:
+            for query in queries:
+                query.cancel()
+
+    async def run_one(self, check, name: str, conf: Entry,
+                      query: asyncio.Future, alias: str):
+        try:
+            result: Any = await check(name, conf, query=query, alias=alias)
+        except Exception as e:
+            result = e
+        await self.result_q.put(RawResult(name, result, conf))
+
+    @staticmethod
+    async def get_version(name: str, conf: Entry, *, query: asyncio.Future,
+                          alias: str) -> RichResult | list[RichResult]:
+        """
+        The version of an entry from the answer to the query of its batch
+        """
+        # an entry running out of its budget leaves the query to the others
+        data, errors = await asyncio.shield(query)
+        if data.get(alias) is None:
+            raise GetVersionError(errors.get(alias) or errors.get('')
+                                  or 'repository not found')
+        return repo_result(conf, data[alias])
+
+    async def run_batch(self, host: str, token: str,
+                        tasks: list[tuple[str, Entry]]) -> tuple[dict, dict[str, str]]:
+        """
+        Query the repositories of the entries, each under the alias r<index>
+        return: the data and the error messages by alias, '' for the query
+        """
+        query = '{ %s }' % ' '.join(repo_query(f'r{i}', conf)
+                                    for i, (_, conf) in enumerate(tasks))
+        async with self.task_sem:
+            res = await session.post(graphql_url(host), headers={
+                'Authorization': f'bearer {token}',
+                'Content-Type': 'application/json',
+            }, json={'query': query})
+        j = res.json()
+
+        logger.debug("%d repositories of %s resolved in one query", len(tasks), host)
+        errors: dict[str, str] = {}
+        for err in j.get('errors', []):
+            path = err.get('path') or ['']
+            errors[path[0]] = err.get('message', 'GraphQL error')
+        return j.get('data') or {}, errors
@@ -0,0 +1,65 @@
+"""
+nvchecker's htmlparser source, parsing the page in the parse pool
+
+The options are those of nvchecker's htmlparser source. Large pages are
+parsed, searched with the xpath and their versions sorted in the pool of
+src.workers instead of on the event loop.
+"""
+
+from nvchecker import core
+from nvchecker.api import session, GetVersionError
+
+from ..workers import offload
+
+
+def extract(name: str, body: bytes, conf: dict) -> list[str] | str | None:
+    """
+    The versions of a page, the latest one after the list options of the entry
+    """
+    from lxml import html, etree
+
+    encoding = conf.get('encoding')
+    is_xml = conf.get('is_xml')
+    if is_xml:
+        parser = etree.XMLParser(encoding=encoding)
+        doc = etree.fromstring(body, base_url=conf['url'], parser=parser)
+    else:
+        parser = html.HTMLParser(encoding=encoding)
+        doc = html.fromstring(body, base_url=conf['url'], parser=parser)
+
+    try:
+        els = doc.xpath(conf.get('xpath'))
+    except ValueError:
+        # nvchecker fails the check even with missing_ok, which only covers no match
+        raise GetVersionError('version string not found.')
+    except etree.XPathEvalError as e:
+        raise GetVersionError('bad xpath', exc_info=e)
+
+    if is_xml:
+        versions = [str(el) if isinstance(el, str) else ''.join(el.itertext())
+                    for el in els]
+    else:
+        versions = [str(el) if isinstance(el, str) else str(el.text_content())
+                    for el in els]
+    if not versions:
+        return versions
+    return core.apply_list_options(versions, conf, name)
+
+
+async def get_version(name, conf, *, cache, **kwargs):
+    key = tuple(sorted(conf.items()))
+    return await cache.get(key, get_version_impl)
+
+
+async def get_version_impl(info):
+    conf = dict(info)
+
+    data = conf.get('post_data')
+    if data is None:
+        res = await session.get(conf['url'])
+    else:
+        res = await session.post(conf['url'], body=data, headers={
+            'Content-Type': conf.get('post_data_type', 'application/x-www-form-urlencoded'),
+        })
+    # checks with the same options share this call, the url names them in logs
+    return await offload(len(res.body), extract, conf['url'], res.body, conf)
@@ -0,0 +1,61 @@
+"""
+nvchecker's regex source, matching the body in the parse pool
+
+The options are those of nvchecker's regex source. Checks of the same page
+share one fetch, and large bodies are decoded, matched and their versions
+sorted in the pool of src.workers instead of on the event loop.
+"""
+
+import re
+
+from nvchecker import core
+from nvchecker.api import session, GetVersionError
+
+from ..workers import offload
+
+
+def extract(name: str, body: bytes, encoding: str, regex: re.Pattern,
+            conf: dict) -> list[str] | str | None:
+    """
+    The versions of a body, the latest one after the list options of the entry
+    """
+    versions = regex.findall(body.decode(encoding))
+    if not versions:
+        return versions
+    return core.apply_list_options(versions, conf, name)
+
+
+async def get_version(name, conf, *, cache, **kwargs):
+    try:
+        regex = re.compile(conf['regex'])
+    except re.error as e:
+        raise GetVersionError('bad regex', exc_info=e)
+    if regex.groups > 1:
+        raise GetVersionError('multi-group regex')
+
+    key = (
+        conf['url'],
+        conf.get('encoding', 'latin1'),
+        conf.get('post_data'),
+        conf.get('post_data_type', 'application/x-www-form-urlencoded'),
+    )
+    body = await cache.get(key, get_url)
+
+    version = await offload(len(body), extract, name, body,
+                            conf.get('encoding', 'latin1'), regex, dict(conf))
+    if version == [] and not conf.get('missing_ok', False):
+        raise GetVersionError('version string not found.')
+    return version
+
+
+async def get_url(info):
+    # the body is decoded in the pool, the encoding only keys the cache as in nvchecker
+    url, _, post_data, post_data_type = info
+
+    if post_data is None:
+        res = await session.get(url)
+    else:
+        res = await session.post(url, body=post_data, headers={
+            'Content-Type': post_data_type,
+        })
+    return res.body
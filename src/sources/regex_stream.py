@@ -0,0 +1,137 @@
+"""
+nvchecker's regex source matching the body while it arrives
+
+For large directory listings. Only the best version found so far is kept,
+by the ordering of version_cmp, instead of every match. On top of the
+options of the regex source (url, regex, encoding, post_data,
+post_data_type, missing_ok, include_regex, exclude_regex and ignored):
+- max_body_size: bytes of the body read at most, the rest is not fetched
+- stop_after_first: take the first match, for listings sorted newest first
+"""
+
+import re
+import codecs
+import logging
+
+from nvchecker.api import session, GetVersionError
+
+from ..streaming import BodyConsumer, StreamedResponse, body_consumer
+from ..version_cmp import version_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BODY_SIZE = 8 * 1024 * 1024
+# longest match found across the boundary of two chunks, in characters
+OVERLAP = 4096
+
+
+class Matcher(BodyConsumer):
+    """
+    Match a regex over a body fed in chunks, keeping the best version
+    """
+
+    def __init__(self, name: str, regex: re.Pattern, conf: dict):
+        self.name = name
+        self.regex = regex
+        self.encoding = conf.get('encoding', 'latin1')
+        self.max_body_size = conf.get('max_body_size', DEFAULT_MAX_BODY_SIZE)
+        self.stop_after_first = conf.get('stop_after_first', False)
+        self.include = re.compile(conf['include_regex']) if conf.get('include_regex') else None
+        self.exclude = re.compile(conf['exclude_regex']) if conf.get('exclude_regex') else None
+        self.ignored = set(conf.get('ignored', '').split())
+        self.reset()
+
+    def reset(self):
+        # a retry or another mirror starts over, nothing of the aborted
+        # attempt may win
+        self.best: str | None = None
+        self.best_key: str | None = None
+        self.decoder = codecs.getincrementaldecoder(self.encoding)()
+        self.rest = ''
+        self.size = 0
+        self.done = False
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.done:
+            return False
+        room = self.max_body_size - self.size
+        if len(chunk) > room:
+            logger.warning("%s: body is larger than %d bytes, ignoring the rest",
+                           self.name, self.max_body_size)
+            chunk = chunk[:room]
+            self.done = True
+        self.size += len(chunk)
+        self._scan(self.decoder.decode(chunk, final=self.done), final=self.done)
+        return not self.done
+
+    def close(self) -> str | None:
+        """
+        Match the end of the body
+        return: the best version
+        """
+        if not self.done:
+            self._scan(self.decoder.decode(b'', final=True), final=True)
+            self.done = True
+        return self.best
+
+    def _scan(self, text: str, final: bool):
+        buf = self.rest + text
+        # matches ending in the last OVERLAP characters may still grow
+        limit = len(buf) if final else max(len(buf) - OVERLAP, 0)
+        keep = limit
+        for m in self.regex.finditer(buf):
+            if m.end() > limit:
+                keep = min(keep, m.start())
+                break
+            self._add(m.group(1) if self.regex.groups else m.group(0))
+            if self.stop_after_first and self.best is not None:
+                break
+        self.rest = '' if self.done else buf[keep:]
+
+    def _add(self, version: str):
+        if self.include is not None and not self.include.fullmatch(version):
+            return
+        if self.exclude is not None and self.exclude.fullmatch(version):
+            return
+        if version in self.ignored:
+            return
+        if self.stop_after_first:
+            self.best = version
+            self.done = True
+            return
+        key = version_key(version)
+        if self.best_key is None or key > self.best_key:
+            self.best = version
+            self.best_key = key
+
+
+async def get_version(name, conf, **kwargs):
+    try:
+        regex = re.compile(conf['regex'])
+    except re.error as e:
+        raise GetVersionError('bad regex', exc_info=e)
+    if regex.groups > 1:
+        raise GetVersionError('multi-group regex')
+
+    matcher = Matcher(name, regex, conf)
+    token = body_consumer.set(matcher)
+    try:
+        if conf.get('post_data') is None:
+            res = await session.get(conf['url'])
+        else:
+            res = await session.post(conf['url'], body=conf['post_data'], headers={
+                'Content-Type': conf.get('post_data_type', 'application/x-www-form-urlencoded'),
+            })
+    finally:
+        body_consumer.reset(token)
+    if not isinstance(res, StreamedResponse):
+        # answered by a layer which does not stream
+        matcher.reset()
+        matcher.feed(res.body)
+
+    version = matcher.close()
+    if version is None:
+        if conf.get('missing_ok', False):
+            return []
+        raise GetVersionError('version string not found.')
+    return version
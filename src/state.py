@@ -0,0 +1,123 @@
+"""
+Persisted per-entry check state for incremental runs
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+
+from nvchecker.core import RichResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def entry_hash(entry: dict) -> str:
+    """
+    Stable hash of the merged config of an entry
+    """
+    raw = json.dumps(entry, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class CheckState:
+    """
+    Last result, check time, config hash and matrix version of every entry
+    """
+
+    def __init__(self, path: str, options: dict | None = None):
+        """
+        :param path: the state file
+        :param options: the `__config__.incremental` table
+        """
+        self.path = path
+        self.configure(options)
+        self.entries: dict[str, dict] = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Dropping broken state file %s: %s", path, e)
+
+    def configure(self, options: dict | None):
+        """
+        Apply the `__config__.incremental` table, e.g. after it was edited
+        """
+        options = options or {}
+        self.default_ttl = options.get('ttl', DEFAULT_TTL)
+        self.source_ttl: dict[str, int] = options.get('source_ttl', {})
+
+    def ttl(self, entry: dict) -> int:
+        """
+        The recheck interval of an entry, entry level `check_ttl` wins
+        """
+        if 'check_ttl' in entry:
+            return entry['check_ttl']
+        return self.source_ttl.get(entry.get('source', 'none'), self.default_ttl)
+
+    def is_fresh(self, name: str, entry: dict, matrix_version: str | None) -> bool:
+        """
+        Whether the stored result of an entry can be reused without a check
+        """
+        s = self.entries.get(name)
+        if s is None:
+            return False
+        if s['hash'] != entry_hash(entry) or s['matrix_version'] != matrix_version:
+            return False
+        return time.time() - s['checked'] < self.ttl(entry)
+
+    def due_at(self, name: str, entry: dict, matrix_version: str | None,
+               jitter: float = 0.0) -> float:
+        """
+        When an entry has to be checked again, 0 if it has to be checked now
+        :param jitter: fraction of the ttl by which rechecks are spread, each
+        entry is moved earlier by a stable share of it
+        """
+        s = self.entries.get(name)
+        if s is None:
+            return 0.0
+        if s['hash'] != entry_hash(entry) or s['matrix_version'] != matrix_version:
+            return 0.0
+        share = int(hashlib.sha256(name.encode('utf-8')).hexdigest()[:8], 16) / 0xffffffff
+        return s['checked'] + self.ttl(entry) * (1 - jitter * share)
+
+    def result(self, name: str) -> RichResult:
+        """
+        The stored result of an entry
+        """
+        s = self.entries[name]
+        return RichResult(
+            version=s['version'],
+            url=s.get('url'),
+            gitref=s.get('gitref'),
+            revision=s.get('revision'),
+        )
+
+    def update(self, name: str, entry: dict, matrix_version: str | None,
+               result: RichResult):
+        """
+        Record a fresh result
+        """
+        self.entries[name] = {
+            'version': result.version,
+            'url': result.url,
+            'gitref': result.gitref,
+            'revision': result.revision,
+            'checked': time.time(),
+            'hash': entry_hash(entry),
+            'matrix_version': matrix_version,
+        }
+
+    def save(self):
+        """
+        Write the state back to disk
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
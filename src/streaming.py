@@ -0,0 +1,184 @@
+"""
+Hand response bodies to sources in chunks instead of buffering them
+
+A source sets a BodyConsumer in `body_consumer` around its request. With the
+tornado backend, the body then flows to the consumer as it arrives, and the
+transfer is aborted once the consumer needs no more of it. Other backends
+buffer the body and hand it over at once.
+"""
+
+import sys
+import contextvars
+import json as _json
+from urllib.parse import urlencode
+from typing import Optional, Dict, Any
+
+from nvchecker.httpclient.base import (
+    BaseSession, Response, TemporaryError, HTTPError,
+)
+
+from .http_session import SessionWrapper
+
+
+class BodyConsumer:
+    """
+    Receives the body of a streamed response
+    """
+
+    def reset(self):
+        """
+        An attempt of the request starts, the body starts over
+        """
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Take the next chunk of the body
+        return: False once no more of the body is needed
+        """
+        return True
+
+
+# consumer of the body of the requests made by the current task
+body_consumer: contextvars.ContextVar[BodyConsumer | None] = contextvars.ContextVar(
+    'body_consumer', default=None)
+
+
+class StreamedResponse(Response):
+    """
+    Response whose body went to a BodyConsumer
+    :param size: bytes handed to the consumer
+    :param complete: False if the transfer was stopped early
+    :param code: status code, None if the backend hides it
+    """
+
+    def __init__(self, headers, body: bytes, size: int, complete: bool,
+                 code: int | None = None):
+        super().__init__(headers, body)
+        self.size = size
+        self.complete = complete
+        self.code = code
+
+
+class StreamingSession(SessionWrapper):
+    """
+    Innermost session, streaming the bodies of requests with a body_consumer
+    """
+
+    def __init__(self, inner: BaseSession, keep_body: bool = False):
+        """
+        :param keep_body: also return the streamed body, for the recording
+        """
+        super().__init__(inner)
+        self.keep_body = keep_body
+
+    async def request_impl(
+        self, url: str, *,
+        method: str,
+        proxy: Optional[str] = None,
+        headers: Dict[str, str] = {},
+        follow_redirects: bool = True,
+        params=(),
+        json=None,
+        body=None,
+        verify_cert: bool = True,
+    ) -> Response:
+        consumer = body_consumer.get()
+        # nvchecker only imports the backend it is configured with
+        backend = sys.modules.get('nvchecker.httpclient.tornado_httpclient')
+        if (consumer is None or backend is None
+                or not isinstance(self.inner, backend.TornadoSession)):
+            res = await super().request_impl(
+                url, method=method, proxy=proxy, headers=headers,
+                follow_redirects=follow_redirects, params=params,
+                json=json, body=body, verify_cert=verify_cert)
+            if consumer is None:
+                return res
+            consumer.reset()
+            consumer.feed(res.body)
+            return StreamedResponse(res.headers, res.body, len(res.body), True)
+
+        from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPClientError
+        pycurl = backend.pycurl
+
+        consumer.reset()
+        status = None
+        stopped = False
+        size = 0
+        kept: list[bytes] | None = [] if self.keep_body else None
+        # chunks which arrived before the status line, tornado delivers the
+        # whole body first when the transfer ends in one go
+        pending: list[bytes] = []
+
+        def on_header(line: str):
+            nonlocal status
+            if line.startswith('HTTP/'):
+                try:
+                    status = int(line.split()[1])
+                except (IndexError, ValueError):
+                    status = None
+
+        def on_chunk(chunk: bytes):
+            if status is None:
+                pending.append(chunk)
+                return
+            # bodies of redirects and errors are not for the consumer
+            if 200 <= status < 300:
+                deliver(chunk)
+
+        def deliver(chunk: bytes):
+            nonlocal stopped, size
+            if stopped:
+                return
+            size += len(chunk)
+            if kept is not None:
+                kept.append(chunk)
+            if not consumer.feed(chunk):
+                stopped = True
+
+        def prepare_curl(curl):
+            backend.setup_curl(curl)
+            # a non-zero return aborts the transfer
+            curl.setopt(pycurl.NOPROGRESS, 0)
+            curl.setopt(pycurl.XFERINFOFUNCTION, lambda *args: 1 if stopped else 0)
+
+        kwargs: Dict[str, Any] = {
+            'method': method,
+            'headers': headers,
+            'request_timeout': self.inner.timeout,
+            'follow_redirects': follow_redirects,
+            'validate_cert': verify_cert,
+            'header_callback': on_header,
+            'streaming_callback': on_chunk,
+        }
+        if body:
+            kwargs['body'] = body
+        elif json:
+            kwargs['body'] = _json.dumps(json)
+        if pycurl is not None:
+            kwargs['prepare_curl_callback'] = prepare_curl
+        if proxy:
+            host, port = proxy.rsplit(':', 1)
+            kwargs['proxy_host'] = host
+            kwargs['proxy_port'] = int(port)
+        if params:
+            url += '?' + urlencode(params)
+
+        try:
+            res = await AsyncHTTPClient().fetch(HTTPRequest(url, **kwargs), raise_error=False)
+        except HTTPClientError as e:
+            if not stopped:
+                raise
+            # the transfer was aborted on purpose
+            res = e.response
+        if pending and res is not None and 200 <= res.code < 300:
+            for chunk in pending:
+                deliver(chunk)
+        kept_body = b''.join(kept) if kept is not None else b''
+        if stopped:
+            return StreamedResponse(res.headers if res is not None else {},
+                                    kept_body, size, False, status)
+        if res.code >= 500:
+            raise TemporaryError(res.code, res.reason, res)
+        if res.code >= 400:
+            raise HTTPError(res.code, res.reason, res)
+        return StreamedResponse(res.headers, kept_body, size, True, res.code)
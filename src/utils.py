@@ -14,6 +14,57 @@ class SelfRichResult(RichResult):
     vinfo: SystemInfo
 
 
+class MatrixIndex:
+    """
+    The support matrix parsed once, with its systems indexed by directory
+    """
+
+    def __init__(self, systems: Systems, vinfos: list[SystemInfo] | None = None):
+        self.systems = systems
+        self.vinfos: list[SystemInfo] = gen_oldver(systems) if vinfos is None else vinfos
+        # directory of the system -> system
+        self.by_path: dict[str, SystemInfo] = {}
+        # every directory -> all systems in its subtree
+        self.by_prefix: dict[str, list[SystemInfo]] = {}
+        for vinfo in self.vinfos:
+            parts = vinfo.raw_data.link[:-1]
+            self.by_path['/'.join(parts)] = vinfo
+            for i in range(1, len(parts) + 1):
+                self.by_prefix.setdefault(
+                    '/'.join(parts[:i]), []).append(vinfo)
+
+    @classmethod
+    def load(cls, matrix_dir: str) -> 'MatrixIndex':
+        """
+        Parse the matrix in matrix_dir
+        """
+        return cls(Systems(matrix_dir))
+
+    def get(self, rel_path: str) -> SystemInfo | None:
+        """
+        The system described by a directory, if any
+        """
+        return self.by_path.get(rel_path)
+
+    def under(self, rel_path: str) -> list[SystemInfo]:
+        """
+        All systems in the subtree of a directory
+        """
+        return self.by_prefix.get(rel_path, [])
+
+    def is_rtos(self, vinfo: SystemInfo) -> bool:
+        """
+        Whether a system is an embedded one
+        """
+        return vinfo.system in self.systems.rtos
+
+    def only_rtos(self, rel_path: str) -> bool:
+        """
+        Whether all systems in the subtree of a directory are embedded ones
+        """
+        return all(self.is_rtos(v) for v in self.under(rel_path))
+
+
 def gen_item_name(vinfo: SystemInfo,
                   overwrite_vendor: str | None = None,
                   overwrite_system: str | None = None,
@@ -37,19 +88,25 @@ def gen_item_name(vinfo: SystemInfo,
     return [f"{vendor}-{b_variant}-{system}-{variant}" for b_variant in b_variants]
 
 
-def gen_old(matrix) -> dict[str, SelfRichResult]:
+def gen_old(matrix: MatrixIndex, selector=None) -> dict[str, SelfRichResult]:
     """
     Generate old versions from the matrix
-    :param matrix: Systems object
+    :param matrix: MatrixIndex object
+    :param selector: only the systems selected by this Selector
     :return: list of old versions
     """
     res = {}
-    old = gen_oldver(matrix)
 
-    for vinfo in old:
+    for vinfo in matrix.vinfos:
         if vinfo.version is None:
             continue
-        for name in gen_item_name(vinfo):
+        if selector is None:
+            names = gen_item_name(vinfo)
+        elif selector.matches(vinfo):
+            names = selector.item_names(vinfo)
+        else:
+            continue
+        for name in names:
             res[name] = SelfRichResult(
                 version=vinfo.version,
                 vinfo=vinfo,
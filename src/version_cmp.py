@@ -1,51 +1,51 @@
 """
 Compare two versions
 """
-from awesomeversion import AwesomeVersion
+from functools import lru_cache
+from typing import Iterable
 from nvchecker.core import RichResult
 import re
 
+# special case: if "sp*" is in the version, treat it as a suffix.
+# Like "2.0-sp1" becomes "2.0+sp1" to make it bigger than "2.0".
+# Note: the `-sp\d+` field may not be at the end of the version string.
+_SP_SUFFIX = re.compile(r'-sp(\d+)')
 
-def version_cmp(v1: str, v2: str) -> int:
-    """
-    Compare two versions
-    """
-    v1 = AwesomeVersion(v1)
-    v2 = AwesomeVersion(v2)
+VERSION_KEY_CACHE_SIZE = 8192
 
+
+@lru_cache(maxsize=VERSION_KEY_CACHE_SIZE)
+def _version_key(v: str) -> str:
     # replace all space in version strings with '-'
-    v1 = v1.replace(" ", "-")
-    v2 = v2.replace(" ", "-")
+    v = v.replace(" ", "-")
 
     # make all versions lowercase
-    v1 = v1.lower()
-    v2 = v2.lower()
+    v = v.lower()
 
     # remove the 'v' prefix if it exists
-    if v1.startswith("v"):
-        v1 = v1[1:]
-    if v2.startswith("v"):
-        v2 = v2[1:]
-
-    # special case: if "sp*" is in the version, treat it as a suffix.
-    # Like "2.0-sp1" becomes "2.0+sp1" to make it bigger than "2.0".
-    # Note: the `-sp\d+` field may not be at the end of the version string.
-    def replace_sp_suffix(version: str) -> str:
-        # Split the version by '-sp\d+' into parts
-        parts = re.split(r'(-sp\d+)', version)
-        # Replace the '-sp\d+' part with '+sp\d+' if it exists
-        for i in range(len(parts)):
-            if parts[i].startswith('-sp'):
-                parts[i] = '+' + parts[i][1:]
-        # Join the parts back together
-        return ''.join(parts)
-
-    v1 = replace_sp_suffix(v1)
-    v2 = replace_sp_suffix(v2)
-
-    if v1 > v2:
+    if v.startswith("v"):
+        v = v[1:]
+
+    return _SP_SUFFIX.sub(r'+sp\1', v)
+
+
+def version_key(version: str | RichResult) -> str:
+    """
+    Normalize a version into the key it is ordered by, memoized
+    """
+    return _version_key(str(version))
+
+
+def version_cmp(v1: str, v2: str) -> int:
+    """
+    Compare two versions
+    """
+    k1 = version_key(v1)
+    k2 = version_key(v2)
+
+    if k1 > k2:
         return 1
-    if v1 < v2:
+    if k1 < k2:
         return -1
     return 0
 
@@ -71,17 +71,40 @@ def is_same(v1: str, v2: str) -> bool:
     return version_cmp(v1, v2) == 0
 
 
+def max_version(versions: Iterable[str | RichResult]) -> str | RichResult | None:
+    """
+    Pick the newest of many versions in one pass
+    """
+    return max(versions, key=version_key, default=None)
+
+
+def sort_versions(versions: Iterable[str | RichResult],
+                  reverse: bool = False) -> list[str | RichResult]:
+    """
+    Sort versions from the oldest to the newest
+    """
+    return sorted(versions, key=version_key, reverse=reverse)
+
+
+def newer_entry(old: RichResult | None, new: RichResult) -> dict | None:
+    """
+    Compare one checked version with the old one, as an item of filter_newer
+    return: {"old": old, "new": new} if new is newer or old is unknown, else None
+    """
+    if old is None or version_key(new) > version_key(old):
+        return {"old": old, "new": new}
+    return None
+
+
 def filter_newer(oldvers: dict[str, RichResult], newvers: dict[str, RichResult]) -> dict[RichResult]:
     """
     Filter out the newer versions
     """
     result: dict[str, dict["old" | "new", int | None]] = {}  # type: ignore
     for prod, ver in newvers.items():
-        if prod not in oldvers:
-            result[prod] = {"old": None, "new": ver}
-            continue
-        if is_newer(ver, oldvers[prod]):
-            result[prod] = {"old": oldvers[prod], "new": ver}
+        item = newer_entry(oldvers.get(prod), ver)
+        if item is not None:
+            result[prod] = item
     for prod, ver in oldvers.items():
         if prod not in newvers:
             result[prod] = {"old": ver, "new": None}
@@ -0,0 +1,96 @@
+"""
+Pool running the CPU-bound parsing of the sources off the event loop
+
+Matching a regex over a large listing, parsing a page for an xpath and
+sorting the versions found hold the event loop which also drives every
+request of the run. The regex and htmlparser sources hand bodies larger than
+`__config__.workers.min_size` to a thread or process pool instead. At most
+`queue` bodies wait for or are in the pool, the next ones wait on the loop,
+so a burst of large listings does not pile up in memory.
+"""
+
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# bodies smaller than this many bytes are parsed on the loop, the hand-off
+# would cost more than the parsing
+DEFAULT_MIN_SIZE = 64 * 1024
+
+
+class ParsePool:
+    """
+    Thread or process pool with a bounded number of jobs in flight
+
+    `options` is the `__config__.workers` table:
+        kind: thread or process, thread by default
+        size: workers, the number of cpus by default
+        queue: jobs in the pool at once, twice the workers by default
+        min_size: bytes of a body below which it is parsed on the loop
+    """
+
+    def __init__(self, options: dict):
+        self.kind = options.get('kind', 'thread')
+        self.size = options.get('size') or os.cpu_count() or 1
+        self.queue = options.get('queue') or 2 * self.size
+        self.min_size = options.get('min_size', DEFAULT_MIN_SIZE)
+        self.executor: Executor
+        if self.kind == 'process':
+            # forking a process running the http client threads is unsafe
+            self.executor = ProcessPoolExecutor(
+                self.size, mp_context=multiprocessing.get_context('spawn'))
+        elif self.kind == 'thread':
+            self.executor = ThreadPoolExecutor(self.size, thread_name_prefix='parse')
+        else:
+            raise ValueError(f"unknown worker kind {self.kind!r}, thread or process")
+        self._slots: asyncio.Semaphore | None = None
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        Run func(*args) in the pool, waiting for a slot if it is full
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.queue)
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, func, *args)
+
+    def close(self):
+        global pool
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if pool is self:
+            pool = None
+
+
+# the pool of the current CheckSession
+pool: ParsePool | None = None
+
+
+def setup(options: dict) -> ParsePool | None:
+    """
+    Make the pool configured by `__config__.workers` the current one
+    """
+    global pool
+    if pool is not None:
+        pool.close()
+    pool = ParsePool(options) if options.get('enabled', True) else None
+    if pool is not None:
+        logger.info("Parsing bodies over %d bytes in %d %s workers",
+                    pool.min_size, pool.size, pool.kind)
+    return pool
+
+
+async def offload(size: int, func: Callable, *args) -> Any:
+    """
+    Run func(*args) for a body of size bytes in the current pool, on the
+    loop without a pool or for a small body
+    """
+    p = pool
+    if p is None or size < p.min_size:
+        return func(*args)
+    return await p.run(func, *args)
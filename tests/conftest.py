@@ -0,0 +1,137 @@
+"""
+Shared fixtures of the tests
+
+Upstreams are never contacted: pipeline tests replay a fixture archive
+through the ReplayServer of src/replay.py, the GitHub APIs are answered by a
+FakeServer routing requests to handlers of the test.
+"""
+
+import os
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable
+from urllib.parse import urlsplit
+
+import pytest
+
+from src import metrics, workers
+
+
+class FakeServer:
+    """
+    Local http server answering with the handler of the test
+
+    A handler gets the request and returns code, headers and body, a dict or
+    list body is sent as json. Every request is kept in `requests`.
+    """
+
+    def __init__(self):
+        self.handler: Callable[[dict], tuple[int, dict, object]] = \
+            lambda req: (404, {}, b'no handler')
+        self.requests: list[dict] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _answer(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                parts = urlsplit(self.path)
+                req = {
+                    'method': self.command,
+                    'path': parts.path,
+                    'query': parts.query,
+                    'headers': dict(self.headers),
+                    'body': raw,
+                    'json': json.loads(raw) if raw and raw[:1] in b'{[' else None,
+                }
+                server.requests.append(req)
+                code, headers, body = server.handler(req)
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+                    headers = {'Content-Type': 'application/json', **headers}
+                self.send_response(code)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PATCH = _answer
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeServer':
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_run():
+    """
+    Every test starts with empty metrics and no parse pool
+    """
+    metrics.reset()
+    yield
+    if workers.pool is not None:
+        workers.pool.close()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """
+    Synthetic config tree and matrix of today's size, with the upstream
+    listings of its entries recorded in a fixture archive
+    return: config dir, matrix dir, fixture archive, parsed matrix
+    """
+    from bench.synthetic import generate
+    return generate(str(tmp_path / 'tree'), 1)
+
+
+@pytest.fixture
+def edit_configs(tree):
+    """
+    Replace a text in every config of the tree
+    """
+    def edit(old: str, new: str):
+        for cur, _, files in os.walk(tree[0]):
+            for f in files:
+                path = os.path.join(cur, f)
+                with open(path, encoding='utf-8') as fp:
+                    text = fp.read()
+                with open(path, 'w', encoding='utf-8') as fp:
+                    fp.write(text.replace(old, new))
+    return edit
+
+
+@pytest.fixture
+def fake_server():
+    server = FakeServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def mirror_server():
+    """
+    A second FakeServer, for a mirror of the fake_server
+    """
+    server = FakeServer().start()
+    yield server
+    server.stop()
@@ -0,0 +1,83 @@
+import os
+import subprocess
+
+import pytest
+
+import main
+from src.utils import MatrixIndex
+from src.changes import changed_selector, selects_nothing
+
+
+@pytest.fixture
+def repo(tree, monkeypatch):
+    """
+    The tree committed to a git repository, its first commit tagged base
+    """
+    conf_dir, matrix_dir, _, matrix = tree
+    root = os.path.dirname(conf_dir)
+    for k, v in {'GIT_AUTHOR_NAME': 'test', 'GIT_AUTHOR_EMAIL': 'test@example.invalid',
+                 'GIT_COMMITTER_NAME': 'test', 'GIT_COMMITTER_EMAIL': 'test@example.invalid'}.items():
+        monkeypatch.setenv(k, v)
+    git(root, 'init', '-q')
+    with open(os.path.join(conf_dir, 'Board3', 'config.yml'), 'w', encoding='utf-8') as f:
+        f.write('board5-generic-system0-null:\n  source: manual\n  manual: "1"\n')
+    commit(root)
+    git(root, 'tag', 'base')
+    return conf_dir, matrix_dir, matrix, root
+
+
+def git(cwd: str, *args: str):
+    subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True)
+
+
+def commit(root: str):
+    git(root, 'add', '-A')
+    git(root, 'commit', '-qm', 'change')
+
+
+def selected(repo) -> set[str] | None:
+    conf_dir, matrix_dir, matrix, _ = repo
+    selector = changed_selector('base', conf_dir, matrix_dir, matrix)
+    return selector.names(matrix) if selector is not None else None
+
+
+def test_changed_config_selects_its_systems(repo):
+    conf_dir = repo[0]
+    with open(os.path.join(conf_dir, 'Board1', 'System2', 'config.yml'), 'a',
+              encoding='utf-8') as f:
+        f.write('# changed\n')
+
+    assert selected(repo) == {'board1-generic-system2-null'}
+
+
+def test_deleted_config_selects_the_systems_of_its_entries(repo):
+    conf_dir, _, _, root = repo
+    os.remove(os.path.join(conf_dir, 'Board3', 'config.yml'))
+    commit(root)
+
+    assert selected(repo) == {'board3-generic-system0-null', 'board3-generic-system1-null',
+                              'board3-generic-system2-null', 'board5-generic-system0-null'}
+
+
+def test_root_config_or_unknown_ref_checks_everything(repo):
+    conf_dir, matrix_dir, matrix, _ = repo
+    assert changed_selector('missing', conf_dir, matrix_dir, matrix) is None
+
+    with open(os.path.join(conf_dir, 'config.toml'), 'a', encoding='utf-8') as f:
+        f.write('# changed\n')
+    assert selected(repo) is None
+
+
+def test_nothing_changed_checks_nothing(repo, tmp_path, monkeypatch):
+    conf_dir, matrix_dir, matrix, _ = repo
+    monkeypatch.setattr(MatrixIndex, 'load', classmethod(lambda cls, d: matrix))
+    assert selects_nothing(changed_selector('base', conf_dir, matrix_dir, matrix))
+    report = tmp_path / 'report.md'
+
+    # without a replay archive, a check would reach out to upstream.invalid
+    main.main(['-p', conf_dir, '-m', matrix_dir, '--cache-dir', str(tmp_path / 'cache'),
+               '--changed-since', 'base', '-r', str(report)])
+
+    text = report.read_text(encoding='utf-8')
+    assert '# Update Report' in text
+    assert '| [' not in text
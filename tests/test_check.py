@@ -0,0 +1,34 @@
+import asyncio
+import threading
+
+from src.run_nvchecker import CheckSession, check
+
+from bench.synthetic import listing
+
+
+def test_results_are_yielded_while_slower_entries_are_pending(fake_server):
+    released = threading.Event()
+    body = listing(3)
+
+    def answer(req):
+        if req['path'] == '/slow/':
+            released.wait(5)
+        return 200, {'Content-Type': 'text/html'}, body
+
+    fake_server.handler = answer
+    entries = {name: {'source': 'regex', 'url': f'{fake_server.url}/{name}/',
+                      'regex': r'<a href="(\d{8})/">'} for name in ('slow', 'a', 'b')}
+
+    async def collect():
+        seen = []
+        async for name, r in check(entries, client=CheckSession.from_config()):
+            seen.append((name, r.version, released.is_set()))
+            if len(seen) == 2:
+                released.set()
+        return seen
+
+    seen = asyncio.run(collect())
+
+    # the fast entries came while the slow one was still held by the server
+    assert sorted(seen[:2]) == [('a', '20240103', False), ('b', '20240103', False)]
+    assert seen[2] == ('slow', '20240103', True)
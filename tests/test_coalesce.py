@@ -0,0 +1,49 @@
+import os
+
+import yaml
+from nvchecker.util import RawResult
+
+from src.utils import gen_old
+from src.run_nvchecker import coalesce_entries, FanoutQueue, run_nvchecker
+
+from bench.synthetic import listing
+
+
+def test_identical_configs_share_one_check():
+    shared = {'source': 'regex', 'url': 'http://upstream.invalid/', 'regex': 'x'}
+    unique, groups = coalesce_entries({
+        'a': dict(shared), 'b': dict(shared),
+        'c': {**shared, 'regex': 'y'},
+        # the result of these sources depends on the entry name
+        'd': {'source': 'none'}, 'e': {'source': 'none'},
+    })
+
+    assert list(unique) == ['a', 'c', 'd', 'e']
+    assert groups == {'a': ['a', 'b'], 'c': ['c'], 'd': ['d'], 'e': ['e']}
+
+    q = FanoutQueue(groups)
+    q.put_nowait(RawResult('a', '1.0', shared))
+    assert [q.get_nowait().name for _ in range(q.qsize())] == ['a', 'b']
+
+
+def test_board_variants_sharing_an_url_fetch_it_once(tree, fake_server):
+    conf_dir, matrix_dir, _, matrix = tree
+    body = listing(3)
+    fake_server.handler = lambda req: (200, {'Content-Type': 'text/html'}, body)
+    # Board0/System0 expands its `null` config to every board variant
+    matrix.vinfos[0].board_variants = ['duo', 'duo256m']
+    for cur, _, files in os.walk(conf_dir):
+        if 'config.yml' in files:
+            with open(os.path.join(cur, 'config.yml'), 'w', encoding='utf-8') as f:
+                yaml.safe_dump({'null': {
+                    'source': 'regex', 'url': f'{fake_server.url}/shared/',
+                    'regex': r'<a href="(\d{8})/">'}}, f)
+    old = gen_old(matrix)
+
+    new, has_failures, *_ = run_nvchecker(conf_dir, matrix_dir, old, matrix=matrix)
+
+    assert len(fake_server.requests) == 1
+    assert not has_failures
+    assert set(new) == set(old)
+    assert {'board0-duo-system0-null', 'board0-duo256m-system0-null'} <= set(new)
+    assert {r.version for r in new.values()} == {'20240103'}
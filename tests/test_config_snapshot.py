@@ -0,0 +1,55 @@
+import os
+import shutil
+
+from src.utils import MatrixIndex
+from src.config_snapshot import ConfigSnapshot, matrix_key
+from src.run_nvchecker import load_all_configs
+
+
+def load(tree, snapshot, matrix=None):
+    conf_dir, matrix_dir, _, full = tree
+    return load_all_configs(conf_dir, matrix_dir, matrix or full, snapshot)[0]
+
+
+def key(tree, matrix=None):
+    conf_dir, matrix_dir, _, full = tree
+    matrix = matrix or full
+    return matrix_key(conf_dir, matrix_dir, matrix.vinfos, matrix.systems.rtos)
+
+
+def test_unchanged_trees_are_served_from_the_snapshot(tree, tmp_path):
+    path = str(tmp_path / 'configs.pickle')
+    first = load(tree, ConfigSnapshot(path))
+
+    snapshot = ConfigSnapshot(path)
+    assert snapshot.cached_result(key(tree))[0] == first
+    assert load(tree, snapshot) == first
+
+
+def test_changed_config_is_parsed_again(tree, tmp_path):
+    conf_dir = tree[0]
+    path = str(tmp_path / 'configs.pickle')
+    load(tree, ConfigSnapshot(path))
+
+    config = os.path.join(conf_dir, 'Board0', 'System0', 'config.yml')
+    with open(config, 'a', encoding='utf-8') as f:
+        f.write("  regex: 'changed'\n")
+    snapshot = ConfigSnapshot(path)
+    assert snapshot.cached_result(key(tree)) is None
+    assert load(tree, snapshot)['board0-generic-system0-null']['regex'] == 'changed'
+
+
+def test_removed_system_is_dropped_from_the_inputs(tree, tmp_path):
+    conf_dir, matrix_dir, _, matrix = tree
+    snapshot = ConfigSnapshot(str(tmp_path / 'configs.pickle'))
+    load(tree, snapshot)
+
+    # a daemon keeps its snapshot while a board goes away
+    shutil.rmtree(os.path.join(conf_dir, 'Board11'))
+    shutil.rmtree(os.path.join(matrix_dir, 'Board11'))
+    smaller = MatrixIndex(matrix.systems, [v for v in matrix.vinfos if v.product != 'Board11'])
+    confs = load(tree, snapshot, smaller)
+
+    assert not any('Board11' in p for p in snapshot.inputs)
+    assert not any('Board11' in p for p in snapshot.dirs)
+    assert snapshot.cached_result(key(tree, smaller))[0] == confs
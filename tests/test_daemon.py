@@ -0,0 +1,82 @@
+import os
+import time
+import signal
+import asyncio
+import sqlite3
+
+import pytest
+
+from src.utils import MatrixIndex
+from src.daemon import Daemon
+
+
+@pytest.fixture
+def daemon(tree, tmp_path, monkeypatch):
+    conf_dir, matrix_dir, fixtures, matrix = tree
+    loads = []
+
+    def load(cls, matrix_dir):
+        loads.append(matrix_dir)
+        return matrix
+
+    monkeypatch.setattr(MatrixIndex, 'load', classmethod(load))
+    published = []
+    d = Daemon(conf_dir, matrix_dir, str(tmp_path / 'cache'),
+               lambda *args: published.append(args), tick=0.05, replay=fixtures)
+    d.loads, d.published = loads, published
+    yield d
+    if d.session is not None:
+        d.session.close()
+    d.history.close()
+
+
+def test_matrix_is_reloaded_when_its_tree_changes(daemon):
+    assert daemon.reload_matrix()
+    assert not daemon.reload_matrix()
+    with open(os.path.join(daemon.matrix_dir, 'Board0', 'README.md'), 'w',
+              encoding='utf-8') as f:
+        f.write('changed\n')
+
+    assert daemon.reload_matrix()
+    assert len(daemon.loads) == 2
+
+
+def test_cycle_publishes_the_entries_due(daemon):
+    next_due = asyncio.run(daemon.cycle())
+
+    [(old, new, has_failures, _, _, timed_out)] = daemon.published
+    assert not has_failures and not timed_out
+    assert set(new) == set(old) != set()
+    assert {r.version for r in new.values()} == {'20240222'}
+    assert next_due > time.time() + 3600
+    # nothing is due until the ttl expired
+    asyncio.run(daemon.cycle())
+    assert len(daemon.published) == 1
+
+
+def test_edited_ttl_applies_to_the_next_cycle(daemon):
+    asyncio.run(daemon.cycle())
+    with open(os.path.join(daemon.conf_dir, 'config.toml'), 'a', encoding='utf-8') as f:
+        f.write('\n[__config__.incremental]\nttl = 0\n')
+
+    asyncio.run(daemon.cycle())
+
+    assert len(daemon.published) == 2
+    assert daemon.state.default_ttl == 0
+
+
+def test_sigterm_stops_the_daemon(daemon):
+    publish = daemon.publish
+
+    def publish_then_stop(*args):
+        publish(*args)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    daemon.publish = publish_then_stop
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(daemon.run_forever())
+
+    assert len(daemon.published) == 1
+    assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+    with pytest.raises(sqlite3.ProgrammingError):
+        daemon.history.db.execute('SELECT 1')
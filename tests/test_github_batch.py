@@ -0,0 +1,126 @@
+import re
+import time
+import asyncio
+
+import pytest
+import nvchecker_source.github as rest_github
+
+from src import config as cfg, metrics
+from src.dispatch import EntryTimeout
+from src.run_nvchecker import CheckSession, check
+
+ALIAS = re.compile(r'(r\d+): repository\(owner: "([^"]+)", name: "([^"]+)"\)')
+
+REPOS = {
+    'ok/tags': {'refs': {'nodes': [{'name': 'v1.2', 'target': {'oid': 'b'}},
+                                   {'name': 'v1.10', 'target': {'oid': 'a'}}]}},
+    'ok/release': {'latestRelease': {'name': 'One', 'url': 'https://example.invalid/r',
+                                     'tagName': 'v1.0', 'tagCommit': {'oid': 'c'}}},
+    'ok/norelease': {'latestRelease': None},
+}
+
+
+def graphql(req):
+    data, errors = {}, []
+    for alias, owner, name in ALIAS.findall(req['json']['query']):
+        repo = f'{owner}/{name}'
+        data[alias] = REPOS.get(repo)
+        if repo not in REPOS:
+            errors.append({'path': [alias], 'message': f'Could not resolve {repo}'})
+    return 200, {}, {'data': data, 'errors': errors}
+
+
+def rest(req):
+    if req['path'] == '/api.github.com/repos/ok/commits/commits':
+        return 200, {}, [{'sha': 'd', 'html_url': 'https://example.invalid/c',
+                          'commit': {'committer': {'date': '2024-01-02T03:04:05Z'}}}]
+    if req['path'] == '/api.github.com/repos/ok/release/releases/latest':
+        return 200, {}, {'tag_name': 'v1.0', 'name': 'One',
+                         'html_url': 'https://example.invalid/r'}
+    return 404, {}, {'message': 'Not Found'}
+
+
+@pytest.fixture
+def github(fake_server, monkeypatch):
+    """
+    The fake server answering both the GraphQL and the REST APIs
+    """
+    fake_server.handler = lambda req: graphql(req) if req['path'] == '/graphql' else rest(req)
+    monkeypatch.setitem(cfg._internal_configs, 'GITHUB_TOKEN', None)
+    monkeypatch.setitem(cfg._internal_configs, 'GITHUB_API_URL', fake_server.url)
+    for name in ('GITHUB_URL', 'GITHUB_LATEST_RELEASE'):
+        monkeypatch.setattr(rest_github, name, getattr(rest_github, name).replace(
+            'https://api.', f'{fake_server.url}/api.'))
+    return fake_server
+
+
+def run(entries: dict, config: dict) -> dict:
+    async def collect():
+        return {name: r async for name, r in check(
+            entries, client=CheckSession.from_config(config))}
+    return asyncio.run(collect())
+
+
+def entry(repo: str, **options) -> dict:
+    return {'source': 'github_batch', 'github': repo, **options}
+
+
+def test_one_query_answers_every_repository(github):
+    results = run({
+        'tags': entry('ok/tags', use_max_tag=True, token='t'),
+        'release': entry('ok/release', use_latest_release=True, token='t'),
+        'name': entry('ok/release', use_latest_release=True, use_release_name=True,
+                      token='t'),
+        'missing': entry('gone/repo', use_latest_release=True, token='t'),
+        'norelease': entry('ok/norelease', use_latest_release=True, token='t'),
+    }, {'source': {'github_batch': {'api_url': f'{github.url}/graphql'}}})
+
+    assert [r['path'] for r in github.requests] == ['/graphql']
+    assert github.requests[0]['headers']['Authorization'] == 'bearer t'
+    assert results['tags'].version == 'v1.10'
+    assert results['release'].version == 'v1.0'
+    assert results['release'].revision == 'c'
+    assert results['name'].version == 'One'
+    assert 'Could not resolve gone/repo' in str(results['missing'])
+    assert 'No release found' in str(results['norelease'])
+
+
+def test_batches_split_by_size_and_use_github_api_url(github):
+    entries = {f'e{i}': entry('ok/release', use_latest_release=True, token='t',
+                              tries=i + 1) for i in range(5)}
+
+    results = run(entries, {'source': {'github_batch': {'batch_size': 2}}})
+
+    assert [r['path'] for r in github.requests] == ['/graphql'] * 3
+    assert {r.version for r in results.values()} == {'v1.0'}
+
+
+def test_rest_api_checks_what_graphql_can_not(github):
+    results = run({
+        'branch': entry('ok/commits', branch='dev', token='t'),
+        'anonymous': entry('ok/release', use_latest_release=True),
+    }, {'source': {'github_batch': {}}})
+
+    assert sorted(r['path'] for r in github.requests) == [
+        '/api.github.com/repos/ok/commits/commits',
+        '/api.github.com/repos/ok/release/releases/latest']
+    assert results['branch'].version == '20240102.030405'
+    assert results['anonymous'].version == 'v1.0'
+
+
+def test_batched_entries_have_their_budget(github):
+    answer = github.handler
+
+    def slow(req):
+        time.sleep(1)
+        return answer(req)
+
+    github.handler = slow
+    results = run({
+        'release': entry('ok/release', use_latest_release=True, token='t'),
+        'tags': entry('ok/tags', use_max_tag=True, token='t'),
+    }, {'source': {'github_batch': {}}, 'timeouts': {'github_batch': 0.2}})
+
+    assert all(isinstance(r, EntryTimeout) for r in results.values())
+    assert {metrics.recorder.entries[n].status for n in results} == {'EntryTimeout'}
+    assert {metrics.recorder.entries[n].source for n in results} == {'github_batch'}
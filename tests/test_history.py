@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from nvchecker.core import RichResult
+
+from src.history import HistoryStore, state_changed, format_failing
+
+
+def old(product, version):
+    return SimpleNamespace(version=version, vinfo=SimpleNamespace(product=product))
+
+
+OLD = {'duo-generic-buildroot-null': old('Duo', '1.0'),
+       'mars-generic-fedora-null': old('Mars', '40')}
+NAMES = list(OLD)
+
+
+def test_latest_state_and_streaks(tmp_path):
+    history = HistoryStore(str(tmp_path / 'history.sqlite'))
+    history.record_run('run', NAMES, {'duo-generic-buildroot-null': RichResult(version='1.1'),
+                                      'mars-generic-fedora-null': RichResult(version='41')},
+                       set(), OLD)
+    history.record_run('run', NAMES, {'duo-generic-buildroot-null': RichResult(version='1.1')},
+                       set(), OLD)
+    history.record_run('run', NAMES, {'duo-generic-buildroot-null': RichResult(version='1.2')},
+                       {'mars-generic-fedora-null'}, OLD, {'duo-generic-buildroot-null': 0.5})
+
+    assert history.last_states() == {'duo-generic-buildroot-null': ('1.2', 'ok'),
+                                     'mars-generic-fedora-null': ('41', 'timed_out')}
+    assert history.failing(2) == [('mars-generic-fedora-null', 2, 'timed_out')]
+    assert history.failing(3) == []
+    assert 'mars-generic-fedora-null' in format_failing(history.failing(2))
+    assert [row[2:] for row in history.entry('duo-generic-buildroot-null')] == [
+        ('1.2', 'ok', 0.5), ('1.1', 'ok', None), ('1.1', 'ok', None)]
+    history.close()
+
+
+def test_last_new_by_name_or_product(tmp_path):
+    history = HistoryStore(str(tmp_path / 'history.sqlite'))
+    history.record_run('run', NAMES, {'duo-generic-buildroot-null': RichResult(version='1.1'),
+                                      'mars-generic-fedora-null': RichResult(version='41')},
+                       set(), OLD)
+    history.record_run('run', NAMES, {'duo-generic-buildroot-null': RichResult(version='1.1'),
+                                      'mars-generic-fedora-null': RichResult(version='42')},
+                       set(), OLD)
+
+    rows = history.last_new('Duo')
+    assert [(r[0], r[2]) for r in rows] == [('duo-generic-buildroot-null', '1.1')]
+    assert {(r[0], r[2]) for r in history.last_new('*')} == {
+        ('duo-generic-buildroot-null', '1.1'), ('mars-generic-fedora-null', '42')}
+    history.close()
+
+
+def test_state_changed():
+    last = {'a': ('1.0', 'ok'), 'b': ('1.0', 'failed')}
+    assert not state_changed(last, 'a', RichResult(version='1.0'))
+    assert state_changed(last, 'b', RichResult(version='1.0'))
+    assert state_changed(last, 'c', RichResult(version='1.0'))
+    assert state_changed(None, 'a', RichResult(version='1.0'))
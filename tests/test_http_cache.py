@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from nvchecker import core
+from nvchecker.httpclient import session
+
+from src import http_session
+from src.http_cache import HttpCache, CachedSession
+from src.replay import FixtureArchive, ReplayServer, ReplaySession, fixture_key
+from src.streaming import StreamingSession
+
+URL = 'http://upstream.invalid/listing/'
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    server = ReplayServer(FixtureArchive(str(tmp_path / 'fixtures.json'))).start()
+    yield server
+    server.stop()
+
+
+def serve(server: ReplayServer, code: int, headers: dict, body: bytes):
+    server.archive.add(fixture_key('GET', URL), URL, code, headers, body)
+
+
+def get(server: ReplayServer, cache: HttpCache) -> bytes:
+    core.setup_httpclient()
+    http_session.install(StreamingSession)
+    http_session.install(lambda inner: ReplaySession(inner, server))
+    http_session.install(lambda inner: CachedSession(inner, cache))
+    return asyncio.run(session.get(URL)).body
+
+
+def test_not_modified_serves_the_cached_body(upstream, tmp_path):
+    cache = HttpCache(str(tmp_path / 'http'))
+    serve(upstream, 200, {'ETag': '"v1"', 'Content-Type': 'text/html'}, b'v1')
+    assert get(upstream, cache) == b'v1'
+
+    serve(upstream, 304, {'ETag': '"v1"'}, b'')
+    assert get(upstream, cache) == b'v1'
+
+
+def test_empty_listing_replaces_the_cached_body(upstream, tmp_path):
+    cache = HttpCache(str(tmp_path / 'http'))
+    serve(upstream, 200, {'ETag': '"v1"', 'Content-Type': 'text/html'}, b'v1')
+    assert get(upstream, cache) == b'v1'
+
+    serve(upstream, 200, {'ETag': '"v2"'}, b'')
+    assert get(upstream, cache) == b''
+    assert get(upstream, cache) == b''
+
+
+def test_changed_body_is_stored(upstream, tmp_path):
+    cache = HttpCache(str(tmp_path / 'http'))
+    serve(upstream, 200, {'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'}, b'v1')
+    get(upstream, cache)
+    serve(upstream, 200, {'Last-Modified': 'Tue, 02 Jan 2024 00:00:00 GMT'}, b'v2')
+    assert get(upstream, cache) == b'v2'
+    cache.save()
+
+    serve(upstream, 304, {}, b'')
+    assert get(upstream, HttpCache(str(tmp_path / 'http'))) == b'v2'
+
+
+def test_fresh_response_is_not_revalidated(upstream, tmp_path):
+    cache = HttpCache(str(tmp_path / 'http'), ttl=3600)
+    serve(upstream, 200, {}, b'v1')
+    get(upstream, cache)
+    serve(upstream, 200, {}, b'v2')
+    assert get(upstream, cache) == b'v1'
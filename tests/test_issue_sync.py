@@ -0,0 +1,161 @@
+import json
+from urllib.parse import parse_qs
+
+import pytest
+
+from src.github_action import GithubManager, GithubRepoManager, Issue
+from src.issue_sync import (
+    IssueIndex, IssueSync, issue_key, key_of, key_marker, ISSUE_LABEL,
+)
+
+REPO = 'owner/repo'
+
+
+class FakeGithub:
+    """
+    The issues endpoints of a repository on a FakeServer
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.issues: list[dict] = []
+        server.handler = self.handle
+
+    def add(self, title: str, body: str = ''):
+        n = len(self.issues) + 1
+        self.issues.append({
+            'number': n, 'title': title, 'body': body,
+            'labels': [{'name': ISSUE_LABEL}],
+            'html_url': f"https://github.com/{REPO}/issues/{n}",
+        })
+
+    def handle(self, req):
+        repo = f"/repos/{REPO}"
+        if req['method'] == 'GET' and req['path'] == repo:
+            return 200, {}, {'name': 'repo', 'full_name': REPO,
+                             'url': f"{self.server.url}{repo}"}
+        if req['method'] == 'GET' and req['path'] == repo + '/issues':
+            return 200, {}, self.issues
+        if req['method'] == 'POST' and req['path'] == repo + '/issues':
+            self.add(req['json']['title'], req['json']['body'])
+            return 201, {}, self.issues[-1]
+        if req['path'].startswith(repo + '/issues/'):
+            issue = self.issues[int(req['path'].rsplit('/', 1)[1]) - 1]
+            if req['method'] == 'PATCH':
+                issue.update(req['json'])
+            return 200, {}, issue
+        return 404, {}, {'message': 'Not Found'}
+
+    def created(self) -> list[dict]:
+        return [r['json'] for r in self.server.requests if r['method'] == 'POST']
+
+    def updated(self) -> list[dict]:
+        return [r['json'] for r in self.server.requests if r['method'] == 'PATCH']
+
+    def listed(self) -> list[dict]:
+        return [parse_qs(r['query']) for r in self.server.requests
+                if r['path'].endswith('/issues') and r['method'] == 'GET']
+
+
+@pytest.fixture
+def github(fake_server):
+    return FakeGithub(fake_server)
+
+
+def sync(github, path, issues):
+    manager = GithubManager('token', github.server.url)
+    repo = GithubRepoManager(manager, REPO)
+    return IssueSync(repo, IssueIndex(path), min_interval=0).sync(issues)
+
+
+def new(product, system, version):
+    title = f"[Image Check] {product}:{system} has new version {version}"
+    return issue_key(product, system, version), Issue(title=title, body="body\n",
+                                                      labels=[ISSUE_LABEL])
+
+
+def test_key_of_reads_the_marker_then_the_title():
+    key, issue = new('Duo', 'buildroot', 'v1.1')
+    assert key_of(issue) == key
+    marked = Issue(title='renamed by hand', body='text\n' + key_marker('Duo:revyos@2'))
+    assert key_of(marked) == 'Duo:revyos@2'
+    assert key_of(Issue(title='unrelated', body='')) is None
+
+
+def test_index_persists(tmp_path):
+    path = str(tmp_path / 'issues.json')
+    index = IssueIndex(path)
+    index.add('Duo:buildroot@v1', Issue(title='t', body='', url='u'))
+    index.save()
+
+    assert 'Duo:buildroot@v1' in IssueIndex(path)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{broken')
+    assert IssueIndex(path).issues == {}
+
+
+def test_known_issues_are_not_created_again(github, tmp_path):
+    path = str(tmp_path / 'issues.json')
+    k1, i1 = new('Duo', 'buildroot', 'v1')
+    k2, i2 = new('Duo', 'revyos', '20240101')
+    k3, i3 = new('Mars', 'fedora', '41')
+    github.add(i1.title, i1.body + key_marker(k1) + '\n')
+    github.add('edited title', i2.body + key_marker(k2) + '\n')
+
+    res = sync(github, path, {k1: i1, k2: i2, k3: i3})
+
+    assert list(res) == [k3]
+    assert res[k3] == f"https://github.com/{REPO}/issues/3"
+    assert [c['title'] for c in github.created()] == [i3.title]
+    assert github.updated() == []
+    assert key_marker(k3) in github.created()[0]['body']
+    assert 'since' not in github.listed()[0]
+    with open(path, encoding='utf-8') as f:
+        assert set(json.load(f)['issues']) == {k1, k2, k3}
+
+
+def test_later_syncs_only_fetch_updated_issues(github, tmp_path):
+    path = str(tmp_path / 'issues.json')
+    k1, i1 = new('Duo', 'buildroot', 'v1')
+    sync(github, path, {k1: i1})
+
+    k1, i1 = new('Duo', 'buildroot', 'v1')
+    assert sync(github, path, {k1: i1}) == {}
+    assert len(github.created()) == 1
+    assert 'since' in github.listed()[-1]
+    assert github.listed()[-1]['labels'] == [ISSUE_LABEL]
+
+
+def test_known_issues_with_another_body_are_updated(github, tmp_path):
+    path = str(tmp_path / 'issues.json')
+    key, issue = new('Duo', 'buildroot', 'v1')
+    github.add(issue.title, 'old body\n')
+
+    res = sync(github, path, {key: issue})
+
+    assert res == {key: f"https://github.com/{REPO}/issues/1"}
+    assert github.created() == []
+    assert github.updated() == [{'body': 'body\n' + key_marker(key) + '\n'}]
+    # the index knows the new body, the next sync leaves the issue alone
+    key, issue = new('Duo', 'buildroot', 'v1')
+    assert sync(github, path, {key: issue}) == {}
+    assert len(github.updated()) == 1
+
+
+def test_failed_fetch_creates_nothing_and_keeps_the_index(github, tmp_path):
+    path = str(tmp_path / 'issues.json')
+    k1, i1 = new('Duo', 'buildroot', 'v1')
+    sync(github, path, {k1: i1})
+    answer = github.handle
+
+    def broken(req):
+        if req['method'] == 'GET' and req['path'].endswith('/issues'):
+            return 404, {}, {'message': 'Not Found'}
+        return answer(req)
+
+    github.server.handler = broken
+    k2, i2 = new('Duo', 'revyos', '20240101')
+
+    assert sync(github, path, {k2: i2}) == {k2: None}
+    assert len(github.created()) == 1
+    assert k1 in IssueIndex(path)
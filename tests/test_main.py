@@ -0,0 +1,119 @@
+import re
+import time
+
+import pytest
+
+import main
+from src.utils import MatrixIndex, gen_old
+
+from bench.synthetic import listing
+
+
+def test_shards_merge_into_one_report(tree, tmp_path, monkeypatch):
+    conf_dir, matrix_dir, fixtures, matrix = tree
+    monkeypatch.setattr(MatrixIndex, 'load', classmethod(lambda cls, d: matrix))
+    cache_dir = str(tmp_path / 'cache')
+    partials = tmp_path / 'partials'
+    report = tmp_path / 'report.md'
+    common = ['-p', conf_dir, '-m', matrix_dir, '--cache-dir', cache_dir,
+              '--replay', fixtures]
+
+    for i in range(2):
+        main.main(common + ['--shard', f'{i}/2', '--partial', str(partials / f'{i}.json')])
+    main.main(common + ['--merge', str(partials), '-r', str(report)])
+
+    text = report.read_text(encoding='utf-8')
+    assert '## Skipped Products' in text
+    rows = [line.split(' | ')[0].lstrip('| ') for line in text.splitlines()
+            if '| 20240222 |' in line]
+    assert sorted(rows) == sorted(k for k, v in gen_old(matrix).items()
+                                  if v.version < '20240222') != []
+
+
+def test_merge_without_partials_fails(tree, tmp_path, monkeypatch):
+    conf_dir, matrix_dir, _, matrix = tree
+    monkeypatch.setattr(MatrixIndex, 'load', classmethod(lambda cls, d: matrix))
+    (tmp_path / 'partials').mkdir()
+
+    with pytest.raises(SystemExit):
+        main.main(['-p', conf_dir, '-m', matrix_dir, '--cache-dir', str(tmp_path / 'cache'),
+                   '--merge', str(tmp_path / 'partials'), '-r', str(tmp_path / 'report.md')])
+    assert not (tmp_path / 'report.md').exists()
+
+
+def test_selected_systems_are_the_only_ones_reported(tree, tmp_path, monkeypatch):
+    conf_dir, matrix_dir, fixtures, matrix = tree
+    monkeypatch.setattr(MatrixIndex, 'load', classmethod(lambda cls, d: matrix))
+    report = tmp_path / 'report.md'
+
+    main.main(['-p', conf_dir, '-m', matrix_dir, '--cache-dir', str(tmp_path / 'cache'),
+               '--replay', fixtures, '--select-path', 'Board1,Board2/System0', '-r', str(report)])
+
+    selected = {'board1-generic-system0-null', 'board1-generic-system1-null',
+                'board1-generic-system2-null', 'board2-generic-system0-null'}
+    assert sorted(rows(report.read_text(encoding='utf-8'), '20240222')) == sorted(
+        k for k, v in gen_old(matrix).items() if k in selected and v.version < '20240222')
+
+
+def test_changed_only_keeps_the_report_of_an_unchanged_run(tree, tmp_path, monkeypatch):
+    conf_dir, matrix_dir, fixtures, matrix = tree
+    monkeypatch.setattr(MatrixIndex, 'load', classmethod(lambda cls, d: matrix))
+    report = tmp_path / 'report.md'
+    run = ['-p', conf_dir, '-m', matrix_dir, '--cache-dir', str(tmp_path / 'cache'),
+           '--replay', fixtures, '--changed-only', '-r', str(report)]
+
+    main.main(run)
+    assert sorted(rows(report.read_text(encoding='utf-8'), '20240222')) == sorted(
+        k for k, v in gen_old(matrix).items() if v.version < '20240222')
+
+    report.write_text('last report', encoding='utf-8')
+    main.main(run)
+    assert report.read_text(encoding='utf-8') == 'last report'
+
+
+def test_report_streams_and_completes_with_timed_out_entries(tree, tmp_path, monkeypatch,
+                                                             fake_server, edit_configs):
+    conf_dir, matrix_dir, _, matrix = tree
+    monkeypatch.setattr(MatrixIndex, 'load', classmethod(lambda cls, d: matrix))
+    report = tmp_path / 'report.md'
+    body = listing(3)
+    during = []
+
+    def answer(req):
+        if req['path'] == '/Board0/System1/':
+            # the others are reported while this check is still running
+            time.sleep(1)
+            during.append(report.read_text(encoding='utf-8'))
+            time.sleep(2)
+        return 200, {'Content-Type': 'text/html'}, body
+
+    fake_server.handler = answer
+    edit_configs('http://upstream.invalid', fake_server.url)
+    with open(f"{conf_dir}/config.toml", 'a', encoding='utf-8') as f:
+        f.write('\n[__config__.timeouts]\nregex_stream = 1.5\n')
+
+    # fewer entries than the connections of the client, so only the held one times out
+    with pytest.raises(SystemExit):
+        main.main(['-p', conf_dir, '-m', matrix_dir, '--cache-dir', str(tmp_path / 'cache'),
+                   '--select-path', 'Board0,Board1', '-r', str(report)])
+
+    newer = sorted(k for k, v in gen_old(matrix).items()
+                   if k.startswith(('board0-', 'board1-')) and v.version < '20240103')
+    assert 'board0-generic-system1-null' in newer
+    assert rows(during[0], '20240103') and '## Skipped Products' not in during[0]
+    text = report.read_text(encoding='utf-8')
+    assert text.startswith(main.REPORT_HEADER)
+    assert text.count('# Update Report') == 1
+    assert sorted(rows(text, '20240103')) == [k for k in newer
+                                              if k != 'board0-generic-system1-null']
+    timed_out = text.split('## Timed Out Products')[1]
+    assert '| board0-generic-system1-null |' in timed_out
+    # every row of a table has the columns of its header
+    for table in re.findall(r'((?:^\|.*\|\n)+)', text, re.M):
+        widths = {line.count(' | ') for line in table.splitlines()}
+        assert len(widths) == 1, table
+
+
+def rows(text: str, version: str) -> list[str]:
+    return [line.split(' | ')[0].lstrip('| ') for line in text.splitlines()
+            if f'| {version} |' in line]
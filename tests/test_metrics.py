@@ -0,0 +1,75 @@
+import re
+import json
+
+from nvchecker.core import RichResult
+
+import main
+from src import metrics
+from src.config import parse_args
+from src.utils import gen_old
+
+SAMPLE = re.compile(r'^image_checker_\w+\{(\w+="(?:[^"\\]|\\.)*",?)+\} [0-9.e+-]+$')
+
+
+def recorded() -> metrics.Recorder:
+    rec = metrics.recorder
+    with rec.span('load_all_configs'):
+        pass
+    with rec.span('create_issue', 'github', title='t'):
+        pass
+    entry = rec.entry('duo-generic-"buildroot"-null')
+    entry.source, entry.seconds, entry.queue_wait = 'regex', 1.5, 0.25
+    host = rec.host('upstream.invalid')
+    host.requests, host.attempts, host.errors, host.bytes = 2, 3, 1, 100
+    return rec
+
+
+def test_prometheus_textfile(tmp_path):
+    path = tmp_path / 'metrics.prom'
+    recorded().write_prometheus(str(path))
+
+    lines = path.read_text(encoding='utf-8').splitlines()
+    samples = [line for line in lines if not line.startswith('#')]
+    assert all(SAMPLE.match(line) for line in samples), samples
+    # every metric is described before its samples
+    for line in samples:
+        metric = line.split('{')[0]
+        assert lines.index(f'# TYPE {metric} ' + ('counter' if metric.endswith('_total')
+                                                  else 'gauge')) < lines.index(line)
+    assert 'image_checker_entry_seconds{entry="duo-generic-\\"buildroot\\"-null",' \
+        'source="regex",status="ok"} 1.500000' in samples
+    assert 'image_checker_host_retries_total{host="upstream.invalid"} 1' in samples
+    assert [line for line in samples if 'phase=' in line][0].startswith(
+        'image_checker_phase_seconds{phase="load_all_configs"} ')
+    # only phases are summed, not the other spans
+    assert not any('create_issue' in line for line in samples)
+
+
+def test_trace_events(tmp_path):
+    path = tmp_path / 'trace.json'
+    recorded().write_trace(str(path))
+
+    with open(path, encoding='utf-8') as f:
+        trace = json.load(f)
+    events = trace['traceEvents']
+    assert [(e['name'], e['cat']) for e in events] == [
+        ('load_all_configs', 'phase'), ('create_issue', 'github')]
+    for e in events:
+        assert e['ph'] == 'X'
+        assert e['ts'] >= 0 and e['dur'] >= 0
+        assert isinstance(e['pid'], int) and isinstance(e['tid'], int)
+    assert events[1]['args'] == {'title': 't'}
+
+
+def test_comparing_the_results_is_timed(tree, tmp_path):
+    matrix = tree[3]
+    parse_args(['-r', str(tmp_path / 'report.md'), '--cache-dir', str(tmp_path / 'cache')])
+    old = gen_old(matrix)
+    p = main.Publisher(old)
+
+    for name in old:
+        p.on_result(name, RichResult(version='20240222'))
+    p.finish(False, set(), set(), set())
+
+    assert 'filter_newer' in metrics.recorder.phases
+    assert sum(e['name'] == 'filter_newer' for e in metrics.recorder.events) == len(old)
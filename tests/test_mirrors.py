@@ -0,0 +1,89 @@
+import time
+import asyncio
+import threading
+from urllib.parse import urlparse
+
+from nvchecker.httpclient import session
+
+from src.mirrors import MirrorHealth
+from src.run_nvchecker import CheckSession
+
+
+def mirrored(primary, mirror, **options) -> dict:
+    """
+    The `__config__` table mirroring the host of primary on mirror
+    """
+    return {'mirrors': {'hosts': {'127.0.0.1': [urlparse(mirror.url).netloc]}, **options},
+            'retry': {'tries': 1}}
+
+
+def get(url: str) -> bytes:
+    async def go():
+        res = await session.get(url)
+        # let the cancelled requests record their latency
+        await asyncio.sleep(0.05)
+        return res.body
+    return asyncio.run(go())
+
+
+def test_slow_primary_is_hedged_and_cancelled(fake_server, mirror_server):
+    released = threading.Event()
+
+    def slow(req):
+        released.wait(5)
+        return 200, {}, b'primary'
+
+    fake_server.handler = slow
+    mirror_server.handler = lambda req: (200, {}, b'mirror')
+    client = CheckSession.from_config(mirrored(fake_server, mirror_server, hedge_after=0.1))
+
+    start = time.monotonic()
+    try:
+        assert get(f'{fake_server.url}/listing') == b'mirror'
+    finally:
+        released.set()
+        client.close()
+    assert time.monotonic() - start < 1
+    assert len(fake_server.requests) == len(mirror_server.requests) == 1
+    # the loser was cancelled, it counts as slow but not as failed
+    primary = client.mirror_health.hosts[urlparse(fake_server.url).netloc]
+    assert primary['failures'] == 0
+    assert len(primary['latencies']) == 1 and primary['latencies'][0] >= 0.1
+
+
+def test_failing_primary_fails_over_to_the_mirror(fake_server, mirror_server):
+    fake_server.handler = lambda req: (404, {}, b'gone')
+    mirror_server.handler = lambda req: (200, {}, b'mirror')
+    client = CheckSession.from_config(mirrored(fake_server, mirror_server, hedge=False))
+
+    try:
+        assert get(f'{fake_server.url}/listing') == b'mirror'
+    finally:
+        client.close()
+    assert [r['path'] for r in fake_server.requests + mirror_server.requests] == \
+        ['/listing', '/listing']
+    assert client.mirror_health.hosts[urlparse(fake_server.url).netloc]['failures'] > 0
+
+
+def test_saved_health_puts_the_healthy_mirror_first(tmp_path, fake_server, mirror_server):
+    fake_server.handler = lambda req: (404, {}, b'gone')
+    mirror_server.handler = lambda req: (200, {}, b'mirror')
+    config = mirrored(fake_server, mirror_server, hedge=False)
+    url = f'{fake_server.url}/listing'
+
+    client = CheckSession.from_config(config, cache_dir=str(tmp_path))
+    try:
+        assert get(url) == b'mirror'
+    finally:
+        client.close()
+    health = MirrorHealth(str(tmp_path / 'mirrors.json'))
+    assert health.hosts == client.mirror_health.hosts
+
+    client = CheckSession.from_config(config, cache_dir=str(tmp_path))
+    try:
+        assert get(url) == b'mirror'
+    finally:
+        client.close()
+    # the next run asks the mirror first, the primary is not asked again
+    assert len(fake_server.requests) == 1
+    assert len(mirror_server.requests) == 2
@@ -0,0 +1,42 @@
+from src.utils import gen_old
+from src.plan import make_plan, format_plan
+from src.replay import FixtureArchive
+from src.run_nvchecker import run_nvchecker
+
+
+def test_plan_sees_the_cached_responses(tree, tmp_path, edit_configs):
+    conf_dir, matrix_dir, fixtures, matrix = tree
+    cache_dir = str(tmp_path / 'cache')
+    # regex responses are cached, regex_stream ones never
+    edit_configs('regex_stream', 'regex')
+    archive = FixtureArchive(fixtures)
+    for fixture in archive.fixtures.values():
+        fixture['headers'].append(['Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT'])
+    archive.save()
+    old = gen_old(matrix)
+
+    before = make_plan(conf_dir, matrix_dir, old, matrix, cache_dir)
+    run_nvchecker(conf_dir, matrix_dir, old, matrix=matrix, replay=fixtures,
+                  cache_dir=cache_dir)
+    after = make_plan(conf_dir, matrix_dir, old, matrix, cache_dir)
+
+    assert {r.cache for r in before.requests} == {'fetch'}
+    assert {r.cache for r in after.requests} == {'revalidate'}
+    assert len(after.requests) == len(matrix.vinfos)
+    assert f"| upstream.invalid | regex | {len(matrix.vinfos)} |" in format_plan(after)
+
+
+def test_plan_counts_fresh_responses_as_free(tree, tmp_path, edit_configs):
+    conf_dir, matrix_dir, fixtures, matrix = tree
+    cache_dir = str(tmp_path / 'cache')
+    edit_configs('regex_stream', 'regex')
+    with open(f"{conf_dir}/config.toml", 'a', encoding='utf-8') as f:
+        f.write('\n[__config__.http_cache]\nttl = 3600\n')
+    old = gen_old(matrix)
+    run_nvchecker(conf_dir, matrix_dir, old, matrix=matrix, replay=fixtures,
+                  cache_dir=cache_dir)
+
+    plan = make_plan(conf_dir, matrix_dir, old, matrix, cache_dir)
+
+    assert {r.cache for r in plan.requests} == {'fresh'}
+    assert plan.wall == 0.0
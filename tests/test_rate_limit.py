@@ -0,0 +1,111 @@
+import time
+import asyncio
+
+from nvchecker.httpclient import session
+from nvchecker.httpclient.base import BaseSession, Response
+
+from src.rate_limit import TokenBucket, RateLimitedSession, SourceSemaphore
+from src.run_nvchecker import CheckSession
+
+
+class Upstream(BaseSession):
+    """
+    Session answering after a delay, tracking the requests in flight
+    """
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+
+    async def request_impl(self, url, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        return Response({}, b'')
+
+
+def test_bucket_bursts_then_refills_at_its_rate():
+    async def go():
+        bucket = TokenBucket(rate=20, burst=3)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        burst = time.monotonic() - start
+        await bucket.acquire()
+        refill = time.monotonic() - start - burst
+        await asyncio.sleep(1)
+        # never more than the burst is saved up
+        assert bucket.tokens <= bucket.capacity == 3
+        return burst, refill
+
+    burst, refill = asyncio.run(go())
+    assert burst < 0.03
+    assert 0.03 < refill < 0.2
+
+
+def test_concurrency_is_capped_per_host():
+    upstream = Upstream()
+    limited = RateLimitedSession(upstream, {
+        'hosts': {'slow.invalid': {'concurrency': 2}},
+        'default_host': {'concurrency': 4},
+    })
+
+    async def go(host):
+        await asyncio.gather(*(limited.request_impl(f'http://{host}/{i}', method='GET')
+                               for i in range(8)))
+
+    asyncio.run(go('slow.invalid'))
+    assert upstream.peak == 2
+    upstream.peak = 0
+    asyncio.run(go('other.invalid'))
+    assert upstream.peak == 4
+
+
+def test_source_semaphore_holds_both_caps():
+    async def go():
+        task_sem = asyncio.Semaphore(3)
+        capped = SourceSemaphore(task_sem, 1)
+        running = peak = 0
+
+        async def check(sem):
+            nonlocal running, peak
+            async with sem:
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.02)
+                running -= 1
+
+        await asyncio.gather(*(check(capped) for _ in range(4)))
+        capped_peak = peak
+        peak = 0
+        # the capped source still takes its share of the global semaphore
+        await asyncio.gather(check(capped), *(check(task_sem) for _ in range(4)))
+        return capped_peak, peak, task_sem._value
+
+    capped_peak, peak, left = asyncio.run(go())
+    assert capped_peak == 1
+    assert peak == 3
+    assert left == 3
+
+
+def test_fresh_cache_hits_take_no_token(tmp_path, fake_server):
+    fake_server.handler = lambda req: (200, {'Content-Type': 'text/html'}, b'listing')
+    client = CheckSession.from_config({
+        'limits': {'default_host': {'rate': 1, 'burst': 1}},
+        'http_cache': {'ttl': 3600},
+    }, cache_dir=str(tmp_path / 'cache'))
+
+    async def go():
+        return [(await session.get(f'{fake_server.url}/listing')).body for _ in range(5)]
+
+    start = time.monotonic()
+    try:
+        assert asyncio.run(go()) == [b'listing'] * 5
+    finally:
+        client.close()
+    assert len(fake_server.requests) == 1
+    assert time.monotonic() - start < 0.5
@@ -0,0 +1,43 @@
+import re
+
+import pytest
+
+from src.sources.regex_stream import Matcher, OVERLAP
+
+from bench.synthetic import listing
+
+REGEX = re.compile(r'<a href="(\d{8})/">\1/</a>')
+
+
+def feed(matcher: Matcher, body: bytes, size: int) -> str | None:
+    for i in range(0, len(body), size):
+        if not matcher.feed(body[i:i + size]):
+            break
+    return matcher.close()
+
+
+@pytest.mark.parametrize('size', [1, 7, 64, OVERLAP, 1 << 20])
+def test_chunking_does_not_change_the_result(size):
+    body = listing(50)
+    assert feed(Matcher('e', REGEX, {}), body, size) == '20240222'
+
+
+def test_match_across_the_overlap_is_found():
+    # the only match straddles the part of the buffer kept between chunks
+    body = b'x' * (3 * OVERLAP - 10) + b'<a href="20240101/">20240101/</a>' + b'x' * 100
+    assert feed(Matcher('e', REGEX, {}), body, OVERLAP) == '20240101'
+
+
+def test_reset_forgets_the_aborted_attempt():
+    matcher = Matcher('e', REGEX, {})
+    matcher.feed(b'<a href="20991231/">20991231/</a>' + b'x' * 2 * OVERLAP)
+
+    matcher.reset()
+    assert feed(matcher, listing(3), 64) == '20240103'
+
+
+def test_options():
+    body = listing(50)
+    assert feed(Matcher('e', REGEX, {'stop_after_first': True}), body, 64) == '20240101'
+    assert feed(Matcher('e', REGEX, {'exclude_regex': r'202402\d\d'}), body, 64) == '20240128'
+    assert feed(Matcher('e', REGEX, {'max_body_size': 200}), body, 64) == '20240105'
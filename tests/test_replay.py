@@ -0,0 +1,72 @@
+from src.utils import gen_old
+from src.replay import FixtureArchive, fixture_key
+from src.run_nvchecker import run_nvchecker
+
+from bench.synthetic import listing
+
+
+def test_replay_checks_every_entry(tree, tmp_path):
+    conf_dir, matrix_dir, fixtures, matrix = tree
+    old = gen_old(matrix)
+
+    new, has_failures, _, _, timed_out = run_nvchecker(
+        conf_dir, matrix_dir, old, matrix=matrix, replay=fixtures,
+        cache_dir=str(tmp_path / 'cache'))
+
+    assert not has_failures and not timed_out
+    assert set(new) == {f"{v.vendor}-generic-{v.system}-null" for v in matrix.vinfos}
+    assert {r.version for r in new.values()} == {'20240222'}
+
+
+def test_recorded_responses_replay_offline(tree, tmp_path, fake_server, edit_configs):
+    conf_dir, matrix_dir, _, matrix = tree
+    body = listing(3)
+    fake_server.handler = lambda req: (200, {'Content-Type': 'text/html'}, body)
+    edit_configs('http://upstream.invalid', fake_server.url)
+    archive = str(tmp_path / 'recorded.json')
+    old = gen_old(matrix)
+
+    recorded, *_ = run_nvchecker(conf_dir, matrix_dir, old, matrix=matrix,
+                                 record=archive)
+    fake_server.stop()
+    replayed, has_failures, *_ = run_nvchecker(conf_dir, matrix_dir, old,
+                                               matrix=matrix, replay=archive)
+
+    assert len(fake_server.requests) == len(matrix.vinfos)
+    assert not has_failures
+    assert {k: r.version for k, r in replayed.items()} == \
+        {k: r.version for k, r in recorded.items()} != {}
+    url = f"{fake_server.url}/Board0/System0/"
+    assert FixtureArchive(archive).get(fixture_key('GET', url))['code'] == 200
+
+
+def test_recording_with_a_warm_cache_keeps_full_responses(tree, tmp_path, fake_server,
+                                                          edit_configs):
+    conf_dir, matrix_dir, _, matrix = tree
+    body = listing(3)
+
+    def answer(req):
+        if req['headers'].get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, b''
+        return 200, {'Content-Type': 'text/html', 'ETag': '"v1"'}, body
+
+    fake_server.handler = answer
+    edit_configs('regex_stream', 'regex')
+    edit_configs('http://upstream.invalid', fake_server.url)
+    cache_dir = str(tmp_path / 'cache')
+    archive = str(tmp_path / 'recorded.json')
+    old = gen_old(matrix)
+    run_nvchecker(conf_dir, matrix_dir, old, matrix=matrix, cache_dir=cache_dir)
+
+    run_nvchecker(conf_dir, matrix_dir, old, matrix=matrix, cache_dir=cache_dir,
+                  record=archive)
+    fake_server.stop()
+    replayed, has_failures, *_ = run_nvchecker(conf_dir, matrix_dir, old,
+                                               matrix=matrix, replay=archive)
+
+    fixture = FixtureArchive(archive).get(fixture_key('GET', f"{fake_server.url}/Board0/System0/"))
+    assert fixture['code'] == 200 and fixture['body']
+    assert not any('If-None-Match' in r['headers']
+                   for r in fake_server.requests[len(matrix.vinfos):])
+    assert not has_failures
+    assert {r.version for r in replayed.values()} == {'20240103'}
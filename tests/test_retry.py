@@ -0,0 +1,124 @@
+import json
+import time
+import asyncio
+
+import pytest
+from nvchecker import core
+from nvchecker.ctxvars import tries
+from nvchecker.httpclient import session
+from nvchecker.httpclient.base import HTTPError
+
+from src import http_session
+from src.http_session import SessionWrapper
+from src.replay import FixtureArchive, ReplayServer, ReplaySession, fixture_key
+from src.retry import (CircuitBreaker, BreakerSession, RetrySession, HostUnavailable,
+                       classify)
+from src.streaming import StreamingSession
+
+URL = 'http://upstream.invalid/listing/'
+
+
+class Counting(SessionWrapper):
+    """
+    Count the requests reaching the upstream
+    """
+
+    def __init__(self, inner):
+        super().__init__(inner)
+        self.count = 0
+
+    async def request_impl(self, url, **kwargs):
+        self.count += 1
+        return await super().request_impl(url, **kwargs)
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    server = ReplayServer(FixtureArchive(str(tmp_path / 'fixtures.json'))).start()
+    yield server
+    server.stop()
+
+
+def serve(server: ReplayServer, code: int, body: bytes = b''):
+    server.archive.add(fixture_key('GET', URL), URL, code, {}, body)
+
+
+def install(server: ReplayServer, breaker: CircuitBreaker, retry: dict | None = None):
+    core.setup_httpclient()
+    http_session.install(StreamingSession)
+    http_session.install(lambda inner: ReplaySession(inner, server))
+    counting = http_session.install(Counting)
+    http_session.install(lambda inner: BreakerSession(inner, breaker))
+    if retry is not None:
+        http_session.install(lambda inner: RetrySession(inner, retry))
+    return counting
+
+
+async def get(n: int = 1) -> list:
+    return await asyncio.gather(*(session.get(URL) for _ in range(n)),
+                                return_exceptions=True)
+
+
+def test_classify():
+    assert classify(HTTPError(429, 'Too Many Requests', None)) == '429'
+    assert classify(HTTPError(404, 'Not Found', None)) == '4xx'
+    assert classify(HTTPError(503, 'Service Unavailable', None)) == '5xx'
+    assert classify(asyncio.TimeoutError()) == 'timeout'
+    assert classify(HostUnavailable('upstream.invalid', time.time())) == 'open'
+    assert classify(ValueError()) == 'other'
+
+
+def test_retries_until_the_breaker_opens(upstream, tmp_path):
+    serve(upstream, 503)
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    counting = install(upstream, breaker, {'backoff': 0})
+    token = tries.set(3)
+    try:
+        [e] = asyncio.run(get())
+    finally:
+        tries.reset(token)
+
+    # the third try fails at once, the host being down
+    assert classify(e) == 'open'
+    assert counting.count == 2
+    assert breaker.state('upstream.invalid') == 'open'
+
+
+def test_half_open_host_is_probed_once(upstream):
+    serve(upstream, 503)
+    breaker = CircuitBreaker(threshold=1, cooldown=0.2)
+    counting = install(upstream, breaker)
+    asyncio.run(get())
+    assert breaker.state('upstream.invalid') == 'open'
+    assert classify(asyncio.run(get())[0]) == 'open'
+    assert counting.count == 1
+
+    time.sleep(0.3)
+    assert breaker.state('upstream.invalid') == 'half_open'
+    # the failed probe opens the breaker again, the waiting requests fail at once
+    results = asyncio.run(get(3))
+    assert counting.count == 2
+    assert [classify(e) for e in results] == ['5xx', 'open', 'open']
+
+    time.sleep(0.3)
+    serve(upstream, 200, b'ok')
+    results = asyncio.run(get(3))
+    assert [r.body for r in results] == [b'ok'] * 3
+    assert breaker.state('upstream.invalid') == 'closed'
+
+
+def test_only_open_breakers_are_kept(tmp_path):
+    path = str(tmp_path / 'breaker.json')
+    breaker = CircuitBreaker(path, threshold=2)
+    breaker.failure('flaky.invalid')
+    breaker.failure('down.invalid')
+    breaker.failure('down.invalid')
+    breaker.save()
+
+    with open(path, encoding='utf-8') as f:
+        assert list(json.load(f)) == ['down.invalid']
+    # the sporadic failure of a run does not count in the next one
+    breaker = CircuitBreaker(path, threshold=2)
+    breaker.failure('flaky.invalid')
+    assert breaker.state('flaky.invalid') == 'closed'
+    assert breaker.state('down.invalid') == 'open'
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from src import run_nvchecker as rn
+from src.utils import gen_old
+
+
+def test_interrupted_check_still_flushes_the_session(tree, tmp_path, monkeypatch):
+    conf_dir, matrix_dir, fixtures, matrix = tree
+    cache_dir = str(tmp_path / 'cache')
+    check_entries = rn.check_entries
+
+    async def interrupted(*args, **kwargs):
+        await check_entries(*args, **kwargs)
+        raise RuntimeError('interrupted')
+
+    monkeypatch.setattr(rn, 'check_entries', interrupted)
+    with pytest.raises(RuntimeError):
+        rn.run_nvchecker(conf_dir, matrix_dir, gen_old(matrix), matrix=matrix,
+                         replay=fixtures, cache_dir=cache_dir)
+
+    assert os.path.isfile(os.path.join(cache_dir, 'http', 'index.json'))
+    assert os.path.isfile(os.path.join(cache_dir, 'breaker.json'))
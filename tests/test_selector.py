@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+from src.utils import MatrixIndex
+from src.selector import Selector, compile_patterns
+from src.run_nvchecker import load_entries
+
+from bench.synthetic import SyntheticSystemInfo
+
+
+def system(board, name, variant=None, board_variants=()):
+    return SyntheticSystemInfo(
+        vendor=board.lower(), system=name, variant=variant,
+        board_variants=list(board_variants), version='1', product=board,
+        raw_data=SimpleNamespace(link=[board, name, 'README.md']))
+
+
+MATRIX = MatrixIndex(SimpleNamespace(rtos=[]), [
+    system('Duo', 'buildroot', board_variants=['duo256m']),
+    system('Duo', 'fedora', variant='minimal'),
+    system('LicheePi4A', 'revyos'),
+])
+
+
+def test_compile_patterns():
+    assert compile_patterns(None) is None
+    assert compile_patterns(' , ') is None
+    patterns = compile_patterns('duo*, re:lichee.+')
+    assert [bool(p.fullmatch('duo256m')) for p in patterns] == [True, False]
+    assert [bool(p.fullmatch('licheepi4a')) for p in patterns] == [False, True]
+
+
+def test_every_given_field_must_match():
+    selector = Selector(vendor='duo', variant='null')
+    assert [v.system for v in MATRIX.vinfos if selector.matches(v)] == ['buildroot']
+    assert not Selector().active
+    assert Selector(system='re:rev.*').names(MATRIX) == {'licheepi4a-generic-revyos-null'}
+
+
+def test_path_selects_its_subtree():
+    selector = Selector(path='Duo')
+    assert selector.matches_path('Duo/fedora')
+    assert not selector.matches_path('LicheePi4A/revyos')
+    assert selector.may_contain('Duo', MATRIX)
+    assert not selector.may_contain('LicheePi4A', MATRIX)
+
+
+def test_board_variant_restricts_the_names():
+    assert Selector(board_variant='duo256m').names(MATRIX) == {'duo-duo256m-buildroot-null'}
+    assert Selector(vendor='duo', system='buildroot').names(MATRIX) == {
+        'duo-duo256m-buildroot-null', 'duo-generic-buildroot-null'}
+
+
+def test_only_selected_configs_are_loaded(tree):
+    conf_dir, matrix_dir, _, matrix = tree
+
+    entries, *_ = load_entries(conf_dir, matrix_dir, matrix,
+                               selector=Selector(path='Board1,Board2/System0'))
+
+    assert sorted(entries) == ['board1-generic-system0-null', 'board1-generic-system1-null',
+                               'board1-generic-system2-null', 'board2-generic-system0-null']
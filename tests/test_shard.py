@@ -0,0 +1,72 @@
+import pytest
+from nvchecker.core import RichResult
+
+from src.shard import Shard, parse_shard, write_partial, load_partials, merge_partials
+
+
+def test_parse_shard():
+    assert parse_shard('1/4') == (1, 4)
+    for spec in ('4/4', '1', 'a/b', '0/0'):
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_longest_groups_go_to_the_least_loaded_shard():
+    groups = {'slow': ['slow', 'slow-twin'], 'a': ['a'], 'b': ['b'], 'c': ['c']}
+    history = {'slow-twin': 10.0, 'a': 4.0, 'b': 3.0, 'c': 2.0}
+
+    assert Shard(0, 2).assign(groups, history) == [0, 1, 1, 1]
+
+
+def test_shards_split_every_entry_once():
+    entries = {f"e{i}": {'source': 'regex', 'url': str(i % 7)} for i in range(30)}
+    groups: dict[str, list[str]] = {}
+    for name, entry in entries.items():
+        groups.setdefault(f"e{entry['url']}", []).append(name)
+
+    seen = []
+    for i in range(3):
+        shard = Shard(i, 3)
+        selected = shard.select(entries, groups, {})
+        assert shard.total == list(entries)
+        seen += list(selected)
+        # a coalesced group is never split
+        for names in groups.values():
+            assert set(names) <= set(selected) or not set(names) & set(selected)
+    assert sorted(seen) == sorted(entries)
+
+
+def partial(tmp_path, index, count, total, results, timed_out=()):
+    shard = Shard(index, count)
+    shard.total = total
+    shard.entries = list(results) + list(timed_out)
+    path = str(tmp_path / f"partial-{index}" / 'partial.json')
+    write_partial(path, shard, {k: RichResult(version=v) for k, v in results.items()},
+                  bool(timed_out), {'configs/Board9'}, set(), set(timed_out))
+
+
+def test_merge_combines_the_shards(tmp_path):
+    total = ['a', 'b', 'c']
+    partial(tmp_path, 0, 2, total, {'a': '1.0'})
+    partial(tmp_path, 1, 2, total, {'b': '2.0'}, timed_out=['c'])
+
+    new, has_failures, skipped, _, timed_out = merge_partials(load_partials(str(tmp_path)))
+
+    assert {k: r.version for k, r in new.items()} == {'a': '1.0', 'b': '2.0'}
+    assert has_failures
+    assert skipped == {'configs/Board9'}
+    assert timed_out == {'c'}
+
+
+def test_missing_shard_fails_the_merge(tmp_path):
+    partial(tmp_path, 0, 2, ['a', 'b'], {'a': '1.0'})
+
+    new, has_failures, _, _, timed_out = merge_partials(load_partials(str(tmp_path)))
+
+    assert has_failures
+    assert set(new) == {'a'} and timed_out == {'b'}
+
+
+def test_merge_without_partials_fails(tmp_path):
+    with pytest.raises(ValueError):
+        merge_partials(load_partials(str(tmp_path / 'partials')))
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from nvchecker import core
+from nvchecker.util import AsyncCache
+import nvchecker_source.regex as nv_regex
+import nvchecker_source.htmlparser as nv_htmlparser
+
+from src.sources import regex, htmlparser
+from src.run_nvchecker import CheckSession
+
+# every body goes to the pool
+POOLS = [{'kind': 'thread', 'min_size': 0}, {'kind': 'process', 'min_size': 0, 'size': 1}]
+
+BODIES = {
+    '/listing': '<a href="1.10/">1.10/</a> <a href="1.9/">1.9/</a> <a href="2.0-rc1/">2.0-rc1/</a>',
+    '/utf8': '<p>версия 3.1</p>',
+    '/page': '<html><body><ul><li>1.2</li><li><b>1.10</b></li></ul>'
+             '<a class="dl" href="/v/2.1.tar.gz">get</a></body></html>',
+    '/feed': '<?xml version="1.0"?><feed><entry><v>4.<i>2</i></v></entry></feed>',
+}
+
+REGEX_CASES = [
+    {'url': '/listing', 'regex': r'href="([\d.]+)/"'},
+    {'url': '/listing', 'regex': r'href="([^"]+)/"', 'exclude_regex': r'.*-rc\d+'},
+    {'url': '/listing', 'regex': r'href="([\d.]+)/"', 'include_regex': r'1\..*',
+     'ignored': '1.10'},
+    {'url': '/listing', 'regex': r'href="([\d.]+)/"', 'include_regex': r'3\..*'},
+    {'url': '/listing', 'regex': r'release-(\d+)'},
+    {'url': '/listing', 'regex': r'release-(\d+)', 'missing_ok': True},
+    {'url': '/listing', 'regex': r'(\d+)\.(\d+)'},
+    {'url': '/listing', 'regex': r'('},
+    {'url': '/utf8', 'regex': r'версия ([\d.]+)', 'encoding': 'utf-8'},
+    {'url': '/utf8', 'regex': r'(\d\.\d)'},
+]
+
+HTMLPARSER_CASES = [
+    {'url': '/page', 'xpath': '//li'},
+    {'url': '/page', 'xpath': '//li/text()'},
+    {'url': '/page', 'xpath': '//a[@class="dl"]/@href'},
+    {'url': '/page', 'xpath': '//li', 'exclude_regex': r'1\.10'},
+    {'url': '/page', 'xpath': '//dd'},
+    {'url': '/page', 'xpath': '//dd', 'missing_ok': True},
+    {'url': '/page', 'xpath': ''},
+    {'url': '/page', 'xpath': '\x00'},
+    {'url': '/page', 'xpath': '\x00', 'missing_ok': True},
+    {'url': '/feed', 'xpath': '//v', 'is_xml': True},
+    {'url': '/feed', 'xpath': '//v/text()', 'is_xml': True},
+]
+
+
+def outcomes(source, cases: list[dict], url: str) -> list:
+    """
+    The versions nvchecker's core would get from a source for the cases
+    """
+    async def one(conf):
+        try:
+            v = await source.get_version('entry', conf, cache=AsyncCache(), keymanager=None)
+        except Exception:
+            return 'failed'
+        return core.apply_list_options(v, conf, 'entry') if isinstance(v, list) else v
+
+    async def go():
+        return [await one({**conf, 'url': url + conf['url']}) for conf in cases]
+    return asyncio.run(go())
+
+
+@pytest.fixture
+def upstream(fake_server):
+    fake_server.handler = lambda req: (200, {'Content-Type': 'text/html; charset=utf-8'},
+                                       BODIES[req['path']].encode('utf-8'))
+    return fake_server
+
+
+@pytest.mark.parametrize('pool', POOLS, ids=lambda p: p['kind'])
+def test_regex_matches_nvchecker(upstream, pool):
+    client = CheckSession.from_config({'workers': pool})
+    try:
+        ours = outcomes(regex, REGEX_CASES, upstream.url)
+        theirs = outcomes(nv_regex, REGEX_CASES, upstream.url)
+    finally:
+        client.close()
+    assert ours == theirs
+    assert ours[:3] == ['1.10', '1.10', '1.9']
+
+
+@pytest.mark.parametrize('pool', POOLS, ids=lambda p: p['kind'])
+def test_htmlparser_matches_nvchecker(upstream, pool):
+    client = CheckSession.from_config({'workers': pool})
+    try:
+        ours = outcomes(htmlparser, HTMLPARSER_CASES, upstream.url)
+        theirs = outcomes(nv_htmlparser, HTMLPARSER_CASES, upstream.url)
+    finally:
+        client.close()
+    assert ours == theirs
+    assert ours[:3] == ['1.10', '1.2', '/v/2.1.tar.gz']
+
+
+def test_regex_shares_fetches_like_nvchecker(upstream):
+    confs = [{'url': f'{upstream.url}/utf8', 'regex': r'(\d\.\d)', 'encoding': e}
+             for e in ('latin1', 'utf-8', 'utf-8')]
+    client = CheckSession.from_config()
+
+    async def fetch(source):
+        cache = AsyncCache()
+        before = len(upstream.requests)
+        for conf in confs:
+            await source.get_version('entry', conf, cache=cache, keymanager=None)
+        return len(upstream.requests) - before
+
+    try:
+        assert asyncio.run(fetch(regex)) == asyncio.run(fetch(nv_regex)) == 2
+    finally:
+        client.close()
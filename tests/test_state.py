@@ -0,0 +1,89 @@
+from nvchecker.core import RichResult
+
+from src.state import CheckState, DEFAULT_TTL
+from src.utils import gen_old
+from src.run_nvchecker import run_nvchecker
+
+ENTRY = {'source': 'regex', 'url': 'http://upstream.invalid/', 'regex': 'x'}
+
+
+def checked(state: CheckState, name: str, ago: float):
+    state.entries[name]['checked'] -= ago
+
+
+def test_fresh_until_the_ttl_expires(tmp_path):
+    state = CheckState(str(tmp_path / 'state.json'), {'ttl': 100})
+    assert not state.is_fresh('a', ENTRY, '1')
+    state.update('a', ENTRY, '1', RichResult(version='2.0', url='http://upstream.invalid/2.0'))
+
+    assert state.is_fresh('a', ENTRY, '1')
+    checked(state, 'a', 101)
+    assert not state.is_fresh('a', ENTRY, '1')
+
+
+def test_config_or_matrix_change_is_never_fresh(tmp_path):
+    state = CheckState(str(tmp_path / 'state.json'))
+    state.update('a', ENTRY, '1', RichResult(version='2.0'))
+
+    assert not state.is_fresh('a', {**ENTRY, 'regex': 'y'}, '1')
+    assert not state.is_fresh('a', ENTRY, '2')
+    assert state.due_at('a', ENTRY, '2') == 0.0
+
+
+def test_ttl_of_the_entry_then_of_its_source(tmp_path):
+    state = CheckState(str(tmp_path / 'state.json'), {'source_ttl': {'regex': 60}})
+
+    assert state.ttl({'source': 'git'}) == DEFAULT_TTL
+    assert state.ttl(ENTRY) == 60
+    assert state.ttl({**ENTRY, 'check_ttl': 5}) == 5
+    state.update('a', ENTRY, None, RichResult(version='2.0'))
+    checked(state, 'a', 61)
+    assert not state.is_fresh('a', ENTRY, None)
+
+
+def test_jitter_moves_rechecks_earlier_by_a_stable_share(tmp_path):
+    state = CheckState(str(tmp_path / 'state.json'), {'ttl': 1000})
+    for name in ('a', 'b'):
+        state.update(name, ENTRY, None, RichResult(version='2.0'))
+
+    def delay(name, jitter):
+        return state.due_at(name, ENTRY, None, jitter) - state.entries[name]['checked']
+
+    assert state.due_at('c', ENTRY, None) == 0.0
+    assert delay('a', 0.0) == delay('b', 0.0) == 1000
+    assert 500 <= delay('a', 0.5) < 1000 and 500 <= delay('b', 0.5) < 1000
+    assert delay('a', 0.5) != delay('b', 0.5)
+    assert delay('a', 0.5) == delay('a', 0.5)
+
+
+def test_saved_state_reloads(tmp_path):
+    path = str(tmp_path / 'state.json')
+    state = CheckState(path)
+    state.update('a', ENTRY, '1', RichResult(version='2.0', gitref='refs/tags/2.0'))
+    state.save()
+
+    state = CheckState(path)
+    assert state.is_fresh('a', ENTRY, '1')
+    assert state.result('a').gitref == 'refs/tags/2.0'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{broken')
+    assert CheckState(path).entries == {}
+
+
+def test_incremental_run_reuses_the_last_results(tree, tmp_path):
+    conf_dir, matrix_dir, fixtures, matrix = tree
+    cache_dir = str(tmp_path / 'cache')
+    empty = tmp_path / 'empty.json'
+    empty.write_text('{}', encoding='utf-8')
+    old = gen_old(matrix)
+
+    first, *_ = run_nvchecker(conf_dir, matrix_dir, old, matrix=matrix,
+                              replay=fixtures, cache_dir=cache_dir, incremental=True)
+    # every check would fail against an archive without fixtures
+    second, has_failures, *_ = run_nvchecker(
+        conf_dir, matrix_dir, old, matrix=matrix, replay=str(empty),
+        cache_dir=cache_dir, incremental=True)
+
+    assert not has_failures
+    assert {k: r.version for k, r in second.items()} == \
+        {k: r.version for k, r in first.items()} != {}
@@ -0,0 +1,36 @@
+from nvchecker.core import RichResult
+
+from src.version_cmp import (
+    version_key, version_cmp, is_newer, max_version, sort_versions, filter_newer,
+)
+
+
+def test_version_key_normalizes():
+    assert version_key('V1.0 Beta') == version_key('1.0-beta')
+    assert version_key(RichResult(version='v2.0')) == version_key('2.0')
+
+
+def test_service_pack_is_newer_than_its_base():
+    assert is_newer('2.0-sp1', '2.0')
+    assert is_newer('2.0-sp2', '2.0-sp1')
+    assert version_cmp('v2.0', '2.0') == 0
+
+
+def test_max_and_sort_agree_with_version_cmp():
+    versions = ['20240101', 'v20240301', '20240201-sp1', '20240201']
+    assert max_version(versions) == 'v20240301'
+    assert sort_versions(versions) == ['20240101', '20240201', '20240201-sp1', 'v20240301']
+    assert max_version([]) is None
+
+
+def test_filter_newer():
+    old = {'a': RichResult(version='1.0'), 'b': RichResult(version='2.0'),
+           'c': RichResult(version='1.0')}
+    new = {'a': RichResult(version='1.1'), 'b': RichResult(version='2.0'),
+           'd': RichResult(version='0.1')}
+
+    res = filter_newer(old, new)
+    assert {k: (v['old'] and v['old'].version, v['new'] and v['new'].version)
+            for k, v in res.items()} == {
+        'a': ('1.0', '1.1'), 'c': ('1.0', None), 'd': (None, '0.1')}
+